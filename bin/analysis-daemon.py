@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Analyzes test runs enqueued in a spool directory by update-dashboard.py (or
+# orchestrate-dashboard.py) with --spool-dir, publishing the results into a
+# dashboard. This way the machines driving the devices never have to wait on
+# analysis.
+
+import eideticker
+import optparse
+import sys
+import time
+import traceback
+
+def main(args=sys.argv[1:]):
+    usage = "usage: %prog [options] <spool dir>"
+    parser = optparse.OptionParser(usage)
+    parser.add_option("--output-dir", action="store",
+                      type="string", dest="outputdir",
+                      default=eideticker.DASHBOARD_DIR,
+                      help="output results to directory instead of "
+                      "src/dashboard")
+    parser.add_option("--capture-dir", action="store",
+                      type="string", dest="capturedir",
+                      default=eideticker.CAPTURE_DIR,
+                      help="directory to move analyzed captures to "
+                      "(default: %default)")
+    parser.add_option("--num-workers", action="store", type="int",
+                      dest="num_workers", default=1,
+                      help="number of runs to analyze at once (default: "
+                      "%default)")
+    parser.add_option("--poll-interval", action="store", type="float",
+                      dest="poll_interval", default=5.0,
+                      help="seconds to wait between checks for new runs "
+                      "(default: %default)")
+    parser.add_option("--once", action="store_true", dest="once",
+                      help="exit once the spool is empty, instead of "
+                      "waiting for more runs")
+    parser.add_option("--requeue-claimed", action="store_true",
+                      dest="requeue_claimed",
+                      help="first put back any runs which were being "
+                      "analyzed when a previous daemon was stopped (don't "
+                      "use if other daemons share the spool)")
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.print_usage()
+        sys.exit(1)
+
+    spool = eideticker.Spool(args[0])
+    if options.requeue_claimed:
+        spool.requeue_claimed()
+
+    eideticker.copy_dashboard_files(options.outputdir)
+
+    def process(jobid, job):
+        try:
+            return (jobid, job, eideticker.process_spooled_dashboard_run(
+                spool, options.outputdir, jobid, job), None)
+        except Exception:
+            return (jobid, job, None, traceback.format_exc())
+
+    def write((jobid, job, result, error)):
+        if not error:
+            try:
+                eideticker.write_spooled_dashboard_run(
+                    spool, options.outputdir, options.capturedir, jobid, job,
+                    result)
+                print "Published %s (%s on %s)" % (jobid, job['testKey'],
+                                                   job['deviceId'])
+                return
+            except Exception:
+                error = traceback.format_exc()
+        print "ERROR: Failed to analyze %s:\n%s" % (jobid, error)
+        spool.fail(jobid, error)
+
+    pipeline = eideticker.RunPipeline(num_workers=options.num_workers)
+    try:
+        while True:
+            # only claim as many runs as we can work on at once, so other
+            # daemons sharing the spool get their share
+            jobs = spool.claim(max_jobs=options.num_workers)
+            for (jobid, job) in jobs:
+                pipeline.submit(process, write, jobid, job)
+            pipeline.wait()
+            if not jobs:
+                if options.once:
+                    break
+                time.sleep(options.poll_interval)
+    finally:
+        pipeline.finish()
+
+main()
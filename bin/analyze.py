@@ -4,17 +4,180 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+# (Re-)calculates metrics for a set of captures, e.g. after a change to the
+# analysis. Progress is recorded in a journal, so an interrupted run can be
+# resumed by running the same command again.
+
+import eideticker
+import json
 import optparse
+import os
+import sys
+import traceback
 import videocapture
 
-usage = "usage: %prog [options] <capture file>"
-parser = optparse.OptionParser(usage)
-options, args = parser.parse_args()
-if len(args) != 1:
-    parser.error("incorrect number of arguments")
+def get_capture_files(paths):
+    capture_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            capture_files.extend(sorted(
+                map(lambda fname: os.path.join(path, fname),
+                    filter(lambda fname: fname.endswith('.zip'),
+                           os.listdir(path)))))
+        else:
+            capture_files.append(path)
+
+    return map(os.path.abspath, capture_files)
+
+def read_journal(journal_file):
+    '''Returns the last journal entry for each capture (written by this
+       version of the analyzer)'''
+    entries = {}
+    if not os.path.exists(journal_file):
+        return entries
+
+    for line in open(journal_file).readlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # last line may be incomplete if we were killed while writing it
+            continue
+        if entry['version'] == eideticker.ANALYZER_VERSION:
+            entries[entry['capture']] = entry
+
+    return entries
+
+def is_done(entry, metrics, retry_failed):
+    if not entry:
+        return False
+    if entry.get('error'):
+        return not retry_failed
+    return not metrics or set(metrics).issubset(entry['metrics'].keys())
+
+def analyze((capture_file, metrics, force)):
+    entry = { 'capture': capture_file,
+              'version': eideticker.ANALYZER_VERSION }
+    try:
+        capture = videocapture.Capture(capture_file)
+        capture_metrics = metrics or \
+            eideticker.get_default_capture_metrics(capture)
+        if not force and set(capture_metrics).issubset(
+                eideticker.get_cached_capture_metrics(capture).keys()):
+            entry['status'] = 'cached'
+        else:
+            entry['status'] = 'analyzed'
+        entry['metrics'] = eideticker.analyze_capture(capture,
+                                                      capture_metrics,
+                                                      force=force)
+    except Exception:
+        entry['status'] = 'error'
+        entry['error'] = traceback.format_exc()
+
+    return entry
+
+def format_metric(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '%.2f' % value
+    return str(value)
+
+def print_summary(entries, metrics):
+    if not metrics:
+        metrics = sorted(set(reduce(
+            lambda l, e: l + e.get('metrics', {}).keys(), entries, [])))
+    rows = [ ['capture', 'status'] + metrics ]
+    for entry in entries:
+        rows.append([ os.path.basename(entry['capture']), entry['status'] ] +
+                    map(lambda m: format_metric(
+                    entry.get('metrics', {}).get(m)), metrics))
+
+    widths = map(lambda i: max(map(lambda row: len(row[i]), rows)),
+                 range(len(rows[0])))
+    for row in rows:
+        print "  ".join(map(lambda (cell, width): cell.ljust(width),
+                            zip(row, widths))).rstrip()
+
+    statuses = map(lambda e: e['status'], entries)
+    print
+    print "%s captures: %s analyzed, %s cached, %s already done, %s failed" % (
+        len(entries), statuses.count('analyzed'), statuses.count('cached'),
+        statuses.count('done'), statuses.count('error'))
+
+def main(args=sys.argv[1:]):
+    usage = "usage: %prog [options] [capture file or directory] ..."
+    parser = optparse.OptionParser(usage)
+    parser.add_option("--metric", action="append", dest="metrics",
+                      choices=eideticker.CAPTURE_METRICS,
+                      help="metric to calculate (may be specified more than "
+                      "once; default: all those which apply to the capture "
+                      "device). One of: %s" %
+                      ", ".join(eideticker.CAPTURE_METRICS))
+    parser.add_option("--num-workers", action="store", type="int",
+                      dest="num_workers", default=2,
+                      help="number of captures to analyze at once (each of "
+                      "which already uses several processes; default: "
+                      "%default)")
+    parser.add_option("--journal", action="store", dest="journal",
+                      default="analyze-journal.json",
+                      help="file to record progress in (default: %default)")
+    parser.add_option("--retry-failed", action="store_true",
+                      dest="retry_failed",
+                      help="retry captures which failed to be analyzed "
+                      "previously")
+    parser.add_option("--force", action="store_true", dest="force",
+                      help="recalculate everything, ignoring cached results "
+                      "and the journal")
+    parser.add_option("--memory-budget", action="store", type="int",
+                      dest="memory_budget",
+                      help="memory (in megabytes) analysis may use, shared "
+                      "between the captures analyzed at once (default: "
+                      "half of physical memory)")
+    options, args = parser.parse_args()
+
+    memory_budget = options.memory_budget or \
+        videocapture.get_memory_budget() / (1024 * 1024)
+    videocapture.set_memory_budget(memory_budget / float(options.num_workers))
+
+    capture_files = get_capture_files(args or [eideticker.CAPTURE_DIR])
+
+    if options.force and os.path.exists(options.journal):
+        os.remove(options.journal)
+    journal_entries = read_journal(options.journal)
+
+    entries = []
+    pending = []
+    for capture_file in capture_files:
+        entry = journal_entries.get(capture_file)
+        if is_done(entry, options.metrics, options.retry_failed):
+            entries.append(dict(entry, status=entry.get('error') and 'error'
+                                or 'done'))
+        else:
+            pending.append((capture_file, options.metrics, options.force))
+
+    print "Analyzing %s of %s captures" % (len(pending), len(capture_files))
+
+    pool = eideticker.create_worker_pool(options.num_workers)
+    with open(options.journal, 'a') as journal:
+        for entry in pool.imap_unordered(analyze, pending):
+            journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+            if entry.get('error'):
+                print "ERROR: Failed to analyze %s:\n%s" % (entry['capture'],
+                                                           entry['error'])
+            else:
+                print "%s: %s" % (os.path.basename(entry['capture']),
+                                  entry['status'])
+            entries.append(entry)
+    pool.close()
+    pool.join()
+
+    entries.sort(key=lambda e: e['capture'])
+    print
+    print_summary(entries, options.metrics)
 
-capture = videocapture.Capture(args[0])
-(uniques, processed) = videocapture.get_unique_frames(
-    capture, thresehold=25000)
+    if filter(lambda e: e['status'] == 'error', entries):
+        sys.exit(1)
 
-print "Unique frames: %s/%s" % (uniques, processed)
+main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Times (and measures the peak memory usage of) capture conversion and each
+# of the analyzers on synthetic captures, so that changes to them can be
+# evaluated without any capture hardware. Each stage is run in a fresh
+# process, with nothing cached.
+
+from distutils.spawn import find_executable
+import json
+import multiprocessing
+import optparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import videocapture
+
+
+def _load_frames(capture):
+    for i in range(capture.num_frames + 1):
+        capture.get_frame(i)
+
+def _cache_sobel_entropies(capture):
+    videocapture.get_frame_entropies(capture, sobelized=True)
+
+# (name, function to benchmark, function to run beforehand (not timed))
+ANALYSIS_STAGES = [
+    ('loadframes', _load_frames, None),
+    ('framediffsums', videocapture.get_framediff_sums, None),
+    ('entropies', videocapture.get_frame_entropies, None),
+    ('sobelentropies', _cache_sobel_entropies, None),
+    ('checkerboard', videocapture.get_checkerboarding_percents, None),
+    ('stableframe', lambda capture: videocapture.get_stable_frame(
+        capture, method='entropy', sobelized=True), _cache_sobel_entropies)
+]
+
+
+def _get_peak_rss():
+    # ru_maxrss is in kilobytes on linux; the analyzers do most of their
+    # work in pools of child processes, so count the biggest of those too
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.0
+
+def _run_stage(conn, func, args, setup):
+    try:
+        if setup:
+            setup()
+        starttime = time.time()
+        result = func(*args)
+        conn.send((time.time() - starttime, _get_peak_rss(), result, None))
+    except Exception, e:
+        conn.send((None, None, None, str(e)))
+
+def run_stage(func, args, setup=None):
+    '''Runs func(*args) in a fresh process (after setup(), if specified),
+       returning how long it took, the peak memory usage (in megabytes) of
+       the process and whatever func returned'''
+    (parent_conn, child_conn) = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_run_stage,
+                                   args=(child_conn, func, args, setup))
+    proc.start()
+    (elapsed, peak_rss, result, error) = parent_conn.recv()
+    proc.join()
+    if error:
+        raise Exception(error)
+
+    return (elapsed, peak_rss, result)
+
+def _clear_cache(capture_file):
+    cache_file = capture_file + '.cache'
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+def _analyze(stage_func, capture_file):
+    stage_func(videocapture.Capture(capture_file))
+
+def _get_analysis_setup(setup_func, capture_file):
+    if not setup_func:
+        return None
+    return lambda: setup_func(videocapture.Capture(capture_file))
+
+def _convert(raw_file, capture_file, mode):
+    timings = videocapture.TimingLog()
+    controller = videocapture.CaptureController('decklink', timings=timings)
+    controller.import_raw_capture(raw_file, capture_file, mode)
+    controller.convert_capture(None, None,
+                               create_webm=bool(find_executable('ffmpeg')))
+    return timings.get_durations()
+
+def main(args=sys.argv[1:]):
+    usage = "usage: %prog [options] [stage] ..."
+    parser = optparse.OptionParser(usage)
+    parser.add_option("--mode", action="store", dest="mode", default="720p",
+                      choices=videocapture.valid_decklink_modes,
+                      help="resolution of synthetic captures (default: "
+                      "%default)")
+    parser.add_option("--segments", action="store", dest="segments",
+                      help="segments making up the synthetic captures (see "
+                      "generate-capture.py)")
+    parser.add_option("--repeat", action="store", type="int", dest="repeat",
+                      default=3, help="number of times to run each stage, "
+                      "reporting the fastest (default: %default)")
+    parser.add_option("--no-convert", action="store_false", dest="convert",
+                      default=True, help="don't benchmark capture conversion")
+    parser.add_option("--output", action="store", dest="output",
+                      help="also write results to this file (as json)")
+    parser.add_option("--memory-budget", action="store", type="int",
+                      dest="memory_budget",
+                      help="memory (in megabytes) analysis may use "
+                      "(default: half of physical memory)")
+    options, args = parser.parse_args()
+
+    if options.memory_budget:
+        # inherited by the processes the stages are run in
+        os.environ['VIDEOCAPTURE_MEMORY_BUDGET'] = str(options.memory_budget)
+
+    stage_names = ['convert'] + map(lambda s: s[0], ANALYSIS_STAGES)
+    for arg in args:
+        if arg not in stage_names:
+            parser.error("Unknown stage '%s' (must be one of: %s)" % (
+                arg, ", ".join(stage_names)))
+    stages = filter(lambda s: not args or s[0] in args, ANALYSIS_STAGES)
+
+    segments = videocapture.DEFAULT_SEGMENTS
+    if options.segments:
+        segments = videocapture.parse_segments(options.segments)
+
+    results = { 'mode': options.mode,
+                'memoryBudget': videocapture.get_memory_budget() / \
+                    (1024 * 1024),
+                'segments': segments,
+                'numFrames': sum(map(lambda s: s[1], segments)),
+                'stages': {} }
+
+    def record(name, timings):
+        best = min(timings, key=lambda t: t[0])
+        results['stages'][name] = { 'time': best[0],
+                                    'peakRSS': max(map(lambda t: t[1],
+                                                       timings)) }
+        print "%-16s %8.2fs %8.1fMB" % (name, best[0],
+                                        results['stages'][name]['peakRSS'])
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        capture_file = os.path.join(tempdir, 'capture.zip')
+        print "Generating synthetic captures (%s, %s frames)..." % (
+            options.mode, results['numFrames'])
+        videocapture.write_synthetic_capture(
+            capture_file,
+            dimensions=videocapture.controller.supported_formats[
+                options.mode]['dimensions'], segments=segments)
+
+        if options.convert and (not args or 'convert' in args):
+            if find_executable('ffmpeg'):
+                raw_file = os.path.join(tempdir, 'capture.raw')
+                videocapture.write_synthetic_raw_capture(
+                    raw_file, mode=options.mode, segments=segments)
+                converted_file = os.path.join(tempdir, 'converted.zip')
+                timings = []
+                for i in range(options.repeat):
+                    if os.path.exists(converted_file):
+                        os.remove(converted_file)
+                    timings.append(run_stage(_convert, (raw_file,
+                                                        converted_file,
+                                                        options.mode)))
+                record('convert', timings)
+                # break the fastest conversion down by stage
+                best = min(timings, key=lambda t: t[0])
+                for (name, duration) in sorted(best[2].items()):
+                    print "  %-14s %8.2fs" % (name, duration)
+                    results['stages']['convert'].setdefault(
+                        'stages', {})[name] = duration
+            else:
+                print "ffmpeg not found, not benchmarking conversion"
+
+        for (name, func, setup) in stages:
+            timings = []
+            for i in range(options.repeat):
+                _clear_cache(capture_file)
+                timings.append(run_stage(
+                    _analyze, (func, capture_file),
+                    setup=_get_analysis_setup(setup, capture_file)))
+            record(name, timings)
+    finally:
+        shutil.rmtree(tempdir)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(json.dumps(results))
+
+main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Times how long it takes to import eideticker and videocapture (and use
+# the parts of them which simple scripts and the webapp need), each in a
+# fresh interpreter, and checks that doing so doesn't drag in any of the
+# expensive modules that only capturing, analysis or device control need.
+# Exits with an error if any check fails, so that it can be run along with
+# other checks before landing changes.
+
+import json
+import optparse
+import subprocess
+import sys
+
+ANALYSIS_MODULES = ['scipy', 'scipy.stats', 'scipy.ndimage']
+DEVICE_MODULES = ['marionette', 'gaiatest', 'b2gpopulate', 'mozdevice']
+
+# (name, code to time, modules which it must not import)
+CHECKS = [
+    ('videocapture', 'import videocapture',
+     ANALYSIS_MODULES + ['PIL', 'numpy', 'multiprocessing']),
+    ('eideticker', 'import eideticker',
+     ANALYSIS_MODULES + DEVICE_MODULES + ['PIL', 'numpy',
+                                          'videocapture.controller']),
+    ('timing', 'from videocapture import TimingLog',
+     ANALYSIS_MODULES + ['PIL', 'numpy']),
+    ('spool', 'import eideticker; eideticker.Spool',
+     ANALYSIS_MODULES + DEVICE_MODULES),
+    ('capture', 'import videocapture; videocapture.Capture',
+     ANALYSIS_MODULES),
+    ('testmanifest', 'import eideticker; eideticker.get_test_manifest',
+     ANALYSIS_MODULES + DEVICE_MODULES)
+]
+
+_TIMER = '''
+import json, sys, time
+starttime = time.time()
+%s
+elapsed = time.time() - starttime
+print json.dumps({ 'time': elapsed, 'modules': sys.modules.keys() })
+'''
+
+
+def time_import(code):
+    '''Runs code in a fresh interpreter, returning how long it took and the
+       modules imported by the end of it'''
+    output = subprocess.check_output([sys.executable, '-c', _TIMER % code])
+    result = json.loads(output.splitlines()[-1])
+    return (result['time'], set(result['modules']))
+
+
+def main(args=sys.argv[1:]):
+    usage = "usage: %prog [options] [check] ..."
+    parser = optparse.OptionParser(usage)
+    parser.add_option("--repeat", action="store", type="int", dest="repeat",
+                      default=5, help="number of times to run each check, "
+                      "reporting the fastest (default: %default)")
+    parser.add_option("--max-time", action="store", type="float",
+                      dest="max_time", default=0.5,
+                      help="fail any check taking longer than this many "
+                      "seconds (default: %default)")
+    parser.add_option("--output", action="store", dest="output",
+                      help="also write results to this file (as json)")
+    options, args = parser.parse_args()
+
+    check_names = map(lambda c: c[0], CHECKS)
+    for arg in args:
+        if arg not in check_names:
+            parser.error("Unknown check '%s' (must be one of: %s)" % (
+                arg, ", ".join(check_names)))
+
+    results = {}
+    failures = []
+    for (name, code, forbidden_modules) in CHECKS:
+        if args and name not in args:
+            continue
+        try:
+            runs = [time_import(code) for i in range(options.repeat)]
+        except subprocess.CalledProcessError:
+            failures.append("%s: failed to run '%s'" % (name, code))
+            continue
+
+        elapsed = min(map(lambda r: r[0], runs))
+        imported = sorted(set(forbidden_modules) & runs[0][1])
+        results[name] = { 'time': elapsed, 'imported': imported }
+        print "%-16s %8.3fs %s" % (name, elapsed, " ".join(imported))
+
+        if elapsed > options.max_time:
+            failures.append("%s: took %.3fs (more than %.3fs)" % (
+                name, elapsed, options.max_time))
+        if imported:
+            failures.append("%s: imported %s" % (name, ", ".join(imported)))
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(json.dumps(results))
+
+    if failures:
+        print "\n".join(["FAILED"] + failures)
+        sys.exit(1)
+
+main()
@@ -15,13 +15,25 @@ def create_dir(dirname):
     if not os.path.exists(dirname):
         os.makedirs(dirname)
 
+def get_url(url):
+    r = requests.get(url)
+    if r.status_code != 200:
+        raise Exception("Couldn't download %s (status %s)" % (url,
+                                                              r.status_code))
+    return r
+
 def download_file(url, filename):
     print (url, filename)
-    r = requests.get(url)
+    r = get_url(url)
     open(filename, 'w').write(r.content)
 
+def wait_for_results(results):
+    # raises the first error (if any) of the jobs giving the results
+    for result in results:
+        result.get()
+
 def download_metadata(url, baseurl, filename, options, videodir, profiledir):
-    r = requests.get(url)
+    r = get_url(url)
     metadata = r.json()
     videourl = baseurl + metadata['video']
     profileurl = None
@@ -41,26 +53,51 @@ def download_metadata(url, baseurl, filename, options, videodir, profiledir):
             metadata['profile'] = profileurl
     save_file(filename, json.dumps(metadata))
 
-def download_testdata(url, baseurl, filename, options, metadatadir,
+def download_testdata(url, baseurl, datadir, options, metadatadir,
                       videodir, profiledir):
-    r = requests.get(url)
-    open(filename, 'w').write(r.content)
+    r = requests.get(url + '/manifest.json')
+    if r.status_code == 404:
+        # a test without any runs since its data was split into shards:
+        # it's all still in the one file
+        download_file(url + '.json', eideticker.get_legacy_datafile(datadir))
+    else:
+        if r.status_code != 200:
+            raise Exception("Couldn't download %s/manifest.json (status %s)"
+                            % (url, r.status_code))
+        # the manifest is saved last, so nothing refers to shards which
+        # haven't been downloaded yet
+        create_dir(datadir)
+        manifest = r.json()
+        for shard in manifest['shards']:
+            filename = '%s.jsonl' % shard['name']
+            download_file(url + '/' + filename, os.path.join(datadir,
+                                                             filename))
+            # shards which haven't been summarized (yet) are shown as they
+            # are
+            filename = '%s.summary.json' % shard['name']
+            r_summary = requests.get(url + '/' + filename)
+            if r_summary.status_code == 200:
+                save_file(os.path.join(datadir, filename), r_summary.content)
+            elif r_summary.status_code != 404:
+                raise Exception("Couldn't download %s/%s (status %s)" % (
+                    url, filename, r_summary.status_code))
+        save_file(os.path.join(datadir, 'manifest.json'), r.content)
     pool = ThreadPool()
-    testdata = r.json()['testdata']
+    results = []
+    testdata = eideticker.read_testdata(datadir)
     for appname in testdata.keys():
         for date in testdata[appname].keys():
             for datapoint in testdata[appname][date]:
                 uuid = datapoint['uuid']
                 if options.download_metadata:
-                    pool.apply_async(download_metadata,
-                                     [baseurl + 'metadata/%s.json' % uuid,
-                                      baseurl,
-                                      os.path.join(metadatadir,
-                                                   '%s.json' % uuid),
-                                      options, videodir,
-                                      profiledir])
+                    results.append(pool.apply_async(
+                        download_metadata,
+                        [baseurl + 'metadata/%s.json' % uuid, baseurl,
+                         os.path.join(metadatadir, '%s.json' % uuid),
+                         options, videodir, profiledir]))
     pool.close()
     pool.join()
+    wait_for_results(results)
 
 usage = "usage: %prog [options] <url> <output directory>"
 parser = optparse.OptionParser(usage)
@@ -96,6 +133,7 @@ save_file(os.path.join(outputdir, 'devices.json'), devices.content)
 device_names = devices.json()['devices'].keys()
 
 pool = ThreadPool()
+results = []
 for device_name in device_names:
     tests = requests.get(baseurl + '%s/tests.json' % device_name)
     devicedir = os.path.join(outputdir, device_name)
@@ -103,13 +141,23 @@ for device_name in device_names:
     save_file(os.path.join(devicedir, 'tests.json'), tests.content)
     testnames = tests.json()['tests'].keys()
     for testname in testnames:
-        pool.apply_async(download_testdata,
-                         [baseurl + '%s/%s.json' % (device_name, testname),
-                          baseurl,
-                          os.path.join(outputdir, device_name,
-                                       '%s.json' % testname),
-                          options,
-                          metadatadir, videodir, profiledir])
+        results.append(((device_name, testname), pool.apply_async(
+            download_testdata,
+            [baseurl + '%s/%s' % (device_name, testname),
+             baseurl,
+             eideticker.get_testdata_dir(outputdir, device_name, testname),
+             options,
+             metadatadir, videodir, profiledir])))
 
 pool.close()
 pool.join()
+
+failed = False
+for ((device_name, testname), result) in results:
+    try:
+        result.get()
+    except Exception, e:
+        print "ERROR: Couldn't copy %s on %s: %s" % (testname, device_name, e)
+        failed = True
+if failed:
+    sys.exit(1)
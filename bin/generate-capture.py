@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import optparse
+import sys
+import videocapture
+
+def main(args=sys.argv[1:]):
+    usage = "usage: %prog [options] <output file>"
+    parser = optparse.OptionParser(usage)
+    parser.add_option("--segments", action="store", dest="segments",
+                      default=",".join(map(lambda s: "%s:%s" % s,
+                                           videocapture.DEFAULT_SEGMENTS)),
+                      help="comma-separated list of type:frames segments "
+                      "making up the capture, where type is one of %s "
+                      "(default: %%default)" %
+                      ", ".join(videocapture.SEGMENT_TYPES))
+    parser.add_option("--width", action="store", type="int", dest="width",
+                      default=1280, help="width of capture (default: "
+                      "%default)")
+    parser.add_option("--height", action="store", type="int",
+                      dest="height", default=720,
+                      help="height of capture (default: %default)")
+    parser.add_option("--fps", action="store", type="int", dest="fps",
+                      default=60, help="frames per second (default: "
+                      "%default)")
+    parser.add_option("--capture-device", action="store",
+                      dest="capture_device", default="decklink",
+                      choices=videocapture.valid_capture_devices,
+                      help="capture device to claim the capture came from "
+                      "(determines how it is analyzed; default: %default)")
+    parser.add_option("--scroll-speed", action="store", type="int",
+                      dest="scroll_speed",
+                      default=videocapture.DEFAULT_SCROLL_SPEED,
+                      help="pixels scrolled per frame (default: %default)")
+    parser.add_option("--raw", action="store", dest="raw_mode",
+                      choices=videocapture.valid_decklink_modes,
+                      help="instead of a converted capture, write a raw "
+                      "decklink capture in this mode (with start and end "
+                      "signals)")
+    parser.add_option("--seed", action="store", type="int", dest="seed",
+                      default=0, help="seed for generating page content")
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error("incorrect number of arguments")
+
+    segments = videocapture.parse_segments(options.segments)
+    if options.raw_mode:
+        num_frames = videocapture.write_synthetic_raw_capture(
+            args[0], mode=options.raw_mode, segments=segments,
+            scroll_speed=options.scroll_speed, seed=options.seed)
+        print "Wrote %s raw frames to %s" % (num_frames, args[0])
+    else:
+        videocapture.write_synthetic_capture(
+            args[0], dimensions=(options.width, options.height),
+            segments=segments, fps=options.fps,
+            capture_device=options.capture_device,
+            scroll_speed=options.scroll_speed, seed=options.seed)
+        print "Wrote capture to %s" % args[0]
+
+main()
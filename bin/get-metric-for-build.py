@@ -12,6 +12,52 @@ import videocapture
 CAPTURE_DIR = os.path.join(os.path.dirname(__file__), "../captures")
 
 
+def process_run(options, stableframecapture, testlog, capture_file,
+                profile_file):
+    capture_uuid = uuid.uuid1().hex
+    datapoint = { 'uuid': capture_uuid }
+    metadata = {}
+    metrics = {}
+
+    if options.capture:
+        testlog.pending_capture.convert()
+        capture = videocapture.Capture(capture_file)
+
+        datapoint['captureFile'] = metadata['captureFile'] = capture_file
+        metadata['captureFPS'] = capture.fps
+        metadata['generatedVideoFPS'] = capture.generated_video_fps
+
+        if stableframecapture:
+            metrics['timetostableframe'] = \
+                eideticker.get_stable_frame_time(capture)
+        else:
+            metrics.update(
+                eideticker.get_standard_metrics(capture, testlog.actions))
+        metadata['metrics'] = metrics
+
+        metadata.update(eideticker.get_standard_metric_metadata(capture))
+
+        if options.outputdir:
+            # video
+            video_relpath = os.path.join(
+                'videos', 'video-%s.webm' % time.time())
+            video_path = os.path.join(options.outputdir, video_relpath)
+            open(video_path, 'w').write(capture.get_video().read())
+            metadata['video'] = video_relpath
+
+    if options.get_internal_checkerboard_stats:
+        metrics['internalcheckerboard'] = \
+            testlog.checkerboard_percent_totals
+
+    # Want metrics data in data, so we can graph everything at once
+    datapoint.update(metrics)
+
+    if options.enable_profiling:
+        metadata['profile'] = profile_file
+
+    return (datapoint, metadata)
+
+
 def runtest(device_prefs, testname, options, apk=None, appname=None,
             appdate=None):
     if apk:
@@ -30,10 +76,23 @@ def runtest(device_prefs, testname, options, apk=None, appname=None,
 
     capture_results = []
 
+    def write_run((datapoint, metadata)):
+        # dump metadata
+        if options.outputdir:
+            # metadata
+            metadata_path = os.path.join(options.outputdir, 'metadata',
+                                         '%s.json' % datapoint['uuid'])
+            open(metadata_path, 'w').write(json.dumps(metadata))
+
+        capture_results.append(datapoint)
+
     if options.prepare_test:
         eideticker.prepare_test(
             testname, device_prefs, options.wifi_settings_file)
 
+    # the capture of each run is converted and analyzed while the next one
+    # executes (unless asked not to)
+    pipeline = eideticker.RunPipeline()
     for i in range(options.num_runs):
         # Now run the test
         curtime = int(time.time())
@@ -65,56 +124,16 @@ def runtest(device_prefs, testname, options, apk=None, appname=None,
             capture_file=capture_file,
             wifi_settings_file=options.wifi_settings_file,
             sync_time=options.sync_time,
-            use_vpxenc=options.use_vpxenc)
-
-        capture_uuid = uuid.uuid1().hex
-        datapoint = { 'uuid': capture_uuid }
-        metadata = {}
-        metrics = {}
-
-        if options.capture:
-            capture = videocapture.Capture(capture_file)
-
-            datapoint['captureFile'] = metadata['captureFile'] = capture_file
-            metadata['captureFPS'] = capture.fps
-            metadata['generatedVideoFPS'] = capture.generated_video_fps
-
-            if stableframecapture:
-                metrics['timetostableframe'] = \
-                    eideticker.get_stable_frame_time(capture)
-            else:
-                metrics.update(
-                    eideticker.get_standard_metrics(capture, testlog.actions))
-            metadata['metrics'] = metrics
-
-            metadata.update(eideticker.get_standard_metric_metadata(capture))
-
-            if options.outputdir:
-                # video
-                video_relpath = os.path.join(
-                    'videos', 'video-%s.webm' % time.time())
-                video_path = os.path.join(options.outputdir, video_relpath)
-                open(video_path, 'w').write(capture.get_video().read())
-                metadata['video'] = video_relpath
+            use_vpxenc=options.use_vpxenc,
+            ring_buffer_frames=options.ring_buffer_frames,
+            defer_conversion=True)
 
-        if options.get_internal_checkerboard_stats:
-            metrics['internalcheckerboard'] = \
-                testlog.checkerboard_percent_totals
+        pipeline.submit(process_run, write_run, options, stableframecapture,
+                        testlog, capture_file, profile_file)
+        if not options.pipeline:
+            pipeline.wait()
 
-        # Want metrics data in data, so we can graph everything at once
-        datapoint.update(metrics)
-
-        if options.enable_profiling:
-            metadata['profile'] = profile_file
-
-        # dump metadata
-        if options.outputdir:
-            # metadata
-            metadata_path = os.path.join(options.outputdir, 'metadata',
-                                         '%s.json' % capture_uuid)
-            open(metadata_path, 'w').write(json.dumps(metadata))
-
-        capture_results.append(datapoint)
+    pipeline.finish()
 
     if options.devicetype == "b2g":
         # FIXME: get information from sources.xml and application.ini on
@@ -184,6 +203,10 @@ def main(args=sys.argv[1:]):
                       type="int", dest="num_runs",
                       default=1,
                       help="number of runs (default: 1)")
+    parser.add_option("--no-pipeline", action="store_false",
+                      dest="pipeline", default=True,
+                      help="don't convert and analyze captures in the "
+                      "background while the next run is executing")
     parser.add_option("--output-dir", action="store",
                       type="string", dest="outputdir",
                       help="output results to web site")
@@ -5,6 +5,7 @@ import eideticker
 import json
 import mozhttpd
 import moznetwork
+import numpy
 import os
 import sys
 import time
@@ -143,7 +144,8 @@ def main(args=sys.argv[1:]):
 
     # create a difference. threshold differences above 32 to 255, then
     # run our existing algorithm on it
-    framediff = capture.get_frame(0) - capture.get_frame(capture.num_frames-1)
+    framediff = capture.get_frame(0, type=numpy.int16) - \
+        capture.get_frame(capture.num_frames-1, type=numpy.int16)
     for y,row in enumerate(framediff):
         for x,px in enumerate(row):
             if px[0] > 32 or px[1] > 32 or px[2] > 32:
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+# Runs a set of dashboard tests across several capture rigs (device + capture
+# card pairs) attached to this machine at once, publishing the results into a
+# single dashboard. The rigs are described in a json file like:
+#
+# { "rigs": [ { "deviceId": "nexus-s", "serial": "3233A2C4E52400EC",
+#               "captureDevice": "decklink", "captureCard": 0 }, ... ] }
+#
+# Optional per-rig keys: "deviceName", "deviceType", "dmtype", "captureArea"
+# (as a json list). Anything not specified falls back to the command line.
+
+import Queue
+import copy
+import eideticker
+import json
+import sys
+import threading
+import time
+import traceback
+
+def run_rig(rig, options, product, testqueue, pool, failures):
+    device_id = rig['deviceId']
+    device_prefs = eideticker.getDevicePrefs(options)
+    try:
+        device = eideticker.getDevice(**device_prefs)
+        (appinfo, appname, deviceinfo) = eideticker.get_dashboard_appinfo(
+            device, options, product)
+    except Exception:
+        # leave this rig's share of the tests to the others
+        traceback.print_exc()
+        failures.append((device_id, None))
+        return
+
+    pipeline = eideticker.RunPipeline(pool=pool)
+    try:
+        while True:
+            try:
+                testkey = testqueue.get_nowait()
+            except Queue.Empty:
+                break
+
+            current_date = time.strftime("%Y-%m-%d")
+            capture_name = "%s - %s (taken on %s)" % (testkey, product['name'],
+                                                      current_date)
+            if options.devicetype == "android" and options.apk:
+                capture_name = "%s %s" % (product['name'], appinfo['appdate'])
+
+            print "Running %s on %s" % (testkey, device_id)
+            try:
+                eideticker.run_dashboard_tests(device, device_prefs, options,
+                                               product, testkey, device_id,
+                                               deviceinfo, appinfo, appname,
+                                               capture_name, pipeline)
+            except Exception:
+                traceback.print_exc()
+                failures.append((device_id, testkey))
+    finally:
+        pipeline.finish()
+
+def get_rig_options(rig, options):
+    rig_options = copy.copy(options)
+    rig_options.serial = rig['serial']
+    rig_options.capture_device = rig.get('captureDevice',
+                                         options.capture_device)
+    rig_options.capture_card = rig.get('captureCard', options.capture_card)
+    rig_options.device_name = rig.get('deviceName')
+    rig_options.devicetype = rig.get('deviceType', options.devicetype)
+    rig_options.dmtype = rig.get('dmtype', options.dmtype)
+    if rig.get('captureArea'):
+        rig_options.capture_area = rig['captureArea']
+
+    return rig_options
+
+def main(args=sys.argv[1:]):
+    usage = "usage: %prog [options] <rigs file> <product> <test> [test ...]"
+
+    parser = eideticker.DashboardOptionParser(usage=usage)
+    parser.add_option("--num-workers", action="store", type="int",
+                      dest="num_workers",
+                      help="number of captures to convert and analyze at "
+                      "once (default: one per rig)")
+
+    options, args = parser.parse_args()
+
+    if len(args) < 3:
+        parser.print_usage()
+        sys.exit(1)
+
+    (rigsfile, productname) = args[0:2]
+    testkeys = args[2:]
+
+    rigs = json.loads(open(rigsfile).read())['rigs']
+    if not rigs:
+        parser.error("No rigs specified in %s" % rigsfile)
+    for rig in rigs:
+        if not rig.get('deviceId') or not rig.get('serial'):
+            parser.error("Each rig must specify a deviceId and a serial")
+    if len(set(map(lambda r: r['deviceId'], rigs))) != len(rigs):
+        parser.error("Rig device ids must be unique")
+
+    rig_options = map(lambda r: get_rig_options(r, options), rigs)
+    if len(filter(lambda o: o.devicetype == 'b2g', rig_options)) > 1:
+        # marionette is always forwarded to the same local port
+        parser.error("Only one b2g rig is supported at a time")
+
+    # make sure all the tests exist before we start running any of them
+    testqueue = Queue.Queue()
+    for testkey in testkeys:
+        eideticker.get_testinfo(testkey)
+        testqueue.put(testkey)
+
+    product = eideticker.get_product(productname)
+
+    # copy dashboard files to output directory (if applicable)
+    eideticker.copy_dashboard_files(options.outputdir)
+
+    # the rigs share one set of workers for converting and analyzing captures,
+    # while each rig keeps the results of its own runs in order
+    pool = eideticker.create_worker_pool(options.num_workers or len(rigs))
+    failures = []
+    threads = []
+    for (rig, rig_option) in zip(rigs, rig_options):
+        thread = threading.Thread(target=run_rig,
+                                  args=(rig, rig_option, product, testqueue,
+                                        pool, failures))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    pool.close()
+    pool.join()
+
+    if failures:
+        for (device_id, testkey) in failures:
+            if testkey:
+                print "ERROR: %s failed on %s" % (testkey, device_id)
+            else:
+                print "ERROR: Couldn't set up %s" % device_id
+        sys.exit(1)
+
+main()
@@ -2,13 +2,14 @@
 
 import json
 import optparse
+import os
 import sys
 import eideticker
 import datetime
 
 
 def main(args=sys.argv[1:]):
-    usage = "usage: %prog <data json file> [date1] ..."
+    usage = "usage: %prog <test data directory> [date1] ..."
     parser = optparse.OptionParser(usage)
     parser.add_option("--start-date", action="store", dest="start_date",
                       metavar="YYYY-MM-DD",
@@ -28,10 +29,13 @@ def main(args=sys.argv[1:]):
         parser.error("If start date is specified, so must end date and "
                      "vice versa")
 
-    filename = args[0]
-    with open(filename) as f:
-        data = json.loads(f.read())
-    testdata = data['testdata']
+    # (accepting the test's data file from before it was sharded, too)
+    datadir = args[0].rstrip('/')
+    if datadir.endswith('.json'):
+        datadir = datadir[:-len('.json')]
+
+    store = eideticker.DashboardStore(os.path.dirname(os.path.dirname(
+        os.path.abspath(datadir))))
 
     if options.start_date and options.end_date:
         start_date = eideticker.BuildRetriever.get_date(options.start_date)
@@ -43,35 +47,40 @@ def main(args=sys.argv[1:]):
     else:
         dates = args[1:]
 
-    # If there are no dates, then just print all dates in the json
-    if not dates:
+    # so nothing is added to the data while we're rewriting it
+    with store.lock():
+        if not options.dry_run:
+            eideticker.migrate_testdata(datadir)
+        testdata = eideticker.read_testdata(datadir)
+
+        # If there are no dates, then just print all dates in the json
+        if not dates:
+            for (platform, platformdata) in testdata.iteritems():
+                for date in platformdata:
+                    dates.append(date)
+            for date in set(dates):
+                print date
+            return
+
+        # keep a backup of the original data, just in case
+        if not options.dry_run:
+            backupfilename = datadir + ".bak"
+            with open(backupfilename, 'w+') as f:
+                f.write(json.dumps({'testdata': testdata}))
+
+        data_to_remove = []
         for (platform, platformdata) in testdata.iteritems():
             for date in platformdata:
-                dates.append(date)
-        for date in set(dates):
-            print date
-        return
+                if date in dates:
+                    data_to_remove.append((platform, date))
 
-    # keep a backup of the original data, just in case
-    if not options.dry_run:
-        backupfilename = args[0] + ".bak"
-        with open(backupfilename, 'w+') as f:
-            f.write(json.dumps(data))
+        for (platform, date) in data_to_remove:
+            if not options.dry_run:
+                del testdata[platform][date]
+            else:
+                print "%s %s" % (platform, date)
 
-    data_to_remove = []
-    for (platform, platformdata) in testdata.iteritems():
-        for date in platformdata:
-            if date in dates:
-                data_to_remove.append((platform, date))
-
-    for (platform, date) in data_to_remove:
         if not options.dry_run:
-            del testdata[platform][date]
-        else:
-            print "%s %s" % (platform, date)
-
-    if not options.dry_run:
-        with open(filename, 'w+') as f:
-            f.write(json.dumps(data))
+            eideticker.write_testdata(datadir, testdata)
 
 main()
@@ -36,6 +36,11 @@ def main(args=sys.argv[1:]):
     parser.add_option("--actions-log-file", action="store",
                       type="string", dest="actions_log_file",
                       help="Collect a log of actions requests during test")
+    parser.add_option("--trace-file", action="store",
+                      type="string", dest="trace_file",
+                      help="Write a timeline of the test run (harness "
+                      "stages, device actions, HTTP requests and capture "
+                      "frames) to this file, for viewing in about:tracing")
 
     options, args = parser.parse_args()
 
@@ -65,7 +70,9 @@ def main(args=sys.argv[1:]):
         capture_file=options.capture_file,
         wifi_settings_file=options.wifi_settings_file,
         sync_time=options.sync_time,
-        use_vpxenc=options.use_vpxenc)
+        use_vpxenc=options.use_vpxenc,
+        ring_buffer_frames=options.ring_buffer_frames,
+        trace_file=options.trace_file)
 
     # save logs if applicable
     if options.request_log_file:
@@ -70,6 +70,30 @@ function measureDisplayList(measureIds, measures) {
   });
 }
 
+// per-frame series may be stored as a list of numbers, or (more compactly)
+// as a base64-encoded little-endian typed array (see
+// videocapture.encode_series). Either way, returns something array-like.
+function decodeSeries(series) {
+  if (!series || !series.encoding) {
+    return series;
+  }
+
+  var bytes = atob(series.data);
+  var view = new DataView(new ArrayBuffer(bytes.length));
+  for (var i = 0; i < bytes.length; i++) {
+    view.setUint8(i, bytes.charCodeAt(i));
+  }
+
+  var values = (series.type === 'float32') ?
+    new Float32Array(series.length) : new Uint32Array(series.length);
+  for (var i = 0; i < series.length; i++) {
+    values[i] = (series.type === 'float32') ?
+      view.getFloat32(i * 4, true) : view.getUint32(i * 4, true);
+  }
+
+  return values;
+}
+
 // default value for detail view: usually frame diff sums, unless we're
 // looking at entropy, in which case we'll look at the entropy values
 function getDefaultDetailParameter(measureName, metadata) {
@@ -4,7 +4,7 @@ $(function() {
 
   function render(metadata, measureId) {
 
-    var measureValues = metadata[measureId];
+    var measureValues = decodeSeries(metadata[measureId]);
     var actions = metadata.actionLog;
 
     var seriesList = [];
@@ -8,44 +8,254 @@ function getResourceURL(path) {
   return serverPrefix + path;
 }
 
-function updateContent(testInfo, deviceId, testId, measureId) {
-  $.getJSON(getResourceURL(deviceId + '/' + testId + '.json'), function(dict) {
-    if (!dict || !dict['testdata']) {
-      $('#data-view').html("<p><b>No data for that device/test combination. :(</b></p>");
+// number of shards (months) of a test's data to show at first: older ones
+// are only fetched if asked for
+var NUM_SHARDS_PER_LOAD = 3;
+// most shards whose datapoints are fetched at once, when zooming in on them
+// (otherwise only their summaries are shown)
+var MAX_ZOOMED_SHARDS = 2;
+
+function getTestDataURL(deviceId, testId, filename) {
+  return getResourceURL([ deviceId, testId, filename ].join('/'));
+}
+
+// adds the datapoints in a shard (a [product, appdate, datapoint] list per
+// line) to testData ({product: {appdate: [datapoint, ...]}})
+function addShardToTestData(testData, shardText) {
+  shardText.split('\n').forEach(function(line) {
+    var entry;
+    try {
+      entry = JSON.parse(line);
+    } catch (e) {
+      // blank, or the end of a write that never finished
       return;
     }
+    var productData = testData[entry[0]] = testData[entry[0]] || {};
+    var appdateData = productData[entry[1]] = productData[entry[1]] || [];
+    appdateData.push(entry[2]);
+  });
+}
 
-    var testData = dict['testdata'];
-
-    // figure out which measures could apply to this graph
-    var availableMeasureIds = [];
-    Object.keys(testData).forEach(function(type) {
-      Object.keys(testData[type]).forEach(function(timestamp) {
-        testData[type][timestamp].forEach(function(sample) {
-          var measureIds = getMeasureIdsInSample(sample, overallMeasures);
-          measureIds.forEach(function(measureId) {
-            if (jQuery.inArray(measureId, availableMeasureIds) === -1) {
-              availableMeasureIds.push(measureId);
-            }
-          });
+// loaded holds what's been fetched of a test's data so far, by shard
+// (month): the summary of each build in some (see testdata.py), and the
+// datapoints themselves in others (where we've been asked for them, or
+// there's no summary)
+function getEmptyLoadedData() {
+  return { 'summaries': {}, 'rawData': {} };
+}
+
+function loadRawData(deviceId, testId, shardNames, loaded, cb) {
+  $.when.apply($, shardNames.map(function(shardName) {
+    return $.ajax({ url: getTestDataURL(deviceId, testId, shardName + '.jsonl'),
+                    dataType: 'text',
+                    success: function(shardText) {
+                      var testData = {};
+                      addShardToTestData(testData, shardText);
+                      loaded.rawData[shardName] = testData;
+                    }
+                  });
+  })).always(function() {
+    cb(loaded);
+  });
+}
+
+function loadSummaries(deviceId, testId, shards, loaded, cb) {
+  $.when.apply($, shards.map(function(shard) {
+    var summaryLoaded = $.Deferred();
+    $.getJSON(getTestDataURL(deviceId, testId, shard.name + '.summary.json'), function(summary) {
+      loaded.summaries[shard.name] = summary['builds'];
+      summaryLoaded.resolve();
+    }).fail(function() {
+      // not summarized (yet): fall back to the datapoints
+      loadRawData(deviceId, testId, [ shard.name ], loaded, function() {
+        summaryLoaded.resolve();
+      });
+    });
+    return summaryLoaded;
+  })).done(function() {
+    cb(loaded);
+  });
+}
+
+// figure out which measures could apply to a graph of testData
+function getAvailableMeasureIds(testData) {
+  var availableMeasureIds = [];
+  Object.keys(testData).forEach(function(type) {
+    Object.keys(testData[type]).forEach(function(timestamp) {
+      testData[type][timestamp].forEach(function(sample) {
+        var measureIds = getMeasureIdsInSample(sample, overallMeasures);
+        measureIds.forEach(function(measureId) {
+          if (jQuery.inArray(measureId, availableMeasureIds) === -1) {
+            availableMeasureIds.push(measureId);
+          }
         });
       });
     });
+  });
+
+  return availableMeasureIds;
+}
+
+// the measures summarized for any build in a test's summary
+function getSummaryMeasureIds(builds) {
+  var availableMeasureIds = [];
+  Object.keys(builds).forEach(function(type) {
+    Object.keys(builds[type]).forEach(function(timestamp) {
+      getMeasureIdsInSample(builds[type][timestamp].metrics, overallMeasures).forEach(function(measureId) {
+        if (jQuery.inArray(measureId, availableMeasureIds) === -1) {
+          availableMeasureIds.push(measureId);
+        }
+      });
+    });
+  });
 
-    $('#data-view').html(ich.graph({'title': testInfo.shortDesc,
-                                    'measureDescription': overallMeasures[measureId].longDesc,
-                                    'measures': measureDisplayList(availableMeasureIds, overallMeasures)
-                                 }));
+  return availableMeasureIds;
+}
+
+// test data with a single sample per build in a shard, standing in for all
+// of its runs: the run closest to the median (so clicking on it shows that
+// run), along with the build's aggregates for the measure
+function getSummaryTestData(builds, measureId, shardName) {
+  var testData = {};
+  Object.keys(builds).forEach(function(type) {
+    testData[type] = {};
+    Object.keys(builds[type]).forEach(function(timestamp) {
+      var build = builds[type][timestamp];
+      var sample = { 'baseline': build.baseline, 'shard': shardName };
+      var aggregate = build.metrics[measureId];
+      if (aggregate) {
+        sample.uuid = aggregate.uuid;
+        sample[measureId] = aggregate.median;
+        sample.aggregate = aggregate;
+      }
+      testData[type][timestamp] = [ sample ];
+    });
+  });
 
-    // update graph
-    updateGraph(testInfo.shortDesc, testData, measureId);
+  return testData;
+}
 
-    $('#measure-'+measureId).attr("selected", "true");
-    $('#measure').change(function() {
-      var newMeasureId = $(this).val();
-      window.location.hash = '/' + [ deviceId, testId, newMeasureId ].join('/');
+// test data for graphing everything loaded so far, the datapoints of a
+// shard taking the place of its summary once they're loaded
+function getLoadedTestData(loaded, measureId) {
+  var testData = {};
+  function addTestData(shardData) {
+    Object.keys(shardData).forEach(function(type) {
+      testData[type] = testData[type] || {};
+      Object.keys(shardData[type]).forEach(function(timestamp) {
+        testData[type][timestamp] = (testData[type][timestamp] || []).concat(
+          shardData[type][timestamp]);
+      });
     });
+  }
 
+  Object.keys(loaded.rawData).forEach(function(shardName) {
+    addTestData(loaded.rawData[shardName]);
+  });
+  Object.keys(loaded.summaries).forEach(function(shardName) {
+    if (!loaded.rawData[shardName]) {
+      addTestData(getSummaryTestData(loaded.summaries[shardName], measureId,
+                                     shardName));
+    }
+  });
+
+  return testData;
+}
+
+function getLoadedMeasureIds(loaded) {
+  var availableMeasureIds = [];
+  function addMeasureIds(measureIds) {
+    measureIds.forEach(function(measureId) {
+      if (jQuery.inArray(measureId, availableMeasureIds) === -1) {
+        availableMeasureIds.push(measureId);
+      }
+    });
+  }
+
+  Object.keys(loaded.summaries).forEach(function(shardName) {
+    addMeasureIds(getSummaryMeasureIds(loaded.summaries[shardName]));
+  });
+  Object.keys(loaded.rawData).forEach(function(shardName) {
+    addMeasureIds(getAvailableMeasureIds(loaded.rawData[shardName]));
+  });
+
+  return availableMeasureIds;
+}
+
+function updateContent(testInfo, deviceId, testId, measureId) {
+  $.getJSON(getTestDataURL(deviceId, testId, 'manifest.json'), function(manifest) {
+    var shards = manifest['shards'];
+    loadSummaries(deviceId, testId, shards.slice(-NUM_SHARDS_PER_LOAD), getEmptyLoadedData(), function(loaded) {
+      showTestData(testInfo, deviceId, testId, measureId, loaded,
+                   shards.slice(0, -NUM_SHARDS_PER_LOAD));
+    });
+  }).fail(function() {
+    // data from before it was sharded (all in one file)
+    $.getJSON(getResourceURL(deviceId + '/' + testId + '.json'), function(dict) {
+      var loaded = getEmptyLoadedData();
+      if (dict && dict['testdata']) {
+        loaded.rawData[''] = dict['testdata'];
+      }
+      showTestData(testInfo, deviceId, testId, measureId, loaded, []);
+    });
+  });
+}
+
+// olderShards are those of the test's shards not loaded yet
+function showTestData(testInfo, deviceId, testId, measureId, loaded, olderShards) {
+  var testData = getLoadedTestData(loaded, measureId);
+  if (!Object.keys(testData).length) {
+    $('#data-view').html("<p><b>No data for that device/test combination. :(</b></p>");
+    return;
+  }
+
+  $('#data-view').html(ich.graph({'title': testInfo.shortDesc,
+                                  'measureDescription': overallMeasures[measureId].longDesc,
+                                  'measures': measureDisplayList(getLoadedMeasureIds(loaded), overallMeasures),
+                                  'hasOlderData': olderShards.length > 0
+                               }));
+
+  // fetches the datapoints of summarized shards (so that all of their
+  // runs can be looked at), then graphs them in place of the summaries
+  var loadingShards = {};
+  var graphContainer = $('#graph-container')[0];
+  function loadShardData(shardNames, xRange) {
+    shardNames = shardNames.filter(function(shardName) {
+      return !loaded.rawData[shardName] && !loadingShards[shardName];
+    });
+    if (!shardNames.length)
+      return;
+    shardNames.forEach(function(shardName) {
+      loadingShards[shardName] = true;
+    });
+    loadRawData(deviceId, testId, shardNames, loaded, function() {
+      shardNames.forEach(function(shardName) {
+        delete loadingShards[shardName];
+      });
+      if ($('#graph-container')[0] !== graphContainer) {
+        // we've moved on to showing something else since
+        return;
+      }
+      updateGraph(testInfo.shortDesc, getLoadedTestData(loaded, measureId),
+                  measureId, loadShardData, xRange);
+    });
+  }
+
+  // update graph
+  updateGraph(testInfo.shortDesc, testData, measureId, loadShardData);
+
+  $('#measure-'+measureId).attr("selected", "true");
+  $('#measure').change(function() {
+    var newMeasureId = $(this).val();
+    window.location.hash = '/' + [ deviceId, testId, newMeasureId ].join('/');
+  });
+
+  $('#load-older-data').click(function(e) {
+    e.preventDefault();
+    loadSummaries(deviceId, testId, olderShards.slice(-NUM_SHARDS_PER_LOAD), loaded, function(loaded) {
+      showTestData(testInfo, deviceId, testId, measureId, loaded,
+                   olderShards.slice(0, -NUM_SHARDS_PER_LOAD));
+    });
   });
 }
 
@@ -55,11 +265,17 @@ function updateFooter() {
                                            $("#graph-main").height())));
 }
 
-function updateGraph(title, rawdata, measureId) {
+// loadShardData(shardNames, xRange) is called to graph the datapoints of
+// summarized shards once we're looking at them closely; xRange is the part
+// of the graph ({min, max}) to show, if not all of it
+function updateGraph(title, rawdata, measureId, loadShardData, xRange) {
   // show individual data points
   var graphdata = [];
   var color = 0;
   var uuidHash = {};
+  var aggregateHash = {};
+  // the shard (summarized) each point is in
+  var shardHash = {};
 
   var seriesIndex = 0;
 
@@ -72,6 +288,8 @@ function updateGraph(title, rawdata, measureId) {
 
   Object.keys(rawdata).sort().forEach(function(type) {
     uuidHash[seriesIndex] = [];
+    aggregateHash[seriesIndex] = [];
+    shardHash[seriesIndex] = [];
 
     // point graph
     var series1 = {
@@ -90,6 +308,8 @@ function updateGraph(title, rawdata, measureId) {
             sourceRepo = "http://hg.mozilla.org/mozilla-central";
           }
           uuidHash[seriesIndex].push(sample.uuid);
+          aggregateHash[seriesIndex].push(sample.aggregate);
+          shardHash[seriesIndex].push(sample.shard);
         }
       });
     });
@@ -114,7 +334,11 @@ function updateGraph(title, rawdata, measureId) {
       var total = 0;
       rawdata[type][timestamp].forEach(function(sample) {
         lastSample = sample;
-        if (sample[measureId]) {
+        if (sample.aggregate) {
+          // standing in for all of a build's runs
+          total += sample.aggregate.mean * sample.aggregate.count;
+          numSamples += sample.aggregate.count;
+        } else if (sample[measureId]) {
           total += sample[measureId];
           numSamples++;
         }
@@ -189,7 +413,9 @@ function updateGraph(title, rawdata, measureId) {
     var plot = $.plot($("#graph-container"), graphdata, {
       xaxis: {
         mode: "time",
-        timeformat: "%m-%d"
+        timeformat: "%m-%d",
+        min: xRange ? xRange.min : null,
+        max: xRange ? xRange.max : null
       },
       yaxis: {
         axisLabel: overallMeasures[measureId].shortDesc,
@@ -224,9 +450,32 @@ function updateGraph(title, rawdata, measureId) {
       }).appendTo("body").fadeIn(200);
     }
 
+    function getXRange() {
+      var xaxis = plot.getAxes().xaxis;
+      return { 'min': xaxis.min, 'max': xaxis.max };
+    }
+
+    // once zoomed in to a few months, show all of their runs
+    $("#graph-container").unbind("plotzoom plotpan").bind("plotzoom plotpan", function (event) {
+      var range = getXRange();
+      var shardNames = [];
+      Object.keys(shardHash).forEach(function(seriesIndex) {
+        shardHash[seriesIndex].forEach(function(shardName, dataIndex) {
+          var x = graphdata[seriesIndex].data[dataIndex][0];
+          if (shardName && x >= range.min && x <= range.max &&
+              jQuery.inArray(shardName, shardNames) === -1) {
+            shardNames.push(shardName);
+          }
+        });
+      });
+      if (shardNames.length && shardNames.length <= MAX_ZOOMED_SHARDS) {
+        loadShardData(shardNames, range);
+      }
+    });
+
     // Plot Hover tooltip
     var previousPoint = null;
-    $("#graph-container").bind("plothover", function (event, pos, item) {
+    $("#graph-container").unbind("plothover").bind("plothover", function (event, pos, item) {
       if (item) {
         if (previousPoint != item.dataIndex) {
           var toolTip;
@@ -235,6 +484,12 @@ function updateGraph(title, rawdata, measureId) {
 
           if (uuidHash[item.seriesIndex] && uuidHash[item.seriesIndex][item.dataIndex]) {
             toolTip = (item.series.label || item.series.hoverLabel) + " of " + getDateStr(item.datapoint[0]) + " = " + y;
+            var aggregate = aggregateHash[item.seriesIndex][item.dataIndex];
+            if (aggregate) {
+              toolTip += " (median of " + aggregate.count + " runs; mean " +
+                aggregate.mean.toFixed(2) + ", stddev " + aggregate.stddev.toFixed(2) +
+                ", range " + aggregate.min.toFixed(2) + "-" + aggregate.max.toFixed(2) + ")";
+            }
           } else {
             toolTip = (item.series.label || item.series.hoverLabel) + " = " + y;
           }
@@ -250,12 +505,17 @@ function updateGraph(title, rawdata, measureId) {
       }
     });
 
-    $("#graph-container").bind("plotclick", function (event, pos, item) {
+    $("#graph-container").unbind("plotclick").bind("plotclick", function (event, pos, item) {
       plot.unhighlight();
       if (item) {
         var uuid = uuidHash[item.seriesIndex][item.dataIndex];
         updateDataPointDisplay(uuid, item.datapoint[0], measureId, item.series);
         plot.highlight(item.series, item.datapoint);
+        // the build's median run: show the others too
+        var shardName = shardHash[item.seriesIndex][item.dataIndex];
+        if (shardName) {
+          loadShardData([ shardName ], getXRange());
+        }
       } else {
         $('#datapoint-info').html(null);
       }
@@ -264,7 +524,7 @@ function updateGraph(title, rawdata, measureId) {
 
   updateGraphDisplay();
   var redisplayTimeout = null;
-  $(window).resize(function() {
+  $(window).unbind("resize.graph").bind("resize.graph", function() {
     if (redisplayTimeout)
       return;
     redisplayTimeout = window.setTimeout(function() {
@@ -2,13 +2,35 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from dashboard import DASHBOARD_DIR, copy_dashboard_files
-from runner import AndroidBrowserRunner
-from options import OptionParser, CaptureOptionParser, TestOptionParser
-from device import getDevicePrefs, getDevice
-from metadata import get_fennec_appinfo, get_appinfo
-from products import get_product, products, BuildRetriever
-from test import get_test_manifest, get_testinfo, get_test
-from runtest import run_test, prepare_test, TestException
-from metrics import get_standard_metrics, get_stable_frame_time, get_standard_metric_metadata
-from log import logger
+import sys
+from videocapture.lazymodule import LazyModule
+
+# submodules (and marionette, gaiatest, mozdevice, etc. along with them)
+# only get imported once something from them is used
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'dashboard': ['DASHBOARD_DIR', 'copy_dashboard_files',
+                  'get_dashboard_appinfo', 'run_dashboard_tests',
+                  'process_spooled_dashboard_run',
+                  'write_spooled_dashboard_run'],
+    'runner': ['AndroidBrowserRunner'],
+    'options': ['OptionParser', 'CaptureOptionParser', 'TestOptionParser',
+                'DashboardOptionParser'],
+    'device': ['getDevicePrefs', 'getDevice'],
+    'metadata': ['get_fennec_appinfo', 'get_appinfo'],
+    'products': ['get_product', 'products', 'BuildRetriever'],
+    'test': ['get_test_manifest', 'get_testinfo', 'get_test'],
+    'runtest': ['run_test', 'prepare_test', 'TestException', 'CAPTURE_DIR'],
+    'pipeline': ['RunPipeline', 'create_worker_pool'],
+    'spool': ['Spool'],
+    'dashboardstore': ['DashboardStore'],
+    'testdata': ['get_testdata_dir', 'get_legacy_datafile', 'read_manifest',
+                 'read_testdata', 'write_testdata', 'migrate_testdata',
+                 'append_datapoint',
+                 'read_summary', 'update_summary', 'get_aggregate',
+                 'get_build_summary'],
+    'metrics': ['get_standard_metrics', 'get_stable_frame_time',
+                'get_standard_metric_metadata', 'analyze_capture',
+                'get_cached_capture_metrics', 'get_default_capture_metrics',
+                'ANALYZER_VERSION', 'CAPTURE_METRICS'],
+    'log': ['logger']
+})
@@ -1,9 +1,22 @@
+import StringIO
 import os
 import shutil
 import subprocess
+import time
+import uuid
+import videocapture
+import xml.dom.minidom
+from dashboardstore import DashboardStore
+from metadata import get_appinfo, get_fennec_appinfo
+from metrics import get_stable_frame_time, get_standard_metrics, \
+    get_standard_metric_metadata
+from runtest import run_test, prepare_test, TestException, CAPTURE_DIR
+from spool import Spool, write_file_atomically
+from test import get_testinfo
 
 DASHBOARD_DIR = os.path.join(os.path.dirname(__file__), "../../dashboard")
 
+
 def copy_dashboard_files(outputdir, indexfile='index.html'):
     # nothing to do if output dir is actually dashboard dir (well, except
     # if indexfile=='metric.html', but in that case you probably shouldn't
@@ -38,3 +51,367 @@ def copy_dashboard_files(outputdir, indexfile='index.html'):
             # remove any existing files to ensure we use the latest
             os.remove(dest)
         shutil.copyfile(source, dest)
+
+
+def get_revision_data(sources_xml):
+    revision_data = {}
+    sources = xml.dom.minidom.parseString(open(sources_xml).read())
+    for element in sources.getElementsByTagName('project'):
+        path = element.getAttribute('path')
+        revision = element.getAttribute('revision')
+        if path in ['gaia', 'build']:
+            revision_data[path + 'Revision'] = revision
+    return revision_data
+
+
+def get_dashboard_appinfo(device, options, product):
+    '''Gets information on the application under test, plus the information
+       on the device to show in the dashboard'''
+    device_name = options.device_name
+    if not device_name:
+        device_name = device.model
+
+    if options.devicetype == "android":
+        deviceinfo = {
+            'name': device_name,
+            'version': device.getprop('ro.build.version.release')}
+        if options.apk:
+            if options.app_version:
+                raise Exception("Should specify either --app-version or "
+                                "--apk, not both!")
+            appinfo = get_fennec_appinfo(options.apk)
+            appname = appinfo['appname']
+            print "Using application name '%s' from apk '%s'" % (
+                appname, options.apk)
+        else:
+            if not options.app_version:
+                raise Exception("Should specify --app-version if not --apk!")
+
+            # no apk, assume it's something static on the device
+            appinfo = {
+                'appdate': time.strftime("%Y-%m-%d"),
+                'version': options.app_version}
+            appname = product['appname']
+
+    elif options.devicetype == "b2g":
+        if not options.sources_xml:
+            raise Exception("Must specify --sources-xml on b2g!")
+
+        deviceinfo = {'name': device_name}
+        appinicontents = device.pullFile('/system/b2g/application.ini')
+        sfh = StringIO.StringIO(appinicontents)
+        appinfo = get_appinfo(sfh)
+        appinfo.update(get_revision_data(options.sources_xml))
+        appname = None
+    else:
+        raise Exception("Unknown device type '%s'!" % options.devicetype)
+
+    return (appinfo, appname, deviceinfo)
+
+
+def update_dashboard_lists(outputdir, device_id, deviceinfo, testkey,
+                           testinfo):
+    '''Adds the device and test to the lists shown in the dashboard'''
+    store = DashboardStore(outputdir)
+    store.add_device(device_id, deviceinfo)
+    store.add_test(device_id, testkey, testinfo)
+
+
+def run_dashboard_test(device, device_prefs, options, product, appname,
+                       appinfo, testinfo, capture_name, device_id):
+    '''Runs a test (retrying if it fails intermittently), leaving the
+       capture to be converted by process_dashboard_run'''
+    capture_file = os.path.join(CAPTURE_DIR,
+                                "%s-%s-%s-%s-%s.zip" % (testinfo['key'],
+                                                        device_id,
+                                                        appname,
+                                                        appinfo.get('appdate'),
+                                                        int(time.time())))
+    productname = product['name']
+
+    profile_file = None
+    if options.enable_profiling:
+        productname += "-profiling"
+        profile_path = os.path.join(
+            'profiles', 'sps-profile-%s.zip' % time.time())
+        profile_file = os.path.join(options.outputdir, profile_path)
+    else:
+        profile_path = None
+
+    test_completed = False
+    for i in range(3):
+        print "Running test (try %s of 3)" % (i + 1)
+
+        # Kill any existing instances of the processes before starting
+        device.killProcess(appname)
+
+        try:
+            testlog = run_test(
+                testinfo['key'], options.capture_device,
+                appname, capture_name, device_prefs,
+                profile_file=profile_file,
+                capture_area=options.capture_area,
+                camera_settings_file=options.camera_settings_file,
+                capture=options.capture,
+                capture_file=capture_file,
+                wifi_settings_file=options.wifi_settings_file,
+                sync_time=options.sync_time,
+                use_vpxenc=options.use_vpxenc,
+                ring_buffer_frames=options.ring_buffer_frames,
+                capture_card=options.capture_card,
+                defer_conversion=True)
+            test_completed = True
+            break
+        except TestException, e:
+            if e.can_retry:
+                print "Test failed, but not fatally. Retrying..."
+            else:
+                raise
+
+    if not test_completed:
+        raise Exception("Failed to run test %s for %s (after 3 tries). "
+                        "Aborting." % (testinfo['key'], productname))
+
+    return (testlog, capture_file, profile_path)
+
+
+def get_dashboard_productname(options, product):
+    productname = product['name']
+    if options.enable_profiling:
+        productname += "-profiling"
+
+    return productname
+
+
+def process_dashboard_run(options, product, appinfo, testinfo, capture_name,
+                          testlog, capture_file, profile_path):
+    '''Converts and analyzes the capture for a test run (this normally
+       happens in the background, while the next run is executing)'''
+    if options.capture:
+        testlog.pending_capture.convert()
+    else:
+        capture_file = None
+
+    return analyze_dashboard_run(options.outputdir,
+                                 get_dashboard_productname(options, product),
+                                 appinfo, testinfo, capture_name,
+                                 testlog.actions, testlog.getdict(),
+                                 capture_file, profile_path,
+                                 baseline=options.baseline,
+                                 timings=testlog.timings,
+                                 compact_series=options.compact_series)
+
+
+def analyze_dashboard_run(outputdir, productname, appinfo, testinfo,
+                          capture_name, actions, logdict, capture_file,
+                          profile_path, baseline=False, timings=None,
+                          compact_series=False):
+    '''Calculates the metrics for a (converted) test run, returning the
+       datapoint and metadata to add to the dashboard. The spans in
+       timings (if given) are added to the metadata, along with those for
+       the analysis itself. If compact_series is set, per-frame series are
+       stored in the metadata in the compact encoding of
+       videocapture.encode_series.'''
+    if timings is None:
+        timings = videocapture.TimingLog()
+
+    if capture_file:
+        capture = videocapture.Capture(capture_file)
+
+        # video file
+        video_relpath = os.path.join('videos', 'video-%s.webm' % time.time())
+        video_path = os.path.join(outputdir, video_relpath)
+        with timings.span('videowrite'):
+            write_file_atomically(video_path, capture.get_video().read())
+    else:
+        video_relpath = None
+
+    # app date
+    appdate = appinfo['appdate']
+
+    datapoint = { 'uuid': uuid.uuid1().hex }
+    metadata =  { 'video': video_relpath, 'appdate': appdate,
+                  'label': capture_name }
+    for key in ['appdate', 'buildid', 'revision', 'geckoRevision',
+                'gaiaRevision', 'buildRevision', 'sourceRepo']:
+        if appinfo.get(key):
+            metadata.update({key: appinfo[key]})
+
+    # only interested in version if we don't have revision
+    if not appinfo.get('revision') and appinfo.get('version'):
+        metadata.update({ 'version': appinfo['version'] })
+
+    if baseline:
+        datapoint.update({'baseline': True})
+
+    metrics = {}
+    if capture_file:
+        if testinfo['type'] == 'startup' or testinfo['type'] == 'webstartup' or \
+                testinfo['defaultMeasure'] == 'timetostableframe':
+            with timings.span('analysis.timetostableframe'):
+                metrics['timetostableframe'] = get_stable_frame_time(capture)
+        else:
+            # standard test metrics
+            metrics = get_standard_metrics(capture, actions, timings=timings)
+
+        metadata.update(get_standard_metric_metadata(
+            capture, timings=timings, compact=compact_series))
+
+    datapoint.update(metrics)
+    metadata['metrics'] = metrics
+
+    if profile_path:
+        metadata['profile'] = profile_path
+
+    # add logs (if any) to test metadata
+    metadata.update(logdict)
+    metadata['timings'] = timings.spans
+
+    return (productname, appdate, datapoint, metadata)
+
+
+def write_dashboard_run(outputdir, device_id, testkey,
+                        (productname, appdate, datapoint, metadata)):
+    '''Adds the results of a processed test run to the dashboard'''
+    store = DashboardStore(outputdir)
+    # the metadata is written last, so it can include how long writing the
+    # datapoint took
+    timings = videocapture.TimingLog(metadata.setdefault('timings', []))
+    with timings.span('dashboardwrite'):
+        # Write test data to disk immediately (so we don't lose it if we fail
+        # later)
+        store.add_datapoint(device_id, testkey, productname, appdate,
+                            datapoint)
+
+    # Dump metadata
+    store.write_metadata(datapoint['uuid'], metadata)
+
+
+def spool_dashboard_run(spool, options, product, appinfo, testinfo,
+                        device_id, deviceinfo, capture_name, testlog,
+                        capture_file, profile_path):
+    '''Converts the capture for a test run and copies it (and any profile)
+       into a spool, to be analyzed and published by an analysis daemon.
+       Returns the job, which should be enqueued once this is done.'''
+    jobid = uuid.uuid1().hex
+    job = { 'deviceId': device_id,
+            'deviceInfo': deviceinfo,
+            'testKey': testinfo['key'],
+            'productName': get_dashboard_productname(options, product),
+            'appInfo': appinfo,
+            'captureName': capture_name,
+            'actions': testlog.actions,
+            'log': testlog.getdict(),
+            'baseline': bool(options.baseline),
+            'compactSeries': bool(options.compact_series),
+            'timings': testlog.timings.spans }
+
+    if options.capture:
+        testlog.pending_capture.convert()
+        spool.add_file(jobid, '.zip', capture_file)
+        job['captureFile'] = os.path.basename(capture_file)
+
+    if profile_path:
+        spool.add_file(jobid, '.profile.zip',
+                       os.path.join(options.outputdir, profile_path))
+        job['profile'] = profile_path
+
+    return (jobid, job)
+
+
+def process_spooled_dashboard_run(spool, outputdir, jobid, job):
+    '''Analyzes a test run claimed from a spool'''
+    capture_file = None
+    if job.get('captureFile'):
+        capture_file = spool.get_path(jobid, '.zip')
+
+    return analyze_dashboard_run(outputdir, job['productName'],
+                                 job['appInfo'], get_testinfo(job['testKey']),
+                                 job['captureName'], job['actions'],
+                                 job['log'], capture_file, job.get('profile'),
+                                 baseline=job['baseline'],
+                                 timings=videocapture.TimingLog(
+                                     job.get('timings')),
+                                 compact_series=job.get('compactSeries',
+                                                        False))
+
+
+def write_spooled_dashboard_run(spool, outputdir, capturedir, jobid, job,
+                                result):
+    '''Publishes the results of a test run claimed from a spool, moving its
+       capture to capturedir and removing it from the spool'''
+    testinfo = get_testinfo(job['testKey'])
+    update_dashboard_lists(outputdir, job['deviceId'], job['deviceInfo'],
+                           job['testKey'], testinfo)
+
+    if job.get('profile'):
+        shutil.move(spool.get_path(jobid, '.profile.zip'),
+                    os.path.join(outputdir, job['profile']))
+
+    write_dashboard_run(outputdir, job['deviceId'], job['testKey'], result)
+
+    if job.get('captureFile'):
+        shutil.move(spool.get_path(jobid, '.zip'),
+                    os.path.join(capturedir, job['captureFile']))
+
+    spool.complete(jobid)
+
+
+def run_dashboard_tests(device, device_prefs, options, product, testkey,
+                        device_id, deviceinfo, appinfo, appname, capture_name,
+                        pipeline):
+    '''Runs a test options.num_runs times, publishing the results of each
+       run into the dashboard in options.outputdir (or, if options.spool_dir
+       is set, enqueuing them there for an analysis daemon). Runs are
+       processed using the given pipeline, which is waited on before
+       returning. Returns the timing spans recorded for each run.'''
+    testinfo = get_testinfo(testkey)
+    if options.spool_dir:
+        # leave analyzing and publishing the runs to an analysis daemon
+        spool = Spool(options.spool_dir)
+    else:
+        spool = None
+        # update the device / test list for the dashboard
+        update_dashboard_lists(options.outputdir, device_id, deviceinfo,
+                               testkey, testinfo)
+
+    # preparing the device is accounted to the first run
+    prepare_timings = videocapture.TimingLog()
+    if options.prepare_test:
+        with prepare_timings.span('deviceprep'):
+            prepare_test(testkey, device_prefs, options.wifi_settings_file)
+
+    run_timings = []
+
+    def write_run(result):
+        write_dashboard_run(options.outputdir, device_id, testkey, result)
+        run_timings.append(result[3]['timings'])
+
+    def enqueue_run((jobid, job)):
+        spool.enqueue(jobid, job)
+        run_timings.append(job['timings'])
+
+    # Run the test the specified number of times, processing the results of
+    # each run while the next one executes (unless asked not to)
+    for i in range(options.num_runs or 1):
+        run_capture_name = capture_name + " #%s" % i
+        (testlog, capture_file, profile_path) = run_dashboard_test(
+            device, device_prefs, options, product, appname, appinfo,
+            testinfo, run_capture_name, device_id)
+        if i == 0:
+            testlog.timings.spans.extend(prepare_timings.spans)
+        if spool:
+            pipeline.submit(spool_dashboard_run, enqueue_run,
+                            spool, options, product, appinfo, testinfo,
+                            device_id, deviceinfo, run_capture_name, testlog,
+                            capture_file, profile_path)
+        else:
+            pipeline.submit(process_dashboard_run, write_run,
+                            options, product, appinfo, testinfo,
+                            run_capture_name, testlog, capture_file,
+                            profile_path)
+        if not options.pipeline:
+            pipeline.wait()
+    pipeline.wait()
+
+    return run_timings
@@ -0,0 +1,94 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Writes to a dashboard's data files, so that any number of processes (e.g.
+# several capture rigs, or analysis daemons, sharing an output directory)
+# can publish into the same dashboard at once. Every read-modify-write of
+# the shared files (devices.json, <device>/tests.json and the test data
+# manifests and shards) happens under an exclusive lock on the dashboard,
+# and merges into what's there rather than replacing it. Files are replaced
+# atomically, so a crash never leaves one half-written.
+
+import contextlib
+import fcntl
+import json
+import os
+from spool import write_file_atomically
+from testdata import append_datapoint, get_testdata_dir
+
+LOCK_FILENAME = '.dashboard.lock'
+
+
+class DashboardStore(object):
+
+    def __init__(self, outputdir):
+        self.outputdir = outputdir
+
+    @contextlib.contextmanager
+    def lock(self):
+        '''Holds an exclusive lock on the dashboard (between threads as well
+           as processes: each acquisition opens the lock file anew). Not
+           reentrant.'''
+        if not os.path.isdir(self.outputdir):
+            os.makedirs(self.outputdir)
+        with open(os.path.join(self.outputdir, LOCK_FILENAME), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def get_path(self, *relpath):
+        return os.path.join(self.outputdir, *relpath)
+
+    def write_file(self, relpath, data):
+        '''Atomically writes a file which only we write (e.g. a datapoint's
+           metadata), so needs no lock'''
+        path = self.get_path(relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created by someone else in the meantime
+                pass
+        write_file_atomically(path, data)
+
+    def _update_json(self, relpath, key, update):
+        # the caller must hold the lock
+        path = self.get_path(relpath)
+        entries = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                entries = json.loads(f.read())[key]
+        update(entries)
+        self.write_file(relpath, json.dumps({key: entries}))
+
+    def add_device(self, device_id, deviceinfo):
+        '''Adds a device to the list shown in the dashboard (or updates what
+           we know about it)'''
+        with self.lock():
+            self._update_json('devices.json', 'devices', lambda devices:
+                                  devices.setdefault(device_id, {}).update(
+                                      deviceinfo))
+
+    def add_test(self, device_id, testkey, testinfo):
+        '''Adds a test to the list shown for a device in the dashboard'''
+        with self.lock():
+            self._update_json(os.path.join(device_id, 'tests.json'), 'tests',
+                              lambda tests: tests.setdefault(
+                                  testkey, {}).update({
+                                      'shortDesc': testinfo['shortDesc'],
+                                      'defaultMeasureId':
+                                          testinfo['defaultMeasure']}))
+
+    def add_datapoint(self, device_id, testkey, productname, appdate,
+                      datapoint):
+        with self.lock():
+            append_datapoint(get_testdata_dir(self.outputdir, device_id,
+                                              testkey),
+                             productname, appdate, datapoint)
+
+    def write_metadata(self, uuid, metadata):
+        self.write_file(os.path.join('metadata', '%s.json' % uuid),
+                        json.dumps(metadata))
@@ -527,26 +527,27 @@ def getDevicePrefs(options):
 
     optionDict['host'] = host
     optionDict['port'] = options.port
+    optionDict['serial'] = options.serial
 
     return optionDict
 
 
 def getDevice(dmtype="adb", devicetype="android", host=None, port=None,
-              logLevel=mozlog.INFO):
+              serial=None, logLevel=mozlog.INFO):
     '''Gets an eideticker device according to parameters'''
 
-    print "Using %s interface (type: %s, host: %s, port: %s, " \
-        "debuglevel: %s)" % (dmtype, devicetype, host, port, logLevel)
+    print "Using %s interface (type: %s, host: %s, port: %s, serial: %s, " \
+        "debuglevel: %s)" % (dmtype, devicetype, host, port, serial, logLevel)
     if dmtype == "adb":
         if host and not port:
             port = 5555
         if devicetype == 'b2g':
             # HACK: Assume adb-over-usb for now, with marionette forwarded
             # to localhost via "adb forward tcp:2828 tcp:2828"
-            return B2GADB(logLevel=logLevel)
+            return B2GADB(deviceSerial=serial, logLevel=logLevel)
         else:
             return DroidADB(packageName=None, host=host, port=port,
-                            logLevel=logLevel)
+                            deviceSerial=serial, logLevel=logLevel)
     elif dmtype == "sut":
         if not host:
             raise Exception("Must specify host with SUT!")
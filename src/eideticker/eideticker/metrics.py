@@ -1,4 +1,15 @@
+import os
 import videocapture
+from videocapture import timing_span
+
+# Bump this whenever a change to the analysis (thresholds, algorithms, ...)
+# would change the results for existing captures, so that cached results
+# get recalculated
+ANALYZER_VERSION = 2
+
+# metrics which can be calculated from a capture alone
+CAPTURE_METRICS = [ 'timetostableframe', 'uniqueframes', 'fps',
+                    'checkerboard', 'overallentropy' ]
 
 _hdmi_props = {
     'input_threshold': 4096,
@@ -41,23 +52,26 @@ def get_stable_frame_time(capture):
         threshold=analysis_props['stable_frame_threshold'],
         sobelized=analysis_props['sobelize'])
 
-def get_standard_metrics(capture, actions):
+def get_standard_metrics(capture, actions, timings=None):
     analysis_props = _get_analysis_props(capture.metadata['captureDevice'])
 
     metrics = {}
     if 'unique_frames' in analysis_props['valid_measures']:
-        metrics['uniqueframes'] = videocapture.get_num_unique_frames(
-            capture, threshold=analysis_props['animation_threshold'])
+        with timing_span(timings, 'analysis.uniqueframes'):
+            metrics['uniqueframes'] = videocapture.get_num_unique_frames(
+                capture, threshold=analysis_props['animation_threshold'])
     if 'fps' in analysis_props['valid_measures']:
-        metrics['fps'] = videocapture.get_fps(
-            capture, threshold=analysis_props['animation_threshold'])
+        with timing_span(timings, 'analysis.fps'):
+            metrics['fps'] = videocapture.get_fps(
+                capture, threshold=analysis_props['animation_threshold'])
     if 'checkerboard' in analysis_props['valid_measures']:
-        metrics['checkerboard'] = videocapture.get_checkerboarding_area_duration(
-            capture)
+        with timing_span(timings, 'analysis.checkerboard'):
+            metrics['checkerboard'] = \
+                videocapture.get_checkerboarding_area_duration(capture)
     if 'overallentropy' in analysis_props['valid_measures']:
-        metrics['overallentropy'] = \
-                                    videocapture.get_overall_entropy(capture,
-                                         sobelized=analysis_props['sobelize'])
+        with timing_span(timings, 'analysis.overallentropy'):
+            metrics['overallentropy'] = videocapture.get_overall_entropy(
+                capture, sobelized=analysis_props['sobelize'])
 
     if actions:
         # get the delta between the first non-sleep action being fired and
@@ -68,7 +82,8 @@ def get_standard_metrics(capture, actions):
                 first_non_sleep_action = action
                 break
         if first_non_sleep_action:
-            framediffs = videocapture.get_framediff_sums(capture)
+            with timing_span(timings, 'analysis.framediffsums'):
+                framediffs = videocapture.get_framediff_sums(capture)
             for (i, framediff) in enumerate(framediffs):
                 t = i / float(capture.fps)
                 if first_non_sleep_action['start'] < t and \
@@ -79,7 +94,69 @@ def get_standard_metrics(capture, actions):
 
     return metrics
 
-def get_standard_metric_metadata(capture):
-    return { 'framediffsums': videocapture.get_framediff_sums(capture),
-             'framesobelentropies': videocapture.get_frame_entropies(
-            capture, sobelized=True) }
+def get_standard_metric_metadata(capture, timings=None, compact=False):
+    with timing_span(timings, 'analysis.framediffsums'):
+        framediffsums = videocapture.get_framediff_sums(capture)
+    with timing_span(timings, 'analysis.framesobelentropies'):
+        framesobelentropies = videocapture.get_frame_entropies(
+            capture, sobelized=True)
+
+    if compact:
+        # see videocapture.encode_series
+        framediffsums = videocapture.encode_series(framediffsums, 'uint32')
+        framesobelentropies = videocapture.encode_series(
+            framesobelentropies, 'float32')
+
+    return { 'framediffsums': framediffsums,
+             'framesobelentropies': framesobelentropies }
+
+def get_default_capture_metrics(capture):
+    analysis_props = _get_analysis_props(capture.metadata['captureDevice'])
+    return analysis_props['valid_measures']
+
+def _get_capture_metric(capture, metric):
+    analysis_props = _get_analysis_props(capture.metadata['captureDevice'])
+    if metric == 'timetostableframe':
+        return get_stable_frame_time(capture)
+    elif metric == 'uniqueframes':
+        return videocapture.get_num_unique_frames(
+            capture, threshold=analysis_props['animation_threshold'])
+    elif metric == 'fps':
+        return videocapture.get_fps(
+            capture, threshold=analysis_props['animation_threshold'])
+    elif metric == 'checkerboard':
+        return videocapture.get_checkerboarding_area_duration(capture)
+    elif metric == 'overallentropy':
+        return videocapture.get_overall_entropy(
+            capture, sobelized=analysis_props['sobelize'])
+
+    raise Exception("Unknown metric '%s'" % metric)
+
+def get_cached_capture_metrics(capture):
+    '''Returns the metrics previously calculated for a capture by this
+       version of the analyzer'''
+    analysis = capture.get_cache().get('analysis')
+    if analysis and analysis['version'] == ANALYZER_VERSION:
+        return analysis['metrics']
+    return {}
+
+def analyze_capture(capture, metrics, force=False):
+    '''Calculates the given metrics for a capture, caching them alongside
+       it. Anything cached by a different version of the analyzer (or
+       everything, if force is specified) is thrown away and recalculated.'''
+    analysis = capture.get_cache().get('analysis')
+    if force or not analysis or analysis['version'] != ANALYZER_VERSION:
+        # the intermediate results (frame differences, entropies, ...) in
+        # the cache may be stale too
+        if os.path.exists(capture.cache_filename):
+            os.remove(capture.cache_filename)
+        analysis = { 'version': ANALYZER_VERSION, 'metrics': {} }
+
+    missing_metrics = filter(lambda m: m not in analysis['metrics'], metrics)
+    for metric in missing_metrics:
+        analysis['metrics'][metric] = _get_capture_metric(capture, metric)
+
+    if missing_metrics:
+        capture.update_cache({'analysis': analysis})
+
+    return dict(map(lambda m: (m, analysis['metrics'][m]), metrics))
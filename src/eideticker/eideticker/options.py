@@ -6,6 +6,7 @@ import json
 import optparse
 import os
 import videocapture
+from dashboard import DASHBOARD_DIR
 
 
 class OptionParser(optparse.OptionParser):
@@ -21,6 +22,11 @@ class OptionParser(optparse.OptionParser):
                         type="int", dest="port",
                         help="Custom device port (if using SUTAgent or "
                         "adb-over-tcp)", default=None)
+        self.add_option("-s", "--serial", action="store",
+                        type="string", dest="serial",
+                        default=os.environ.get('ANDROID_SERIAL'),
+                        help="Serial number of device to use (adb only, if "
+                        "more than one device is connected)")
         self.add_option("-m", "--dm-type", action="store",
                         type="string", dest="dmtype",
                         default=os.environ.get('DM_TRANS', 'adb'),
@@ -111,3 +117,48 @@ class TestOptionParser(CaptureOptionParser):
                              'using B2G and sync time.')
 
         return (options, args)
+
+
+class DashboardOptionParser(TestOptionParser):
+    '''Custom version of the optionparser with the parameters of the test
+    option parser, plus those for publishing results into a dashboard'''
+
+    def __init__(self, **kwargs):
+        TestOptionParser.__init__(self, **kwargs)
+
+        self.add_option("--enable-profiling",
+                        action="store_true", dest="enable_profiling",
+                        help="Create SPS profile to go along with capture")
+        self.add_option("--apk", action="store", dest="apk",
+                        help="Product apk to get metadata from "
+                        "(Android-specific)")
+        self.add_option("--baseline", action="store_true", dest="baseline",
+                        help="Create baseline results for dashboard")
+        self.add_option("--num-runs", action="store",
+                        type="int", dest="num_runs",
+                        help="number of runs (default: 1)")
+        self.add_option("--no-pipeline", action="store_false",
+                        dest="pipeline", default=True,
+                        help="don't convert and analyze captures in the "
+                        "background while the next run is executing")
+        self.add_option("--app-version", action="store", dest="app_version",
+                        help="Specify app version (if not automatically "
+                        "available; Android-specific)")
+        self.add_option("--sources-xml", action="store", dest="sources_xml",
+                        help="Path to sources XML file for getting revision "
+                        "information (B2G-specific)")
+        self.add_option("--output-dir", action="store",
+                        type="string", dest="outputdir",
+                        default=DASHBOARD_DIR,
+                        help="output results to directory instead of "
+                        "src/dashboard")
+        self.add_option("--spool-dir", action="store",
+                        type="string", dest="spool_dir",
+                        default=os.environ.get('SPOOL_DIR'),
+                        help="instead of analyzing captures here, enqueue "
+                        "them in this directory for bin/analysis-daemon.py")
+        self.add_option("--compact-series", action="store_true",
+                        dest="compact_series",
+                        help="store per-frame series (frame differences, "
+                        "entropies) in run metadata as base64-encoded "
+                        "binary arrays, rather than lists of numbers")
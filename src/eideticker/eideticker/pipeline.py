@@ -0,0 +1,68 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import collections
+from multiprocessing.pool import ThreadPool
+
+DEFAULT_NUM_WORKERS = 1
+
+
+def create_worker_pool(num_workers=DEFAULT_NUM_WORKERS):
+    return ThreadPool(num_workers)
+
+
+class RunPipeline(object):
+    '''Processes test runs (converting and analyzing their captures) in
+       background workers, so the device can move on to the next run in the
+       meantime. Results are always handed to their writer callbacks in the
+       order the runs were submitted, on the calling thread.
+
+       Since each run in flight can hold a large raw capture on disk, at most
+       max_pending runs are queued or being processed at once: submitting
+       another blocks until the oldest one has been written.
+
+       Several pipelines (e.g. one per device, each used from its own
+       thread) can share one set of workers by passing in a pool created
+       with create_worker_pool().'''
+
+    def __init__(self, num_workers=DEFAULT_NUM_WORKERS, max_pending=None,
+                 pool=None):
+        self.owns_pool = pool is None
+        if self.owns_pool:
+            pool = create_worker_pool(num_workers)
+        self.pool = pool
+        self.max_pending = max_pending or num_workers
+        self.pending = collections.deque()
+
+    def submit(self, process, write, *args):
+        '''Call process(*args) in the background, then write(result) once
+           it and all previously submitted runs are done'''
+        while len(self.pending) >= self.max_pending:
+            self._write_next()
+        self.pending.append((self.pool.apply_async(process, args), write))
+        self._write_completed()
+
+    def _write_next(self):
+        (result, write) = self.pending.popleft()
+        # re-raises any exception which happened while processing
+        write(result.get())
+
+    def _write_completed(self):
+        while self.pending and self.pending[0][0].ready():
+            self._write_next()
+
+    def wait(self):
+        '''Wait for all outstanding runs to be processed and written'''
+        while self.pending:
+            self._write_next()
+
+    def finish(self):
+        '''Like wait(), but also shuts down the workers afterwards (unless
+           they were passed in)'''
+        try:
+            self.wait()
+        finally:
+            if self.owns_pool:
+                self.pool.close()
+                self.pool.join()
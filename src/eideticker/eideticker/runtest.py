@@ -6,12 +6,33 @@ import os
 import urllib
 import videocapture
 from log import logger
+from tracing import write_trace
 
 CAPTURE_DIR = os.path.abspath(os.path.join(SRC_DIR, "../captures"))
 GECKO_PROFILER_ADDON_DIR = os.path.join(SRC_DIR, "../src/GeckoProfilerAddon")
 EIDETICKER_TEMP_DIR = "/tmp/eideticker"
 
 
+class PendingCapture(object):
+    '''A capture which has been taken, but not yet converted'''
+
+    def __init__(self, capture_controller, start_frame, end_frame,
+                 on_converted=None):
+        self.capture_controller = capture_controller
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.on_converted = on_converted
+
+    def convert(self):
+        try:
+            self.capture_controller.convert_capture(self.start_frame,
+                                                    self.end_frame)
+        except KeyboardInterrupt:
+            raise TestException("Aborting because of keyboard interrupt")
+        if self.on_converted:
+            self.on_converted()
+
+
 def prepare_test(testkey, device_prefs, wifi_settings_file=None):
     # prepare test logic -- currently only done on b2g
     if device_prefs['devicetype'] == 'b2g':
@@ -56,7 +77,8 @@ def run_test(testkey, capture_device, appname, capture_name,
              actions_log_file=None, log_checkerboard_stats=False,
              extra_env_vars={}, capture_area=None, camera_settings_file=None,
              capture=True, capture_file=None, sync_time=True, fps=None,
-             use_vpxenc=False):
+             use_vpxenc=False, ring_buffer_frames=None, capture_card=None,
+             defer_conversion=False, trace_file=None):
     testinfo = get_testinfo(testkey)
 
     if device_prefs['devicetype'] == 'android' and not appname and \
@@ -98,10 +120,13 @@ def run_test(testkey, capture_device, appname, capture_name,
     if testinfo.get('urlParams'):
         testpath_rel += "?%s" % urllib.quote_plus(testinfo.get('urlParams'))
 
+    timings = videocapture.TimingLog()
     capture_controller = videocapture.CaptureController(
         capture_device, capture_area, custom_tempdir=EIDETICKER_TEMP_DIR,
         fps=fps, use_vpxenc=use_vpxenc,
-        camera_settings_file=camera_settings_file)
+        camera_settings_file=camera_settings_file,
+        ring_buffer_frames=ring_buffer_frames, capture_card=capture_card,
+        timings=timings)
 
     testtype = test_type or testinfo['type']
 
@@ -132,9 +157,11 @@ def run_test(testkey, capture_device, appname, capture_name,
                     gecko_profiler_addon_dir=GECKO_PROFILER_ADDON_DIR,
                     docroot=TEST_DIR,
                     tempdir=EIDETICKER_TEMP_DIR)
+    test.testlog.timings = timings
 
     if device_prefs['devicetype'] == 'b2g':
-        device.restartB2G()
+        with timings.span('b2grestart'):
+            device.restartB2G()
 
         if sync_time or test.requires_wifi:
             # we catch when the user requests synchronized time but doesn't
@@ -145,22 +172,48 @@ def run_test(testkey, capture_device, appname, capture_name,
                 raise Exception("WIFI required for this test but no settings "
                                 "file (-w) provided!")
             wifi_settings = json.loads(open(wifi_settings_file).read())
-            device.connectWIFI(wifi_settings)
+            with timings.span('wifi'):
+                device.connectWIFI(wifi_settings)
     elif device_prefs['devicetype'] == 'android':
         device.killProcess(appname)
 
     # synchronize time unless instructed not to
     if sync_time:
-        device.synchronizeTime()
-
-    test.run()
-    test.cleanup()
+        with timings.span('timesync'):
+            device.synchronizeTime()
+
+    with timings.span('testrun'):
+        test.run()
+        test.cleanup()
+
+    def write_run_trace():
+        frame_timestamps = None
+        if capture_controller.frame_timestamps is not None:
+            frame_timestamps = capture_controller.frame_timestamps.get_entries()
+        write_trace(trace_file, timings=timings,
+                    callbacks={ 'startCapture': test.capture_start_time,
+                                'testStarted': test.test_start_time,
+                                'testFinished': test.test_finish_time,
+                                'endCapture': test.capture_end_time },
+                    actions=test.testlog.actions,
+                    http_requests=test.testlog.http_request_log,
+                    frame_timestamps=frame_timestamps,
+                    test_start_time=test.test_start_time)
+        logger.info("Wrote trace of test run to %s" % trace_file)
 
     if capture_file:
-        try:
-            capture_controller.convert_capture(
-                test.start_frame, test.end_frame)
-        except KeyboardInterrupt:
-            raise TestException("Aborting because of keyboard interrupt")
+        # if asked for, write out a trace once the capture has been
+        # converted (so it includes that too)
+        pending_capture = PendingCapture(
+            capture_controller, test.start_frame, test.end_frame,
+            on_converted=trace_file and write_run_trace)
+        if defer_conversion:
+            # caller is responsible for calling convert() on this before
+            # using the capture
+            test.testlog.pending_capture = pending_capture
+        else:
+            pending_capture.convert()
+    elif trace_file:
+        write_run_trace()
 
     return test.testlog
@@ -0,0 +1,147 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import errno
+import json
+import os
+import shutil
+import tempfile
+
+JOB_SUFFIX = '.json'
+CLAIMED_SUFFIX = '.claimed'
+
+
+def _get_umask():
+    # there's no way to read the umask without setting it (done once, at
+    # import time, before there are other threads to see the change)
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# permissions for files written atomically: what open() would have given
+# them (mkstemp makes them private, but e.g. the dashboard's need to be
+# readable by the web server)
+ATOMIC_FILE_MODE = 0666 & ~_get_umask()
+
+
+def write_file_atomically(path, data):
+    '''Writes data to path such that readers only ever see either the old
+       contents or the complete new ones (even after a crash)'''
+    dirname = os.path.dirname(os.path.abspath(path))
+    (fd, tmppath) = tempfile.mkstemp(dir=dirname, prefix='.',
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmppath, ATOMIC_FILE_MODE)
+        os.rename(tmppath, path)
+    except:
+        os.unlink(tmppath)
+        raise
+
+
+def copy_file_atomically(source, dest):
+    dirname = os.path.dirname(os.path.abspath(dest))
+    (fd, tmppath) = tempfile.mkstemp(dir=dirname, prefix='.',
+                                     suffix='.tmp')
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmppath)
+        os.chmod(tmppath, ATOMIC_FILE_MODE)
+        os.rename(tmppath, dest)
+    except:
+        os.unlink(tmppath)
+        raise
+
+
+class Spool(object):
+    '''A directory of jobs waiting to be processed (a local stand-in for a
+       shared queue). A job is a json file, plus any number of data files
+       named after it (<jobid>.<suffix>) which are added before the job
+       itself is enqueued.
+
+       Everything is written under a temporary name and renamed into place,
+       and jobs are claimed by renaming them, so several producers and
+       consumers (possibly on different machines sharing the directory) can
+       use a spool at once.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.failed_path = os.path.join(path, 'failed')
+        for dirname in [self.path, self.failed_path]:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+    def get_path(self, jobid, suffix=JOB_SUFFIX):
+        return os.path.join(self.path, jobid + suffix)
+
+    def add_file(self, jobid, suffix, source):
+        '''Copies a data file for a job into the spool (should be done before
+           enqueuing the job)'''
+        dest = self.get_path(jobid, suffix)
+        copy_file_atomically(source, dest)
+        return dest
+
+    def enqueue(self, jobid, job):
+        write_file_atomically(self.get_path(jobid), json.dumps(job))
+
+    def claim(self, max_jobs=None):
+        '''Claims the oldest jobs currently in the spool (up to max_jobs, if
+           specified), returning a list of (jobid, job) pairs'''
+        jobids = []
+        for fname in os.listdir(self.path):
+            if fname.startswith('.') or not fname.endswith(JOB_SUFFIX):
+                continue
+            jobid = fname[:-len(JOB_SUFFIX)]
+            try:
+                mtime = os.path.getmtime(self.get_path(jobid))
+            except OSError:
+                # claimed by someone else in the meantime
+                continue
+            jobids.append((mtime, jobid))
+
+        claimed = []
+        for (mtime, jobid) in sorted(jobids):
+            if max_jobs and len(claimed) >= max_jobs:
+                break
+            claimed_path = self.get_path(jobid, CLAIMED_SUFFIX)
+            try:
+                os.rename(self.get_path(jobid), claimed_path)
+            except OSError, e:
+                if e.errno == errno.ENOENT:
+                    continue
+                raise
+            claimed.append((jobid, json.loads(open(claimed_path).read())))
+
+        return claimed
+
+    def requeue_claimed(self):
+        '''Puts back any jobs which were claimed but never completed (e.g.
+           because whoever claimed them was killed)'''
+        for fname in os.listdir(self.path):
+            if fname.endswith(CLAIMED_SUFFIX):
+                jobid = fname[:-len(CLAIMED_SUFFIX)]
+                os.rename(self.get_path(jobid, CLAIMED_SUFFIX),
+                          self.get_path(jobid))
+
+    def _get_job_files(self, jobid):
+        return filter(lambda fname: fname.startswith(jobid + '.'),
+                      os.listdir(self.path))
+
+    def complete(self, jobid):
+        '''Removes a claimed job and whatever is left of its data files'''
+        for fname in self._get_job_files(jobid):
+            os.unlink(os.path.join(self.path, fname))
+
+    def fail(self, jobid, error=None):
+        '''Moves a claimed job and its data files out of the way, along with
+           a description of what went wrong'''
+        for fname in self._get_job_files(jobid):
+            os.rename(os.path.join(self.path, fname),
+                      os.path.join(self.failed_path, fname))
+        if error:
+            write_file_atomically(os.path.join(self.failed_path,
+                                               jobid + '.log'), error)
@@ -10,13 +10,10 @@ import time
 import imp
 import os
 import re
+import threading
 import manifestparser
-from gaiatest.gaia_test import GaiaApps
 from log import LoggingMixin
 
-from marionette.errors import NoSuchElementException
-from marionette.by import By
-
 SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 TEST_DIR = os.path.abspath(os.path.join(SRC_DIR, "tests"))
 
@@ -34,6 +31,10 @@ class TestLog(object):
     actions = None
     http_request_log = None
     checkerboard_percent_totals = None
+    # capture waiting to be converted (if conversion was deferred)
+    pending_capture = None
+    # how long each stage of the run took (a videocapture.TimingLog)
+    timings = None
 
     def getdict(self):
         logdict = {}
@@ -131,7 +132,11 @@ class Test(LoggingMixin):
     requires_wifi = False
     start_frame = None
     end_frame = None
-    testlog = TestLog()
+    # host times at which the various callbacks were received
+    capture_start_time = None
+    capture_end_time = None
+    test_start_time = None
+    test_finish_time = None
 
     def __init__(self, testinfo, testpath_rel=None, device=None,
                  capture_file=None,
@@ -149,6 +154,12 @@ class Test(LoggingMixin):
         self.tempdir = tempdir
         self.track_start_frame = track_start_frame
         self.track_end_frame = track_end_frame
+        # one log per test, so logs of earlier runs are left untouched (they
+        # may still be being processed in the background)
+        self.testlog = TestLog()
+        # set when the capture is finished (end_capture may be called from
+        # the http server's thread, so we can't just check a flag)
+        self.capture_finished_event = threading.Event()
 
     def cleanup(self):
         pass
@@ -159,13 +170,9 @@ class Test(LoggingMixin):
             timeout = int(self.capture_timeout)
         else:
             timeout = 100
-        timer = 0
-        interval = 0.1
 
         try:
-            while not self.finished_capture and timer < timeout:
-                time.sleep(interval)
-                timer += interval
+            self.capture_finished_event.wait(timeout)
         except KeyboardInterrupt:
             self.end_capture()
             raise Exception("Aborted test")
@@ -192,23 +199,30 @@ class Test(LoggingMixin):
 
     def end_capture(self):
         # callback indicating we should terminate the capture
+        self.capture_end_time = time.time()
         self.log("Ending capture")
         self.finished_capture = True
         if self.capture_file:
             self.capture_controller.terminate_capture()
+        self.capture_finished_event.set()
 
     def test_started(self):
-        # callback indicating test has started
+        # callback indicating test has started: take the time first thing,
+        # and use it to look up the frame that was current then (rather than
+        # whichever one happens to be current after we get around to asking)
+        self.test_start_time = time.time()
         if self.capture_file and self.track_start_frame:
-            self.start_frame = self.capture_controller.capture_framenum()
+            self.start_frame = self.capture_controller.capture_framenum(
+                self.test_start_time)
 
-        self.test_start_time = time.time()
         self.log("Test started callback (framenum: %s)" % self.start_frame)
 
     def test_finished(self):
         # callback indicating test has finished
+        self.test_finish_time = time.time()
         if self.capture_file and self.track_end_frame:
-            self.end_frame = self.capture_controller.capture_framenum()
+            self.end_frame = self.capture_controller.capture_framenum(
+                self.test_finish_time)
             # we don't need to find the end frame if we're slated to get the
             # start one...
             if self.capture_controller.find_start_signal:
@@ -519,6 +533,7 @@ class B2GAppActionTest(B2GAppTest):
         # (this is a naive implementation that just assumes that we're done
         # "loading" after 5 seconds -- feel free to override this method in
         # your test)
+        from gaiatest.gaia_test import GaiaApps
         apps = GaiaApps(self.device.marionette)
         app = apps.launch(self.appname)
         assert app.frame_id is not None
@@ -547,6 +562,8 @@ class B2GAppStartupTest(B2GAppTest):
 
     def run(self):
         from gaiatest.apps.homescreen.app import Homescreen
+        from marionette.by import By
+        from marionette.errors import NoSuchElementException
         homescreen = Homescreen(self.device.marionette)
         self.device.gaiaApps.switch_to_displayed_app()  # switch to homescreen
         appicon = None
@@ -0,0 +1,267 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# The datapoints for a test on a device in the dashboard. Rather than one
+# json file with the test's whole history (which had to be rewritten after
+# every run, and downloaded in full to show anything at all), they're kept
+# in one append-only shard per month (of the build date):
+#
+#   <device>/<test>/<YYYY-MM>.jsonl  a json [product, appdate, datapoint]
+#                                    list per line
+#   <device>/<test>/manifest.json    {"shards": [{"name": <YYYY-MM>,
+#                                    "count": <datapoints>}, ...]}, oldest
+#                                    first
+#   <device>/<test>/<YYYY-MM>.summary.json
+#                                    {"builds": {product: {appdate:
+#                                    <summary>}}}, aggregates of the
+#                                    datapoints of each build in the
+#                                    shard (see get_build_summary)
+#
+# so the dashboard only has to fetch the summaries of the months it's
+# graphing, and the shards of those it's looking at in detail.
+
+import json
+import math
+import os
+import time
+from spool import write_file_atomically
+
+MANIFEST_FILENAME = 'manifest.json'
+SHARD_SUFFIX = '.jsonl'
+SUMMARY_SUFFIX = '.summary.json'
+# aggregates in summaries are only given to this many significant digits
+SUMMARY_SIGNIFICANT_DIGITS = 4
+
+
+def get_testdata_dir(outputdir, device_id, testkey):
+    return os.path.join(outputdir, device_id, testkey)
+
+
+def get_legacy_datafile(datadir):
+    # where all of a test's data used to be kept
+    return datadir + '.json'
+
+
+def get_shard_name(appdate):
+    '''Returns the shard for a build date (a unix timestamp or, for some
+       android builds, a YYYY-MM-DD date)'''
+    try:
+        return time.strftime('%Y-%m', time.gmtime(float(appdate)))
+    except ValueError:
+        return str(appdate)[:7]
+
+
+def read_manifest(datadir):
+    try:
+        with open(os.path.join(datadir, MANIFEST_FILENAME)) as f:
+            return json.loads(f.read())
+    except IOError:
+        return {'shards': []}
+
+
+def _add_to_manifest(manifest, shard_name, count):
+    shards = dict((shard['name'], shard) for shard in manifest['shards'])
+    shard = shards.setdefault(shard_name, {'name': shard_name, 'count': 0})
+    shard['count'] += count
+    manifest['shards'] = sorted(shards.values(),
+                                key=lambda shard: shard['name'])
+
+
+def read_shard(datadir, shard_name):
+    '''Returns the [product, appdate, datapoint] entries in a shard'''
+    entries = []
+    try:
+        with open(os.path.join(datadir, shard_name + SHARD_SUFFIX)) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # the end of a write that never finished
+                    print "WARNING: Skipping bad line in shard %s of %s" % (
+                        shard_name, datadir)
+    except IOError:
+        pass
+
+    return entries
+
+
+def read_testdata(datadir, shard_names=None):
+    '''Returns a test's data in the same form it's always been in the
+       dashboard ({product: {appdate: [datapoint, ...]}}), from all shards
+       or just the given ones'''
+    if not os.path.isfile(os.path.join(datadir, MANIFEST_FILENAME)):
+        legacy_datafile = get_legacy_datafile(datadir)
+        if os.path.isfile(legacy_datafile):
+            with open(legacy_datafile) as f:
+                return json.loads(f.read())['testdata']
+        return {}
+
+    if shard_names is None:
+        shard_names = [shard['name'] for shard in
+                       read_manifest(datadir)['shards']]
+    testdata = {}
+    for shard_name in shard_names:
+        for (productname, appdate, datapoint) in read_shard(datadir,
+                                                            shard_name):
+            testdata.setdefault(productname, {}).setdefault(
+                appdate, []).append(datapoint)
+
+    return testdata
+
+
+def _get_percentile(sorted_values, percent):
+    # interpolating between the closest values
+    position = (len(sorted_values) - 1) * percent / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] -
+                                   sorted_values[lower]) * (position - lower)
+
+
+def _round(value):
+    return float('%.*g' % (SUMMARY_SIGNIFICANT_DIGITS, value))
+
+
+def get_aggregate(values):
+    '''Returns the count, mean, median, (population) standard deviation,
+       minimum and maximum of a list of values (rounded to
+       SUMMARY_SIGNIFICANT_DIGITS)'''
+    values = sorted(values)
+    mean = sum(values) / float(len(values))
+    return { 'count': len(values),
+             'mean': _round(mean),
+             'median': _round(_get_percentile(values, 50)),
+             'stddev': _round(math.sqrt(sum((value - mean) ** 2 for value in
+                                            values) / len(values))),
+             'min': _round(values[0]),
+             'max': _round(values[-1]) }
+
+
+def get_build_summary(datapoints):
+    '''Returns the aggregates (see get_aggregate) of each metric over the
+       datapoints for a build, each with the uuid of the datapoint closest
+       to the median (to show when looking at the build), and whether any
+       of them was a baseline'''
+    values = {}
+    for datapoint in datapoints:
+        for (metric, value) in datapoint.items():
+            if isinstance(value, (int, long, float)) and \
+                    not isinstance(value, bool):
+                values.setdefault(metric, []).append((value,
+                                                      datapoint.get('uuid')))
+
+    summary = { 'metrics': {} }
+    for (metric, metric_values) in values.items():
+        aggregate = get_aggregate([value for (value, uuid) in metric_values])
+        aggregate['uuid'] = min(metric_values, key=lambda (value, uuid):
+                                    abs(value - aggregate['median']))[1]
+        summary['metrics'][metric] = aggregate
+    if any(datapoint.get('baseline') for datapoint in datapoints):
+        summary['baseline'] = True
+
+    return summary
+
+
+def read_summary(datadir, shard_name):
+    try:
+        with open(os.path.join(datadir, shard_name + SUMMARY_SUFFIX)) as f:
+            return json.loads(f.read())
+    except IOError:
+        return None
+
+
+def _write_summary(datadir, shard_name, entries):
+    builds = {}
+    for (productname, appdate, datapoint) in entries:
+        builds.setdefault(productname, {}).setdefault(appdate, []).append(
+            datapoint)
+    for appdates in builds.values():
+        for (appdate, datapoints) in appdates.items():
+            appdates[appdate] = get_build_summary(datapoints)
+    write_file_atomically(os.path.join(datadir, shard_name + SUMMARY_SUFFIX),
+                          json.dumps({'builds': builds},
+                                     separators=(',', ':')))
+
+
+def update_summary(datadir, shard_name):
+    '''Recalculates the summary of the builds in a shard (only ever a
+       month's worth of datapoints)'''
+    _write_summary(datadir, shard_name, read_shard(datadir, shard_name))
+
+
+def write_testdata(datadir, testdata):
+    '''Replaces all of a test's data (for migrating it, or removing
+       entries: normally datapoints are only ever appended)'''
+    if not os.path.isdir(datadir):
+        os.makedirs(datadir)
+
+    shards = {}
+    for (productname, appdates) in sorted(testdata.items()):
+        for (appdate, datapoints) in sorted(appdates.items()):
+            for datapoint in datapoints:
+                shards.setdefault(get_shard_name(appdate), []).append(
+                    [productname, appdate, datapoint])
+
+    manifest = {'shards': []}
+    for (shard_name, entries) in shards.items():
+        write_file_atomically(os.path.join(datadir, shard_name +
+                                           SHARD_SUFFIX),
+                              ''.join(json.dumps(entry) + '\n' for entry in
+                                      entries))
+        _write_summary(datadir, shard_name, entries)
+        _add_to_manifest(manifest, shard_name, len(entries))
+    write_file_atomically(os.path.join(datadir, MANIFEST_FILENAME),
+                          json.dumps(manifest))
+
+    for filename in os.listdir(datadir):
+        for suffix in [SHARD_SUFFIX, SUMMARY_SUFFIX]:
+            if filename.endswith(suffix) and \
+                    filename[:-len(suffix)] not in shards:
+                os.remove(os.path.join(datadir, filename))
+
+
+def migrate_testdata(datadir):
+    '''Splits a test's data file from before it was sharded into shards (if
+       that hasn't happened yet), keeping the original as a backup'''
+    legacy_datafile = get_legacy_datafile(datadir)
+    if os.path.isfile(os.path.join(datadir, MANIFEST_FILENAME)) or \
+            not os.path.isfile(legacy_datafile):
+        return
+
+    print "Migrating %s to shards in %s" % (legacy_datafile, datadir)
+    write_testdata(datadir, read_testdata(datadir))
+    os.rename(legacy_datafile, legacy_datafile + '.bak')
+
+
+def append_datapoint(datadir, productname, appdate, datapoint):
+    '''Adds a datapoint to a test's data, only touching the shard for its
+       build date, the manifest and the summary (see DashboardStore for
+       doing so safely alongside other writers)'''
+    migrate_testdata(datadir)
+    if not os.path.isdir(datadir):
+        os.makedirs(datadir)
+
+    # the shard is written first: if we're interrupted before the manifest
+    # is updated, a new shard just won't be listed until the next datapoint
+    # goes into it
+    appdate = str(appdate)
+    shard_name = get_shard_name(appdate)
+    shard_path = os.path.join(datadir, shard_name + SHARD_SUFFIX)
+    line = json.dumps([productname, appdate, datapoint]) + '\n'
+    if os.path.isfile(shard_path) and os.path.getsize(shard_path):
+        with open(shard_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != '\n':
+                # don't run on from the end of a write that never finished
+                line = '\n' + line
+    with open(shard_path, 'a') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+    manifest = read_manifest(datadir)
+    _add_to_manifest(manifest, shard_name, 1)
+    write_file_atomically(os.path.join(datadir, MANIFEST_FILENAME),
+                          json.dumps(manifest))
+    update_summary(datadir, shard_name)
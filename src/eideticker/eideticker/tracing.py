@@ -0,0 +1,85 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Exports what happened during a test run as a trace event file (see
+# https://github.com/catapult-project/catapult/wiki/Trace-Event-Format),
+# which can be loaded into about:tracing / chrome://tracing
+
+import json
+
+HOST_PID = 1
+DEVICE_PID = 2
+
+# (pid, tid, name) of each track in the trace
+STAGES_TRACK = (HOST_PID, 1, 'Harness stages')
+CALLBACKS_TRACK = (HOST_PID, 2, 'Test callbacks')
+HTTP_TRACK = (HOST_PID, 3, 'HTTP requests')
+ACTIONS_TRACK = (DEVICE_PID, 1, 'Device actions')
+
+
+def _get_us(t):
+    return int(t * 1000000)
+
+
+def _get_event(track, name, ph, start, **kwargs):
+    (pid, tid, trackname) = track
+    return dict({ 'name': name, 'ph': ph, 'ts': _get_us(start), 'pid': pid,
+                  'tid': tid }, **kwargs)
+
+
+def get_trace_events(timings=None, callbacks={}, actions=None,
+                     http_requests=None, frame_timestamps=None,
+                     test_start_time=None):
+    '''Gets trace events for a test run. timings is a TimingLog,
+       callbacks a dict of callback names to the (host) times they were
+       received and frame_timestamps a list of (frame number, time) pairs.
+       Action and HTTP request times are taken to be relative to
+       test_start_time, as they are in the test log.'''
+    events = []
+    for (pid, name) in [(HOST_PID, 'Host'), (DEVICE_PID, 'Device')]:
+        events.append({ 'name': 'process_name', 'ph': 'M', 'pid': pid,
+                        'args': { 'name': name } })
+    for (pid, tid, name) in [STAGES_TRACK, CALLBACKS_TRACK, HTTP_TRACK,
+                             ACTIONS_TRACK]:
+        events.append({ 'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                        'tid': tid, 'args': { 'name': name } })
+
+    if timings:
+        for span in timings.spans:
+            events.append(_get_event(STAGES_TRACK, span['name'], 'X',
+                                     span['start'], cat='stage',
+                                     dur=_get_us(span['duration'])))
+
+    for (name, t) in callbacks.items():
+        if t is not None:
+            events.append(_get_event(CALLBACKS_TRACK, name, 'i', t,
+                                     cat='callback', s='p'))
+
+    if test_start_time is not None:
+        for action in actions or []:
+            events.append(_get_event(ACTIONS_TRACK, action['type'], 'X',
+                                     test_start_time + action['start'],
+                                     cat='action',
+                                     dur=_get_us(action['end'] -
+                                                 action['start']),
+                                     args={ 'params': action.get('params') }))
+        for request in http_requests or []:
+            events.append(_get_event(HTTP_TRACK, request.get('path', ''), 'i',
+                                     test_start_time + request['time'],
+                                     cat='http', s='t',
+                                     args={ 'method':
+                                                request.get('method') }))
+
+    for (framenum, t) in frame_timestamps or []:
+        events.append(_get_event(STAGES_TRACK, 'Capture frame', 'C', t,
+                                 cat='capture', args={ 'frame': framenum }))
+
+    return events
+
+
+def write_trace(filename, **kwargs):
+    '''Writes a trace event file (see get_trace_events for arguments)'''
+    with open(filename, 'w') as f:
+        f.write(json.dumps({ 'traceEvents': get_trace_events(**kwargs),
+                             'displayTimeUnit': 'ms' }))
@@ -1,6 +1,7 @@
 function displayFrameDiffs(captureId, minFrameNum, maxFrameNum, threshold) {
   resourceCache.get('api/captures/' + captureId, function(captureSummary) {
-    resourceCache.get('api/captures/' + captureId + '/framediff', function(frameDiffs) {
+    resourceCache.get('api/captures/' + captureId + '/framediff?encoding=base64', function(frameDiffsSeries) {
+      var frameDiffs = decodeSeries(frameDiffsSeries);
       var i = 1;
       var groups = [ { start: 1 } ];
       var lastUnique = false;
@@ -166,7 +167,8 @@ function getFrameViews(captureId, captureSummary, frameDiffs, minFrameNum, maxFr
 
 function displayCheckerboard(captureId, captureSummary) {
   resourceCache.get('api/captures/' + captureId + '/checkerboard', function(checkerboardSummary) {
-    resourceCache.get('api/captures/' + captureId + '/framediff', function(frameDiffs) {
+    resourceCache.get('api/captures/' + captureId + '/framediff?encoding=base64', function(frameDiffsSeries) {
+      var frameDiffs = decodeSeries(frameDiffsSeries);
 
       $("#maincontent").html(ich.checkerboard_summary({
         checkerboardAreaDuration: checkerboardSummary.areaDuration,
@@ -288,7 +290,8 @@ $(function() {
             $("#maincontent").html(ich.loading_screen({}));
             $("#loading_element").spin();
 
-            resourceCache.get('api/captures/' + captureId + '/framediff', function(framediffs) {
+            resourceCache.get('api/captures/' + captureId + '/framediff?encoding=base64', function(framediffsSeries) {
+              var framediffs = decodeSeries(framediffsSeries);
               $("#maincontent").html(ich.framediff_summary({}));
               var uniqueFrames = framediffs.reduce(function(prev, curr, i, a) {
                 if (curr > threshold ) {
@@ -9,14 +9,26 @@ var resourceCache = {
         this.cbs[resourceURL] = [cb];
         var that = this;
 
-        $.getJSON(resourceURL, function(data) {
-          that.urlCache[resourceURL] = data;
-          that.cbs[resourceURL].forEach(function(cb) {
-            cb(data);
-          });
+        var fetch = function() {
+          $.getJSON(resourceURL, function(data, textStatus, jqXHR) {
+            if (jqXHR.status === 202) {
+              // still being calculated on the server: try again shortly
+              setTimeout(fetch, 1000);
+              return;
+            }
+            that.urlCache[resourceURL] = data;
+            that.cbs[resourceURL].forEach(function(cb) {
+              cb(data);
+            });
 
-          that.cbs[resourceURL] = [];
-        });
+            that.cbs[resourceURL] = [];
+          }).fail(function() {
+            // e.g. the analysis failed on the server: stop polling (asking
+            // for it again will start over)
+            delete that.cbs[resourceURL];
+          });
+        };
+        fetch();
       } else {
         this.cbs[resourceURL][this.cbs[resourceURL].length] = cb;
       }
@@ -26,6 +38,30 @@ var resourceCache = {
   cbs: {}
 };
 
+// per-frame series may be stored as a list of numbers, or (more compactly)
+// as a base64-encoded little-endian typed array (see
+// videocapture.encode_series). Either way, returns something array-like.
+function decodeSeries(series) {
+  if (!series || !series.encoding) {
+    return series;
+  }
+
+  var bytes = atob(series.data);
+  var view = new DataView(new ArrayBuffer(bytes.length));
+  for (var i = 0; i < bytes.length; i++) {
+    view.setUint8(i, bytes.charCodeAt(i));
+  }
+
+  var values = (series.type === 'float32') ?
+    new Float32Array(series.length) : new Uint32Array(series.length);
+  for (var i = 0; i < series.length; i++) {
+    values[i] = (series.type === 'float32') ?
+      view.getFloat32(i * 4, true) : view.getUint32(i * 4, true);
+  }
+
+  return values;
+}
+
 function getTimeStr(seconds) {
   var minutes = Math.floor(seconds / 60);
   var seconds = (seconds - (minutes * 60)).toFixed(2);
@@ -63,6 +99,12 @@ function getCaptureThumbnailImageURL(captureId, captureSummary, frameNum, params
   return getCaptureImageURL(captureId, frameNum, params);
 }
 
+// a single image of frames start, start+step, ... end of a capture, each
+// params.width pixels wide, in rows of params.columns frames
+function getFilmstripURL(captureId, params) {
+  return "api/captures/" + captureId + "/filmstrip?" + getParamStr(params);
+}
+
 function getFrameDiffImageURL(captureId, frameNum1, frameNum2, params) {
   return "api/captures/" + captureId + "/framediff/images/" +
     frameNum1 + '-' + frameNum2 + "?" + getParamStr(params);
@@ -0,0 +1,51 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Keeps the most recently used captures open, so that requests for (say)
+# successive frames of a capture don't each have to reopen it
+
+import collections
+import os
+import threading
+import videocapture
+
+DEFAULT_MAX_CAPTURES = 16
+
+
+class CaptureCache(object):
+
+    def __init__(self, max_captures=DEFAULT_MAX_CAPTURES):
+        self.max_captures = max_captures
+        # (filename, mtime) -> capture, least recently used first
+        self._captures = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        '''Returns an open capture for filename, reopening it if the file
+           has changed since it was last opened'''
+        try:
+            key = (filename, os.path.getmtime(filename))
+        except OSError:
+            raise videocapture.BadCapture("Capture file '%s' does not "
+                                          "exist!" % filename)
+
+        with self._lock:
+            capture = self._captures.pop(key, None)
+            if capture:
+                self._captures[key] = capture
+                return capture
+
+        # opening a capture may take a while, so don't hold up other
+        # requests while doing it (at worst two requests open the same one)
+        capture = videocapture.Capture(filename)
+
+        with self._lock:
+            for old_key in self._captures.keys():
+                if old_key[0] == filename:
+                    del self._captures[old_key]
+            self._captures[key] = capture
+            while len(self._captures) > self.max_captures:
+                self._captures.popitem(last=False)
+
+        return capture
@@ -0,0 +1,189 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# A catalog (in sqlite) of the captures in a directory, so that they can be
+# listed without opening every one of them. Entries are refreshed whenever
+# a capture's modification time or size changes.
+
+import json
+import os
+import sqlite3
+import threading
+import videocapture
+
+SCHEMA_VERSION = 1
+
+# metadata which captures can be filtered by
+FILTER_FIELDS = ['app', 'device', 'devicetype', 'name', 'testpath']
+
+
+class CaptureCatalog(object):
+
+    def __init__(self, capture_dir, filename=None, on_update=None):
+        self.capture_dir = capture_dir
+        # called with the captures added or changed by each update
+        self.on_update = on_update
+        if not filename:
+            filename = os.path.join(capture_dir, '.catalog.sqlite')
+        self.filename = filename
+        self._update_lock = threading.Lock()
+
+        conn = self._connect()
+        try:
+            with conn:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version != SCHEMA_VERSION:
+                    conn.execute("DROP TABLE IF EXISTS captures")
+                conn.execute("CREATE TABLE IF NOT EXISTS captures ("
+                             "filename TEXT PRIMARY KEY, mtime REAL, "
+                             "size INTEGER, numFrames INTEGER, "
+                             "width INTEGER, height INTEGER, date TEXT, %s, "
+                             "metadata TEXT, error TEXT)" % ", ".join(
+                                 map(lambda f: "%s TEXT" % f,
+                                     FILTER_FIELDS)))
+                conn.execute("CREATE INDEX IF NOT EXISTS captures_date ON "
+                             "captures (date)")
+                conn.execute("PRAGMA user_version = %s" % SCHEMA_VERSION)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # sqlite connections can't be shared between threads, and the
+        # webapp may handle each request in its own
+        conn = sqlite3.connect(self.filename, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _get_row(self, filename, stat):
+        row = { 'filename': filename, 'mtime': stat.st_mtime,
+                'size': stat.st_size, 'numFrames': 0, 'width': None,
+                'height': None, 'date': None, 'metadata': None,
+                'error': None }
+        for field in FILTER_FIELDS:
+            row[field] = None
+
+        try:
+            capture = videocapture.Capture(os.path.join(self.capture_dir,
+                                                        filename))
+        except videocapture.BadCapture, error:
+            print "File %s unreadable: %s" % (filename, str(error))
+            row['error'] = str(error)
+            return row
+
+        row['numFrames'] = capture.num_frames
+        if capture.num_frames > 0:
+            (row['width'], row['height']) = capture.dimensions
+        row['date'] = capture.metadata.get('date')
+        row['metadata'] = json.dumps(capture.metadata)
+        for field in FILTER_FIELDS:
+            if capture.metadata.get(field) is not None:
+                row[field] = unicode(capture.metadata[field])
+
+        return row
+
+    def update(self, filenames=None):
+        '''Brings the catalog up to date with the capture directory (or
+           just the given captures in it), returning the readable captures
+           which were added or changed'''
+        with self._update_lock:
+            conn = self._connect()
+            try:
+                known = {}
+                for row in conn.execute("SELECT filename, mtime, size FROM "
+                                        "captures"):
+                    if filenames is None or row['filename'] in filenames:
+                        known[row['filename']] = (row['mtime'], row['size'])
+
+                if filenames is None:
+                    filenames = os.listdir(self.capture_dir)
+
+                changed = []
+                present = set()
+                for filename in filenames:
+                    if os.path.splitext(filename)[1] != '.zip':
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(self.capture_dir,
+                                                    filename))
+                    except OSError:
+                        # removed while we were looking
+                        continue
+                    present.add(filename)
+                    if known.get(filename) != (stat.st_mtime, stat.st_size):
+                        changed.append(self._get_row(filename, stat))
+
+                removed = set(known.keys()) - present
+                with conn:
+                    for filename in removed:
+                        conn.execute("DELETE FROM captures WHERE filename=?",
+                                     (filename,))
+                    for row in changed:
+                        columns = sorted(row.keys())
+                        conn.execute("INSERT OR REPLACE INTO captures (%s) "
+                                     "VALUES (%s)" % (
+                                         ", ".join(columns),
+                                         ", ".join(["?"] * len(columns))),
+                                     map(lambda c: row[c], columns))
+            finally:
+                conn.close()
+
+        updated = map(lambda row: row['filename'],
+                      filter(lambda row: not row['error'], changed))
+        if updated and self.on_update:
+            self.on_update(updated)
+
+        return updated
+
+    def _get_capture(self, row):
+        return dict({ 'id': row['filename'],
+                      'length': row['numFrames'] / 60.0,
+                      'numFrames': row['numFrames'],
+                      'filename': row['filename'] },
+                    **json.loads(row['metadata']))
+
+    def get_capture(self, filename):
+        '''Returns the catalog entry for a (readable) capture, or None'''
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM captures WHERE filename=? AND "
+                               "error IS NULL", (filename,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return self._get_capture(row)
+
+    def get_captures(self, filters={}, after=None, before=None, offset=0,
+                     limit=None):
+        '''Returns the total number of readable captures with at least one
+           frame matching the given filters (a dict of field name -> value,
+           fields being one of FILTER_FIELDS) and dates (ISO 8601 strings),
+           along with a page of those captures in date order'''
+        clauses = ["error IS NULL", "numFrames > 0"]
+        params = []
+        for (field, value) in filters.items():
+            if field not in FILTER_FIELDS:
+                raise ValueError("Can't filter captures by '%s'" % field)
+            clauses.append("%s=?" % field)
+            params.append(value)
+        if after:
+            clauses.append("date>=?")
+            params.append(after)
+        if before:
+            clauses.append("date<?")
+            params.append(before)
+        where = " AND ".join(clauses)
+
+        conn = self._connect()
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM captures WHERE %s" %
+                                 where, params).fetchone()[0]
+            rows = conn.execute("SELECT * FROM captures WHERE %s ORDER BY "
+                                "date LIMIT ? OFFSET ?" % where,
+                                params + [limit if limit is not None else -1,
+                                          offset]).fetchall()
+        finally:
+            conn.close()
+
+        return (total, map(self._get_capture, rows))
@@ -1,157 +1,452 @@
+import StringIO
+import json
+import multiprocessing
 import templeton
 import os
 import web
 import videocapture
 
+from capturecache import CaptureCache
+from catalog import CaptureCatalog, FILTER_FIELDS
+from imagecache import ImageCache
+from jobs import AnalysisJobs, is_analysis_cached
+from multiprocessing.pool import ThreadPool
+import videostream
+from watcher import CaptureWatcher
 from PIL import Image
 
 CAPTURE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
                                            "../../../../../captures"))
 
+catalog = CaptureCatalog(CAPTURE_DIR)
+capture_cache = CaptureCache()
+image_cache = ImageCache(os.path.join(CAPTURE_DIR, '.images'))
+analysis_jobs = AnalysisJobs(capture_cache.get)
+# for decoding frames in parallel
+frame_pool = ThreadPool(multiprocessing.cpu_count())
+
+# most frames a single filmstrip may contain
+MAX_FILMSTRIP_FRAMES = 500
+DEFAULT_FILMSTRIP_WIDTH = 160
+# widest a filmstrip's frames may be scaled to, and biggest a filmstrip may
+# be in all (each frame is held in memory, scaled, while it's put together)
+MAX_FILMSTRIP_WIDTH = 1920
+MAX_FILMSTRIP_PIXELS = 32 * 1024 * 1024
+# (start, end, step, width, columns)
+DEFAULT_FILMSTRIP_PARAMS = (0, -1, 1, DEFAULT_FILMSTRIP_WIDTH,
+                            videocapture.DEFAULT_FILMSTRIP_COLUMNS)
+
+# analyses which can be run in the background, as (key of their results in
+# the capture's cache, function(capture, progress))
+ANALYSES = {
+    'framediff': ('diffsums',
+                  lambda capture, progress: videocapture.get_framediff_sums(
+                      capture, progress=progress)),
+    'checkerboard': ('checkerboard_percents',
+                     lambda capture, progress: \
+                         videocapture.get_checkerboarding_percents(
+                             capture, progress=progress)),
+    'entropy': ('frame_entropies',
+                lambda capture, progress: videocapture.get_frame_entropies(
+                    capture, progress=progress))
+}
+
+# the frame the first value of each analysis' series is for
+SERIES_FIRST_FRAMES = { 'checkerboard': 1 }
+DEFAULT_SERIES_WIDTH = 500
+MAX_SERIES_WIDTH = 10000
+MAX_HEATMAP_BLOCK_SIZE = 64
+
+
+def render_filmstrip(capture, start, end, step, width, columns):
+    if end < 0 or end > capture.num_frames:
+        end = capture.num_frames
+    framenums = range(start, end + 1, step)[:MAX_FILMSTRIP_FRAMES]
+    if not framenums:
+        raise ValueError("No frames in filmstrip")
+    (frame_width, frame_height) = videocapture.get_filmstrip_dimensions(
+        capture, width)
+    columns = min(columns, len(framenums))
+    rows = (len(framenums) + columns - 1) / columns
+    if frame_width * columns * frame_height * rows > MAX_FILMSTRIP_PIXELS:
+        raise ValueError("Filmstrip too big")
+    return videocapture.get_filmstrip_image(capture, framenums, width,
+                                            columns=columns, pool=frame_pool)
+
+
+def prerender_filmstrip(capture, progress):
+    image_cache.get_image(capture.filename,
+                          ('filmstrip',) + DEFAULT_FILMSTRIP_PARAMS,
+                          lambda: render_filmstrip(capture,
+                                                   *DEFAULT_FILMSTRIP_PARAMS))
+
+
+def precompute(filenames):
+    '''Queues up analysis of new captures (and rendering of their default
+       filmstrips) in the background, so they're ready by the time anyone
+       looks at them'''
+    for filename in filenames:
+        path = os.path.join(CAPTURE_DIR, filename)
+        for analysis in sorted(ANALYSES.keys()):
+            analysis_jobs.submit(analysis, ANALYSES[analysis][1], path,
+                                 background=True)
+        analysis_jobs.submit('filmstrip', prerender_filmstrip, path,
+                             background=True)
+
+catalog.on_update = precompute
+# notices captures as they arrive (see server.py)
+watcher = CaptureWatcher(catalog)
+
+
+def _get_thumbnail_size(thumbnail):
+    params, body = templeton.handlers.get_request_parms()
+    (width, height) = (params.get('width'), params.get('height'))
+    if not thumbnail or not (width and height):
+        return None
+    return (int(width[0]), int(height[0]))
+
+
+def is_image_cached(name, key, thumbnail=True):
+    '''Returns whether the image get_image_response would return has already
+       been rendered'''
+    size = _get_thumbnail_size(thumbnail)
+    if size:
+        key = tuple(key) + size
+    try:
+        return image_cache.has_image(os.path.join(CAPTURE_DIR, name), key)
+    except OSError:
+        raise web.notfound()
+
+
+def get_image_response(name, key, render, thumbnail=True):
+    '''Returns an image of a capture (identified by key, and rendered with
+       render(capture) if not cached), thumbnailed to the size requested
+       (if thumbnail is set). Responds with a 304 if the client already has
+       it.'''
+    size = _get_thumbnail_size(thumbnail)
+    if size:
+        key = tuple(key) + size
+
+    filename = os.path.join(CAPTURE_DIR, name)
+    try:
+        etag = image_cache.get_etag(filename, key)
+    except OSError:
+        raise web.notfound()
+    # raises a 304 if the client's copy is current. Only by etag: web.py
+    # also gives one if If-Modified-Since matches, which it would for a
+    # stale render after IMAGE_CACHE_VERSION is bumped
+    web.modified(etag=etag)
+
+    def render_image():
+        im = render(capture_cache.get(filename))
+        if size:
+            im.thumbnail(size, Image.ANTIALIAS)
+        return im
+
+    web.header('Content-Type', 'image/png')
+    return image_cache.get_image(filename, key, render_image)
+
 
 class CapturesHandler:
 
     @templeton.handlers.json_response
     def GET(self):
-        captures = []
-        for fname in os.listdir(CAPTURE_DIR):
-            if fname == ".gitignore" or os.path.splitext(fname)[1] != '.zip':
-                continue
+        # optional parameters: any of FILTER_FIELDS (e.g. app=...), after
+        # and before (ISO 8601 dates), offset and limit. The total number of
+        # matching captures is returned in the X-Total-Count header
+        params, body = templeton.handlers.get_request_parms()
+        filters = {}
+        for field in FILTER_FIELDS:
+            if params.get(field):
+                filters[field] = params[field][0]
+        try:
+            offset = int(params.get('offset', [0])[0])
+            limit = None
+            if params.get('limit'):
+                limit = int(params['limit'][0])
+        except ValueError:
+            raise web.badrequest()
+        if offset < 0 or (limit is not None and limit < 0):
+            raise web.badrequest()
 
-            try:
-                capture = videocapture.Capture(
-                    os.path.join(CAPTURE_DIR, fname))
-                if capture.num_frames > 0:
-                    print "filename: %s" % fname
-                    captures.append(dict({"id": fname,
-                                          "length": capture.num_frames / 60.0,
-                                          "numFrames": capture.num_frames,
-                                          "filename": fname},
-                                         **capture.metadata))
-            except videocapture.BadCapture, error:
-                print "File %s unreadable: %s" % (fname, str(error))
-                # just ignore files that aren't readable as captures
-                pass
-
-        return sorted(captures, key=lambda c: c['date'])
+        catalog.update()
+        (total, captures) = catalog.get_captures(
+            filters, after=params.get('after', [None])[0],
+            before=params.get('before', [None])[0], offset=offset,
+            limit=limit)
+        web.header('X-Total-Count', str(total))
+
+        return captures
 
 
 class CaptureHandler:
 
     @templeton.handlers.json_response
     def GET(self, name):
-        try:
-            fname = os.path.join(CAPTURE_DIR, name)
-            capture = videocapture.Capture(fname)
-
-            return dict({"id": name, "length": capture.num_frames / 60.0,
-                         "numFrames": capture.num_frames, "filename": fname},
-                        **capture.metadata)
-        except:
+        catalog.update([name])
+        capture = catalog.get_capture(name)
+        if not capture:
             raise web.notfound()
 
+        return dict(capture, filename=os.path.join(CAPTURE_DIR, name))
+
 
 class CaptureVideoHandler:
 
     def GET(self, name):
         try:
-            capture = videocapture.Capture(os.path.join(CAPTURE_DIR, name))
-            videofile = capture.get_video()
-            data = videofile.getvalue()
-            web.header('Content-Type', 'video/webm')
-
-            # Using idea from here:
-            # http://vanderwijk.info/2010/9/17/implementing-http-206-partial-content-support-for-web-py
-            range = web.ctx.env.get('HTTP_RANGE')
-            if range is None:
-                web.header('Content-Length', len(data))
-                return data
-
-            total = len(data)
-            _, r = range.split("=")
-            partial_start, partial_end = r.split("-")
+            capture = capture_cache.get(os.path.join(CAPTURE_DIR, name))
+            (filename, offset, total) = videostream.get_video_file(capture)
+        except:
+            raise web.notfound()
 
-            start = int(partial_start)
+        web.header('Content-Type', 'video/webm')
+        web.header("Accept-Ranges", "bytes")
 
-            if not partial_end:
-                end = total - 1
-            else:
-                end = int(partial_end)
+        byte_range = None
+        if web.ctx.env.get('HTTP_RANGE'):
+            try:
+                byte_range = videostream.parse_range(
+                    web.ctx.env['HTTP_RANGE'], total)
+            except videostream.InvalidRange:
+                web.ctx.status = "416 Requested Range Not Satisfiable"
+                web.header("Content-Range", "bytes */%d" % total)
+                return ""
 
-            chunksize = (end - start) + 1
+        if byte_range is None:
+            web.header('Content-Length', total)
+            return videostream.stream_file(filename, offset, total)
 
-            web.ctx.status = "206 Partial Content"
-            web.header("Content-Range", "bytes %d-%d/%d" % (start, end, total))
-            web.header("Accept-Ranges", "bytes")
-            web.header("Content-Length", chunksize)
+        (start, end) = byte_range
+        web.ctx.status = "206 Partial Content"
+        web.header("Content-Range", "bytes %d-%d/%d" % (start, end, total))
+        web.header("Content-Length", (end - start) + 1)
 
-            return data[start:end + 1]
-        except:
-            raise web.notfound()
+        return videostream.stream_file(filename, offset + start,
+                                       (end - start) + 1)
 
 
 class CaptureImageHandler:
 
-    @templeton.handlers.png_response
     def GET(self, name, num):
-        params, body = templeton.handlers.get_request_parms()
-        (width, height) = (params.get('width'), params.get('height'))
-        capture = videocapture.Capture(os.path.join(CAPTURE_DIR, name))
-        im = capture.get_frame_image(int(num))
-        if width and height:
-            im.thumbnail((int(width[0]), int(height[0])), Image.ANTIALIAS)
-
-        return im
+        return get_image_response(
+            name, ('frame', int(num)),
+            lambda capture: capture.get_frame_image(int(num)))
+
+
+def get_analysis_response(name, analysis, respond, cache_key=None,
+                          func=None):
+    '''Returns respond(capture, result) for an analysis of a capture (one
+       of ANALYSES, unless given its cache_key and func) if it's been done.
+       Otherwise starts running it in the background (if it isn't already),
+       and returns a 202 with its progress.'''
+    if not func:
+        (cache_key, func) = ANALYSES[analysis]
+    filename = os.path.join(CAPTURE_DIR, name)
+    try:
+        capture = capture_cache.get(filename)
+    except videocapture.BadCapture:
+        raise web.notfound()
+
+    if is_analysis_cached(capture, cache_key):
+        return respond(capture, func(capture, None))
+
+    job = analysis_jobs.submit(analysis, func, filename)
+    if job.status == 'done':
+        return respond(capture, job.result)
+    elif job.status == 'error':
+        web.ctx.status = "500 Internal Server Error"
+    else:
+        web.ctx.status = "202 Accepted"
+        web.header('Location', '/api/jobs/%s' % job.jobid)
+
+    return job.get_status()
 
 
 class FrameDifferenceHandler:
 
     @templeton.handlers.json_response
     def GET(self, name):
-        capture = videocapture.Capture(os.path.join(CAPTURE_DIR, name))
-        return videocapture.get_framediff_sums(capture)
+        # with encoding=base64, returned as in videocapture.encode_series
+        params, body = templeton.handlers.get_request_parms()
+        encoding = params.get('encoding', [None])[0]
+        if encoding not in (None, 'base64'):
+            raise web.badrequest()
 
+        def respond(capture, diffsums):
+            if encoding:
+                return videocapture.encode_series(diffsums, 'uint32')
+            return diffsums
 
-class FrameDifferenceImageHandler:
+        return get_analysis_response(name, 'framediff', respond)
 
-    @templeton.handlers.png_response
-    def GET(self, name, framenum1, framenum2):
-        params, body = templeton.handlers.get_request_parms()
-        (width, height) = (params.get('width'), params.get('height'))
 
-        capture = videocapture.Capture(os.path.join(CAPTURE_DIR, name))
-        im = videocapture.get_framediff_image(capture, framenum1, framenum2)
-        if width and height:
-            im.thumbnail((int(width[0]), int(height[0])), Image.ANTIALIAS)
+class FrameDifferenceImageHandler:
 
-        return im
+    def GET(self, name, framenum1, framenum2):
+        return get_image_response(
+            name, ('framediff', int(framenum1), int(framenum2)),
+            lambda capture: videocapture.get_framediff_image(
+                capture, framenum1, framenum2))
 
 
 class CheckerboardHandler:
 
     @templeton.handlers.json_response
     def GET(self, name):
-        capture = videocapture.Capture(os.path.join(CAPTURE_DIR, name))
-        percents = videocapture.get_checkerboarding_percents(capture)
-        area_duration = videocapture.get_checkerboarding_area_duration(capture)
-        return {"areaDuration": area_duration,
+        return get_analysis_response(
+            name, 'checkerboard', lambda capture, percents: {
+                "areaDuration": sum(percents),
                 "numCheckerboards": len(filter(lambda f: f > 0.0, percents)),
-                "numFrames": capture.num_frames}
+                "numFrames": capture.num_frames})
+
+
+class SeriesHandler:
+
+    @templeton.handlers.json_response
+    def GET(self, name, analysis):
+        # a downsampled version of one of ANALYSES' per-frame series, for
+        # plotting width pixels wide (using one of
+        # videocapture.DECIMATION_METHODS), between frames start and end
+        # (exclusive)
+        if analysis not in ANALYSES:
+            raise web.notfound()
+        params, body = templeton.handlers.get_request_parms()
+        method = params.get('method', ['minmax'])[0]
+        try:
+            (start, end, width) = map(
+                lambda (param, default): int(params.get(param,
+                                                        [default])[0]),
+                [('start', 0), ('end', -1), ('width', DEFAULT_SERIES_WIDTH)])
+        except ValueError:
+            raise web.badrequest()
+        if method not in videocapture.DECIMATION_METHODS or start < 0 or \
+                width < 1 or width > MAX_SERIES_WIDTH:
+            raise web.badrequest()
+
+        def respond(capture, series):
+            first_frame = SERIES_FIRST_FRAMES.get(analysis, 0)
+            last = end
+            if last < 0 or last > first_frame + len(series):
+                last = first_frame + len(series)
+            points = videocapture.decimate_series(
+                series, width, start=max(0, start - first_frame),
+                end=max(0, last - first_frame), method=method)
+            return { 'method': method,
+                     'start': start,
+                     'end': last,
+                     'points': map(lambda (i, value): [first_frame + i,
+                                                       value], points) }
+
+        return get_analysis_response(name, analysis, respond)
+
+
+class MotionHeatmapHandler:
+
+    def GET(self, name):
+        # how often each blocksize x blocksize block of pixels changed
+        # between frames start and end (inclusive), as an image (see
+        # videocapture.get_motion_heatmap_image)
+        params, body = templeton.handlers.get_request_parms()
+        try:
+            (start, end, block_size) = map(
+                lambda (param, default): int(params.get(param,
+                                                        [default])[0]),
+                [('start', 1), ('end', -1), ('blocksize', 1)])
+        except ValueError:
+            raise web.badrequest()
+        if start < 1 or block_size < 1 or block_size > MAX_HEATMAP_BLOCK_SIZE:
+            raise web.badrequest()
+        if end < 0:
+            end = None
+
+        image_key = ('motionheatmap', start, end, block_size)
+
+        def render_heatmap(capture, progress=None):
+            return videocapture.get_motion_heatmap_image(
+                capture, videocapture.get_motion_heatmap(
+                    capture, start, end, block_size, progress=progress))
+
+        def prerender_heatmap(capture, progress):
+            # into the image cache, rather than returning the heatmap (which
+            # the job would hold onto long after it's been rendered)
+            image_cache.get_image(capture.filename, image_key,
+                                  lambda: render_heatmap(capture, progress))
+
+        def respond(capture, result):
+            # thumbnails are made from the full size image
+            return get_image_response(
+                name, image_key,
+                lambda capture: Image.open(StringIO.StringIO(
+                    image_cache.get_image(capture.filename, image_key,
+                                          lambda: render_heatmap(capture)))))
+
+        # heatmaps other than the default one are only kept as images
+        # (see videocapture.get_motion_heatmap_cache_key)
+        if is_image_cached(name, image_key, thumbnail=False):
+            return respond(None, None)
+
+        response = get_analysis_response(
+            name, 'motionheatmap-%s-%s-%s' % (start, end, block_size),
+            respond, videocapture.get_motion_heatmap_cache_key(
+                start, end, block_size),
+            prerender_heatmap)
+        if isinstance(response, dict):
+            # not done yet (or failed): the job's status
+            web.header('Content-Type', 'application/json')
+            return json.dumps(response)
+
+        return response
+
+
+class JobHandler:
+
+    @templeton.handlers.json_response
+    def GET(self, jobid):
+        job = analysis_jobs.get(jobid)
+        if not job:
+            raise web.notfound()
+
+        return job.get_status()
 
 
 class CheckerboardImageHandler:
 
-    @templeton.handlers.png_response
     def GET(self, name, framenum):
-        params, body = templeton.handlers.get_request_parms()
-        (width, height) = (params.get('width'), params.get('height'))
+        return get_image_response(
+            name, ('checkerboard', int(framenum)),
+            lambda capture: videocapture.get_checkerboard_image(capture,
+                                                                framenum))
 
-        capture = videocapture.Capture(os.path.join(CAPTURE_DIR, name))
-        im = videocapture.get_checkerboard_image(capture, framenum)
-        if width and height:
-            im.thumbnail((int(width[0]), int(height[0])), Image.ANTIALIAS)
 
-        return im
+class FilmstripHandler:
+
+    def GET(self, name):
+        # frames start, start+step, ... up to end (inclusive), each scaled to
+        # width pixels wide, laid out left to right in rows of columns
+        # frames (see videocapture.get_filmstrip_image)
+        params, body = templeton.handlers.get_request_parms()
+        try:
+            (start, end, step, width, columns) = map(
+                lambda (param, default): int(params.get(param,
+                                                        [default])[0]),
+                zip(['start', 'end', 'step', 'width', 'columns'],
+                    DEFAULT_FILMSTRIP_PARAMS))
+        except ValueError:
+            raise web.badrequest()
+        if start < 0 or step < 1 or width < 1 or \
+                width > MAX_FILMSTRIP_WIDTH or columns < 1:
+            raise web.badrequest()
+
+        def render(capture):
+            try:
+                return render_filmstrip(capture, start, end, step, width,
+                                        columns)
+            except ValueError:
+                raise web.badrequest()
+
+        return get_image_response(name, ('filmstrip', start, end, step, width,
+                                         columns), render, thumbnail=False)
 
 
 # URLs go here. "/api/" will be automatically prepended to each.
@@ -160,8 +455,12 @@ urls = (
     '/captures/([^/]+)/?', "CaptureHandler",
     '/captures/([^/]+)/video/?', "CaptureVideoHandler",
     '/captures/([^/]+)/images/([0-9]+)/?', "CaptureImageHandler",
+    '/captures/([^/]+)/filmstrip/?', "FilmstripHandler",
     '/captures/([^/]+)/framediff/?', "FrameDifferenceHandler",
     '/captures/([^/]+)/framediff/images/([0-9]+)-([0-9]+)/?', "FrameDifferenceImageHandler",
     '/captures/([^/]+)/checkerboard/?', "CheckerboardHandler",
-    '/captures/([^/]+)/checkerboard/images/([0-9]+)/?', "CheckerboardImageHandler"
+    '/captures/([^/]+)/checkerboard/images/([0-9]+)/?', "CheckerboardImageHandler",
+    '/captures/([^/]+)/series/([a-z]+)/?', "SeriesHandler",
+    '/captures/([^/]+)/motion/heatmap/?', "MotionHeatmapHandler",
+    '/jobs/([^/]+)/?', "JobHandler"
 )
@@ -0,0 +1,79 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# An on-disk cache of images rendered from captures (frames, frame
+# differences, thumbnails of those, ...). Images are stored per capture and
+# version of the capture file, so they're invalidated whenever it changes.
+
+import StringIO
+import hashlib
+import os
+import shutil
+import tempfile
+
+# bump this whenever the way images are rendered changes
+IMAGE_CACHE_VERSION = 1
+
+
+class ImageCache(object):
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def get_etag(self, capture_filename, key):
+        '''Returns an identifier for an image of a capture (identified by
+           key, a tuple), which changes whenever the capture does'''
+        stat = os.stat(capture_filename)
+        return hashlib.sha1(repr((IMAGE_CACHE_VERSION,
+                                  os.path.basename(capture_filename),
+                                  stat.st_mtime, stat.st_size) +
+                                 tuple(key))).hexdigest()
+
+    def _get_filename(self, capture_filename, key):
+        return os.path.join(self.cache_dir,
+                            os.path.basename(capture_filename),
+                            str(os.path.getmtime(capture_filename)),
+                            '%s.png' % self.get_etag(capture_filename, key))
+
+    def has_image(self, capture_filename, key):
+        return os.path.isfile(self._get_filename(capture_filename, key))
+
+    def get_image(self, capture_filename, key, render):
+        '''Returns the image of a capture identified by key as PNG data,
+           rendering it with render() (which should return a PIL image) if
+           it isn't cached'''
+        filename = self._get_filename(capture_filename, key)
+        version_dir = os.path.dirname(filename)
+        capture_dir = os.path.dirname(version_dir)
+        version = os.path.basename(version_dir)
+        try:
+            with open(filename, 'rb') as f:
+                return f.read()
+        except IOError:
+            pass
+
+        buf = StringIO.StringIO()
+        render().save(buf, 'png')
+        data = buf.getvalue()
+
+        if not os.path.isdir(version_dir):
+            # images of older versions of the capture are no use anymore
+            if os.path.isdir(capture_dir):
+                for old_version in os.listdir(capture_dir):
+                    if old_version == version:
+                        continue
+                    shutil.rmtree(os.path.join(capture_dir, old_version),
+                                  ignore_errors=True)
+            try:
+                os.makedirs(version_dir)
+            except OSError:
+                # created by another request in the meantime
+                pass
+
+        (fd, tmpname) = tempfile.mkstemp(dir=version_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmpname, filename)
+
+        return data
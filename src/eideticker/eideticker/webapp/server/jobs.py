@@ -0,0 +1,128 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Runs expensive analyses of captures in the background, so that requests
+# for their results can return straight away (with the progress of the
+# analysis, if it isn't done yet) instead of blocking until it is.
+
+import hashlib
+import os
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+# number of analyses to run at once (each already uses several processes)
+DEFAULT_NUM_WORKERS = 2
+# how long to remember finished jobs for
+JOB_EXPIRY_TIME = 60 * 60
+# how much to lower the priority of background jobs by (on linux, niceness
+# is per thread, and inherited by the processes the analyses start)
+BACKGROUND_NICENESS = 10
+
+
+def is_analysis_cached(capture, cache_key):
+    '''Returns whether the result of an analysis has already been stored in
+       a capture's cache file (under cache_key, if it's cached at all)'''
+    return cache_key is not None and cache_key in capture.get_cache()
+
+
+class AnalysisJob(object):
+
+    def __init__(self, jobid, analysis, capture_filename):
+        self.jobid = jobid
+        self.analysis = analysis
+        self.capture_filename = capture_filename
+        self.status = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.finish_time = None
+        self.background = False
+
+    def set_progress(self, done, total):
+        self.progress = total and float(done) / total or 0.0
+
+    def get_status(self):
+        status = { 'id': self.jobid, 'analysis': self.analysis,
+                   'capture': os.path.basename(self.capture_filename),
+                   'status': self.status, 'progress': self.progress }
+        if self.error:
+            status['error'] = self.error
+        return status
+
+
+class AnalysisJobs(object):
+    '''Runs analyses, functions of the form analysis(capture, progress)
+       (progress being a function taking the number of frames analyzed so
+       far and the total), at most one at a time per capture and analysis'''
+
+    def __init__(self, get_capture, num_workers=DEFAULT_NUM_WORKERS):
+        self.get_capture = get_capture
+        self._pool = ThreadPool(num_workers)
+        # precalculating things nobody has asked for yet shouldn't slow down
+        # anything else
+        self._background_pool = ThreadPool(1, initializer=os.nice,
+                                           initargs=(BACKGROUND_NICENESS,))
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _run(self, job, func):
+        # a background job may also have been queued in the foreground since
+        with self._lock:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+        try:
+            job.result = func(self.get_capture(job.capture_filename),
+                              job.set_progress)
+            job.progress = 1.0
+            job.status = 'done'
+        except Exception, e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = 'error'
+        job.finish_time = time.time()
+
+    def _expire(self):
+        now = time.time()
+        for (jobid, job) in self._jobs.items():
+            if job.finish_time and job.finish_time + JOB_EXPIRY_TIME < now:
+                del self._jobs[jobid]
+
+    def submit(self, analysis, func, capture_filename, background=False):
+        '''Returns the job running (or which ran) an analysis of the current
+           version of a capture, starting one if there isn't one already (or
+           the last one failed, and that's already been returned once).
+           Background jobs are run one at a time, at a lower priority, after
+           any other background jobs (unless asked for again in the
+           foreground in the meantime).'''
+        stat = os.stat(capture_filename)
+        jobid = hashlib.sha1(repr((analysis, capture_filename, stat.st_mtime,
+                                   stat.st_size))).hexdigest()
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(jobid)
+            if job and job.status == 'error':
+                # report the failure (once): asking again starts a new job
+                del self._jobs[jobid]
+                return job
+            if not job:
+                job = self._jobs[jobid] = AnalysisJob(jobid, analysis,
+                                                      capture_filename)
+                job.background = background
+                if background:
+                    self._background_pool.apply_async(self._run, (job, func))
+                else:
+                    self._pool.apply_async(self._run, (job, func))
+            elif job.background and not background and \
+                    job.status == 'queued':
+                job.background = False
+                self._pool.apply_async(self._run, (job, func))
+
+        return job
+
+    def get(self, jobid):
+        with self._lock:
+            return self._jobs.get(jobid)
@@ -9,4 +9,5 @@ app = web.application(urls, handlers.__dict__)
 
 
 if __name__ == '__main__':
+    handlers.watcher.start()
     app.run()
@@ -0,0 +1,77 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Serves (ranges of) capture videos straight out of the capture files,
+# without reading the whole video into memory
+
+import os
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class InvalidRange(Exception):
+    pass
+
+
+def get_video_file(capture):
+    '''Returns a file containing a capture's video, along with the offset
+       and size of the video in it. That's normally the capture file
+       itself; if the video is compressed in there, it's extracted (once)
+       to a file alongside it.'''
+    location = capture.get_video_location()
+    if location:
+        return (capture.filename, location[0], location[1])
+
+    video_filename = capture.filename + '.webm'
+    if not os.path.exists(video_filename) or \
+            os.path.getmtime(video_filename) < \
+            os.path.getmtime(capture.filename):
+        (fd, tmpname) = tempfile.mkstemp(
+            dir=os.path.dirname(capture.filename))
+        os.close(fd)
+        capture.extract_video(tmpname)
+        os.rename(tmpname, video_filename)
+
+    return (video_filename, 0, os.path.getsize(video_filename))
+
+
+def parse_range(range_header, total):
+    '''Parses an HTTP Range header (of a single range, e.g. "bytes=0-1023",
+       "bytes=1024-" or "bytes=-1024"), returning the first and last bytes
+       requested. Returns None if the header isn't one we understand (in
+       which case the whole thing should be sent), and raises InvalidRange
+       if it can't be satisfied.'''
+    try:
+        (unit, byte_range) = range_header.split('=', 1)
+        if unit.strip() != 'bytes' or ',' in byte_range:
+            return None
+        (first, last) = map(lambda s: s.strip(), byte_range.split('-', 1))
+        if not first:
+            # the last n bytes
+            (start, end) = (max(0, total - int(last)), total - 1)
+        else:
+            start = int(first)
+            if last:
+                end = min(int(last), total - 1)
+            else:
+                end = total - 1
+    except ValueError:
+        return None
+
+    if start > end or start >= total:
+        raise InvalidRange()
+
+    return (start, end)
+
+
+def stream_file(filename, offset, length):
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
@@ -0,0 +1,31 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import threading
+import time
+import traceback
+
+# how often to look for new captures, in seconds
+DEFAULT_POLL_INTERVAL = 10
+
+
+class CaptureWatcher(threading.Thread):
+    '''Keeps a capture catalog up to date in the background, by checking the
+       modification times of the captures every so often (so that its
+       on_update callback gets called as soon as new captures arrive,
+       rather than when someone next lists them)'''
+
+    def __init__(self, catalog, poll_interval=DEFAULT_POLL_INTERVAL):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.catalog = catalog
+        self.poll_interval = poll_interval
+
+    def run(self):
+        while True:
+            try:
+                self.catalog.update()
+            except Exception:
+                traceback.print_exc()
+            time.sleep(self.poll_interval)
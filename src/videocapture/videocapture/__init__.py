@@ -2,10 +2,35 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from controller import CaptureController
-from capture import Capture, BadCapture
-from checkerboard import *
-from framediff import get_framediff_imgarray, get_framediff_image, get_framediff_sums, get_num_unique_frames, get_fps
-from entropy import get_entropy_diffs, get_overall_entropy, get_frame_entropies
-from stableframe import get_stable_frame, get_stable_frame_time
-from options import OptionParser
+import sys
+from lazymodule import LazyModule
+
+# submodules (and scipy, PIL, etc. along with them) only get imported once
+# something from them is used
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'controller': ['CaptureController', 'valid_capture_devices',
+                   'valid_decklink_modes'],
+    'capture': ['Capture', 'BadCapture'],
+    'checkerboard': ['get_checkerboarding_percents',
+                     'get_checkerboarding_area_duration',
+                     'get_checkerboard_image'],
+    'framediff': ['get_framediff_imgarray', 'get_framediff_image',
+                  'get_framediff_sums', 'get_num_unique_frames', 'get_fps',
+                  'get_motion_heatmap', 'get_motion_heatmap_cache_key',
+                  'get_motion_heatmap_image'],
+    'entropy': ['get_entropy_diffs', 'get_overall_entropy',
+                'get_frame_entropies'],
+    'stableframe': ['get_stable_frame', 'get_stable_frame_time'],
+    'options': ['OptionParser'],
+    'timing': ['TimingLog', 'timing_span', 'get_timing_summary',
+               'format_timing_summary'],
+    'synthetic': ['get_synthetic_frames', 'write_synthetic_capture',
+                  'write_synthetic_raw_capture', 'parse_segments',
+                  'SEGMENT_TYPES', 'DEFAULT_SEGMENTS', 'DEFAULT_SCROLL_SPEED'],
+    'framepool': ['get_memory_budget', 'set_memory_budget',
+                  'get_num_workers'],
+    'filmstrip': ['get_filmstrip_image', 'get_filmstrip_dimensions',
+                  'DEFAULT_FILMSTRIP_COLUMNS'],
+    'series': ['encode_series', 'decode_series', 'SERIES_TYPES'],
+    'decimate': ['decimate_series', 'DECIMATION_METHODS']
+})
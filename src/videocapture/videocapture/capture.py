@@ -4,10 +4,15 @@
 
 from PIL import Image
 import StringIO
+import cPickle as pickle
+import fcntl
 import os
-from zipfile import ZipFile, BadZipfile
+import shutil
+from zipfile import ZipFile, BadZipfile, ZIP_STORED
 import json
 import numpy
+import struct
+import threading
 
 
 class CaptureException(Exception):
@@ -32,7 +37,12 @@ class Capture(object):
         except BadZipfile:
             raise BadCapture("Capture file '%s' not a .zip file")
 
-        if 'metadata.json' not in self.archive.namelist():
+        # the archive's file object is shared, so only one thread may read
+        # from it at a time
+        self._archive_lock = threading.Lock()
+        self._archive_names = set(self.archive.namelist())
+
+        if 'metadata.json' not in self._archive_names:
             raise BadCapture("No metadata in capture")
 
         self.metadata = json.loads(self.archive.open('metadata.json').read())
@@ -44,7 +54,7 @@ class Capture(object):
 
         self.num_frames = max(0, len(filter(
             lambda s: s[0:7] == "images/" and len(s) > 8,
-            self.archive.namelist())) - 2)
+            self._archive_names)) - 2)
         if self.num_frames > 0:
             im = self.get_frame_image(0)
             self.dimensions = im.size
@@ -64,12 +74,65 @@ class Capture(object):
     def length(self):
         return self.num_frames / self.fps
 
+    def get_cache(self):
+        '''Returns the hard-to-generate data cached about the capture (a
+           dict)'''
+        try:
+            with open(self.cache_filename, 'rb') as f:
+                return pickle.load(f)
+        except:
+            return {}
+
+    def update_cache(self, entries):
+        '''Adds entries to the capture's cache. Several analyses of the same
+           capture may be running at once, so this merges them into what's
+           there under a lock, and replaces the file atomically (so readers
+           never see it half-written).'''
+        with open(self.cache_filename + '.lock', 'a') as lockfile:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX)
+            cache = self.get_cache()
+            cache.update(entries)
+            # only ever written under the lock, so the name can be fixed
+            tmpname = self.cache_filename + '.tmp'
+            try:
+                with open(tmpname, 'wb') as f:
+                    pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmpname, self.cache_filename)
+            except:
+                os.unlink(tmpname)
+                raise
+
     def get_video(self):
         buf = StringIO.StringIO()
-        buf.write(self.archive.read('movie.webm'))
+        with self._archive_lock:
+            buf.write(self.archive.read('movie.webm'))
         buf.seek(0)
         return buf
 
+    def get_video_location(self):
+        '''Returns the offset and size of the video within the capture file,
+           or None if it is compressed (and so can't be read directly)'''
+        info = self.archive.getinfo('movie.webm')
+        if info.compress_type != ZIP_STORED:
+            return None
+
+        # the data follows the member's local header, whose variable length
+        # fields may differ from those in the central directory
+        with open(self.filename, 'rb') as f:
+            f.seek(info.header_offset)
+            header = f.read(30)
+        if header[0:4] != 'PK\x03\x04':
+            raise BadCapture("Capture file '%s' is corrupt" % self.filename)
+        (name_length, extra_length) = struct.unpack('<HH', header[26:30])
+
+        return (info.header_offset + 30 + name_length + extra_length,
+                info.file_size)
+
+    def extract_video(self, filename):
+        with self._archive_lock:
+            with open(filename, 'wb') as f:
+                shutil.copyfileobj(self.archive.open('movie.webm'), f)
+
     def get_frame_image(self, framenum, grayscale=False):
         if int(framenum) > self.num_frames:
             raise CaptureException("Frame number '%s' is greater than the "
@@ -77,14 +140,15 @@ class Capture(object):
                                                               self.num_frames))
 
         filename = 'images/%s.png' % framenum
-        if filename not in self.archive.namelist():
+        if filename not in self._archive_names:
             raise BadCapture("Frame image '%s' not in capture" % filename)
 
         return self._get_frame_image(filename, grayscale)
 
     def _get_frame_image(self, filename, grayscale=False):
         buf = StringIO.StringIO()
-        buf.write(self.archive.read(filename))
+        with self._archive_lock:
+            buf.write(self.archive.read(filename))
         buf.seek(0)
         im = Image.open(buf)
         if grayscale:
@@ -92,6 +156,6 @@ class Capture(object):
 
         return im
 
-    def get_frame(self, framenum, grayscale=False, type=numpy.float):
+    def get_frame(self, framenum, grayscale=False, type=numpy.uint8):
         return numpy.array(self.get_frame_image(framenum, grayscale),
                            dtype=type)
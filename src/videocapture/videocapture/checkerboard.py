@@ -4,15 +4,11 @@
 
 import numpy
 import square
-import cPickle as pickle
 from PIL import Image
 
 
-def get_checkerboarding_percents(capture):
-    try:
-        cache = pickle.load(open(capture.cache_filename, 'r'))
-    except:
-        cache = {}
+def get_checkerboarding_percents(capture, progress=None):
+    cache = capture.get_cache()
 
     try:
         percents = cache['checkerboard_percents']
@@ -26,8 +22,9 @@ def get_checkerboarding_percents(capture):
                 checkerboard_size = (checkerboard_box[2] - checkerboard_box[0]) * (checkerboard_box[3] - checkerboard_box[1])
                 percent = float(checkerboard_size) / (capture.dimensions[0] * capture.dimensions[1])
             percents.append(percent)
-        cache['checkerboard_percents'] = percents
-        pickle.dump(cache, open(capture.cache_filename, 'w'))
+            if progress:
+                progress(i, capture.num_frames)
+        capture.update_cache({'checkerboard_percents': percents})
 
     return percents
 
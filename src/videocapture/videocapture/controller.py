@@ -4,16 +4,20 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import bisect
 import json
 import subprocess
 import tempfile
 import time
 import datetime
 import os
+from framepool import get_num_workers
 from square import get_biggest_square
+from timing import timing_span
 import re
 import multiprocessing
 import shutil
+import threading
 
 from PIL import Image, ImageFilter
 import numpy
@@ -23,6 +27,11 @@ DECKLINK_DIR = os.path.join(os.path.dirname(__file__), 'decklink')
 POINTGREY_DIR = os.path.join(os.path.dirname(__file__), 'pointgrey')
 MAX_VIDEO_FPS = 60
 DEFAULT_WEBM_BIT_RATE = 1024
+# enough for several minutes of capture at 60fps
+DEFAULT_FRAME_TIMESTAMP_BUFFER_SIZE = 16384
+# number of frames to keep on either side of the test's start/end frames
+# when converting a ring buffered capture
+RING_BUFFER_MARGIN_FRAMES = 60
 
 valid_capture_devices = ["decklink", "pointgrey"]
 valid_decklink_modes = ["720p", "1080p"]
@@ -32,37 +41,105 @@ def _natural_key(str):
     """See http://www.codinghorror.com/blog/archives/001018.html"""
     return [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', str)]
 
+
+def _wait_for_event(event, alive_check=None, interval=1.0):
+    '''Wait for an event to be set. Under python 2, waiting without a timeout
+       can't be interrupted with ctrl-c, so we wake up periodically to let
+       that happen (and optionally to give up if alive_check says whatever
+       was supposed to set the event has gone away)'''
+    while not event.wait(interval):
+        if alive_check and not alive_check():
+            return event.is_set()
+    return True
+
 supported_formats = {
-    "1080p": {"decklink_mode": 13},
-    "1080i": {"decklink_mode": 9},
-    "720p": {"decklink_mode": 16},
-    "720p@59.94": {"decklink_mode": 12}
+    "1080p": {"decklink_mode": 13, "dimensions": (1920, 1080)},
+    "1080i": {"decklink_mode": 9, "dimensions": (1920, 1080)},
+    "720p": {"decklink_mode": 16, "dimensions": (1280, 720)},
+    "720p@59.94": {"decklink_mode": 12, "dimensions": (1280, 720)}
 }
 
+
+def _get_raw_frame_size(video_format):
+    # we capture 8 bit YUV 4:2:2, i.e. 2 bytes per pixel
+    (width, height) = supported_formats[video_format]["dimensions"]
+    return width * height * 2
+
 camera_configs = {
     "Flea3 FL3-U3-13Y3M": "FL3-U3-13Y3M.json",
     "Flea3 FL3-U3-13E4C": "FL3-U3-13E4C.json"
 }
 
 
+class FrameTimestampBuffer(object):
+    '''Ring buffer of (frame number, timestamp) pairs in shared memory. The
+       capture process appends an entry as each frame arrives, so any host
+       time can be mapped back to a capture frame after the fact.'''
+
+    def __init__(self, size=DEFAULT_FRAME_TIMESTAMP_BUFFER_SIZE):
+        self.size = size
+        self._framenums = multiprocessing.RawArray('l', size)
+        self._timestamps = multiprocessing.RawArray('d', size)
+        self._count = multiprocessing.RawValue('l', 0)
+
+    def __len__(self):
+        return min(self._count.value, self.size)
+
+    def append(self, framenum, timestamp):
+        # only ever written to by the capture process, so no locking needed:
+        # the count is bumped only after the entry itself is in place
+        index = self._count.value % self.size
+        self._framenums[index] = framenum
+        self._timestamps[index] = timestamp
+        self._count.value += 1
+
+    def get_entries(self):
+        count = self._count.value
+        return [(self._framenums[i % self.size], self._timestamps[i % self.size])
+                for i in range(max(0, count - self.size), count)]
+
+    def get_framenum(self, timestamp):
+        '''Get the frame which was most recently received at the given time,
+           or None if that frame is not (or no longer) in the buffer'''
+        entries = self.get_entries()
+        i = bisect.bisect_right([entry[1] for entry in entries], timestamp)
+        if i == 0:
+            return None
+        return entries[i - 1][0]
+
+
 class CaptureProcess(multiprocessing.Process):
 
     def __init__(self, capture_device, video_format, frame_counter,
-                 finished_semaphore, output_raw_filename=None,
-                 outputdir=None, fps=None, camera_settings_file=None):
+                 finished_event, started_event=None, output_raw_filename=None,
+                 outputdir=None, fps=None, camera_settings_file=None,
+                 frame_timestamps=None, ring_buffer_frames=None,
+                 capture_card=None):
         multiprocessing.Process.__init__(self, args=(frame_counter,
-                                                     finished_semaphore,))
+                                                     finished_event,))
         self.frame_counter = frame_counter
+        self.frame_timestamps = frame_timestamps
         self.output_raw_filename = output_raw_filename
         self.outputdir = outputdir
         self.capture_device = capture_device
         self.video_format = video_format
-        self.finished_semaphore = finished_semaphore
+        self.finished_event = finished_event
+        self.started_event = started_event
         self.fps = fps
         self.camera_settings_file = camera_settings_file
+        self.ring_buffer_frames = ring_buffer_frames
+        self.capture_card = capture_card
 
     def stop(self):
-        self.finished_semaphore.value = True
+        self.finished_event.set()
+
+    def _kill_capture_proc(self):
+        print "WARNING: Capture still running!"
+        # terminate failed; try forcibly killing it
+        try:
+            self.capture_proc.kill()
+        except:
+            pass
 
     def run(self):
         timeout = 10
@@ -74,10 +151,16 @@ class CaptureProcess(multiprocessing.Process):
                     '%s' % mode,
                     '-p',
                     '0',
-                    '-n',
-                    '6000',
                     '-f',
                     self.output_raw_filename]
+            if self.capture_card is not None:
+                args.extend(['-i', str(self.capture_card)])
+            if self.ring_buffer_frames:
+                # capture until told to stop, keeping only the most recent
+                # frames on disk
+                args.extend(['-r', str(self.ring_buffer_frames)])
+            else:
+                args.extend(['-n', '6000'])
         elif self.capture_device == "pointgrey":
             # get the device type
             camera_id = subprocess.check_output([os.path.join(
@@ -107,7 +190,39 @@ class CaptureProcess(multiprocessing.Process):
 
         self.capture_proc = subprocess.Popen(args, stdout=subprocess.PIPE)
 
-        while not self.finished_semaphore.value:
+        try:
+            self._read_frames()
+        finally:
+            # make sure nobody is left waiting for a capture that is never
+            # going to start
+            if self.started_event:
+                self.started_event.set()
+
+        print "Terminating capture proc..."
+        # wait for the capture proc to exit, killing it if it takes too long
+        killer = threading.Timer(timeout, self._kill_capture_proc)
+        killer.start()
+        self.capture_proc.terminate()
+        # pick up any frames captured after we were told to stop, so the
+        # frame counter reflects everything that was actually written
+        for line in iter(self.capture_proc.stdout.readline, ''):
+            if line.rstrip().isdigit():
+                self._frame_received(int(line.rstrip()))
+        self.capture_proc.wait()
+        killer.cancel()
+        print "Capture proc terminated"
+
+    def _frame_received(self, framenum):
+        # note that we use wall clock time here so that frames can be
+        # correlated with device-side timings too (the device's clock is
+        # synchronized with the host's before each test)
+        timestamp = time.time()
+        self.frame_counter.value = framenum
+        if self.frame_timestamps is not None:
+            self.frame_timestamps.append(framenum, timestamp)
+
+    def _read_frames(self):
+        while not self.finished_event.is_set():
             try:
                 line = self.capture_proc.stdout.readline()
             except KeyboardInterrupt:
@@ -116,26 +231,12 @@ class CaptureProcess(multiprocessing.Process):
             if not line:
                 break
 
-            self.frame_counter.value = int(line.rstrip())
-
-        print "Terminating capture proc..."
-        self.capture_proc.terminate()
-        waitstart = time.time()
-        while (time.time() - waitstart) < timeout:
-            rc = self.capture_proc.poll()
-            time.sleep(0.5)
-            if rc is not None:
-                print "Capture proc terminated"
-                self.capture_proc.wait()  # necessary?
-                return
-
-        print "WARNING: Capture still running!"
-        # terminate failed; try forcibly killing it
-        try:
-            self.capture_proc.kill()
-        except:
-            pass
-        self.capture_proc.wait()  # or poll and error out if still running?
+            framenum = int(line.rstrip())
+            self._frame_received(framenum)
+            # the first frame is sometimes incomplete, so we only consider
+            # ourselves started once the second one has come in
+            if self.started_event and framenum >= 1:
+                self.started_event.set()
 
 def _rewrite_frame(framenum, dirname, imagefilename, capture_area,
                    capture_device):
@@ -153,8 +254,15 @@ class CaptureController(object):
     def __init__(self, capture_device, capture_area=None,
                  find_start_signal=True, find_end_signal=True,
                  custom_tempdir=None, fps=None, use_vpxenc=False,
-                 camera_settings_file=None):
+                 camera_settings_file=None, ring_buffer_frames=None,
+                 capture_card=None, timings=None):
         self.capture_process = None
+        # if given, a TimingLog to record how long each stage takes in
+        self.timings = timings
+        self.frame_timestamps = None
+        # set whenever there is no capture ongoing
+        self.capture_finished = threading.Event()
+        self.capture_finished.set()
         self.null_read = file('/dev/null', 'r')
         self.null_write = file('/dev/null', 'w')
         self.output_filename = None
@@ -170,6 +278,13 @@ class CaptureController(object):
         self.fps = fps
         self.use_vpxenc = use_vpxenc
         self.camera_settings_file = camera_settings_file
+        # ring buffering is only supported with decklink cards (pointgrey
+        # captures are buffered in memory by the capture program)
+        self.ring_buffer_frames = None
+        if capture_device == 'decklink':
+            self.ring_buffer_frames = ring_buffer_frames
+        # which decklink card to use, if there are several in the machine
+        self.capture_card = capture_card
 
     def log(self, msg):
         print "%s Capture Controller | %s" % (
@@ -195,28 +310,63 @@ class CaptureController(object):
         self.capture_time = datetime.datetime.now()
         self.capture_metadata = capture_metadata
         self.frame_counter = multiprocessing.RawValue('i', 0)
-        self.finished_semaphore = multiprocessing.RawValue('b', False)
+        self.frame_timestamps = FrameTimestampBuffer()
+        self.capture_finished.clear()
+        capture_started = multiprocessing.Event()
         self.capture_process = CaptureProcess(
             self.capture_device, mode,
             self.frame_counter,
-            self.finished_semaphore,
+            multiprocessing.Event(),
+            started_event=capture_started,
             output_raw_filename=output_raw_filename,
             outputdir=self.outputdir,
             fps=self.fps,
-            camera_settings_file=self.camera_settings_file)
+            camera_settings_file=self.camera_settings_file,
+            frame_timestamps=self.frame_timestamps,
+            ring_buffer_frames=self.ring_buffer_frames,
+            capture_card=self.capture_card)
         self.log("Starting capture...")
         self.capture_process.start()
         # wait for capture to actually start...
-        while self.capture_framenum() < 1:
-            time.sleep(0.1)
+        _wait_for_event(capture_started,
+                        alive_check=self.capture_process.is_alive)
+        if self.capture_framenum() < 1:
+            self.terminate_capture()
+            raise Exception("Capture process exited before capturing any "
+                            "frames")
+
+    def import_raw_capture(self, raw_filename, output_filename, mode,
+                           capture_metadata={}):
+        '''Set things up as though a (decklink) capture to raw_filename in
+           the given mode had just finished, so it can be converted with
+           convert_capture (useful for reprocessing or benchmarking)'''
+        assert self.capture_device == 'decklink' and not self.capture_process
+        if mode not in supported_formats.keys():
+            raise Exception("Unsupported video format %s" % mode)
+
+        self.output_raw_file = open(raw_filename, 'rb')
+        self.outputdir = tempfile.mkdtemp(dir=self.custom_tempdir)
+        self.mode = mode
+        self.output_filename = output_filename
+        self.capture_time = datetime.datetime.now()
+        self.capture_metadata = capture_metadata
+        self.ring_buffer_frames = None
 
     @property
     def capturing(self):
         return self.capture_process is not None
 
-    def capture_framenum(self):
-        assert self.capture_process
-        return self.frame_counter.value
+    def capture_framenum(self, timestamp=None):
+        '''Get the current capture frame number or, if a timestamp (as
+           returned by time.time()) is given, the frame which was current
+           at that time. The latter also works after the capture has been
+           terminated.'''
+        if timestamp is None:
+            assert self.capture_process
+            return self.frame_counter.value
+
+        assert self.frame_timestamps is not None
+        return self.frame_timestamps.get_framenum(timestamp)
 
     def terminate_capture(self):
         # should not call this when no capture is ongoing
@@ -224,23 +374,73 @@ class CaptureController(object):
             self.log("Terminated capture, but no capture ongoing")
             return
 
-        self.capture_process.stop()
-        self.capture_process.join()
+        with timing_span(self.timings, 'captureterminate'):
+            self.capture_process.stop()
+            self.capture_process.join()
         self.capture_process = None
+        self.capture_finished.set()
+
+    def _convert_ring_buffer(self, start_frame, end_frame):
+        '''Convert the frames still in the raw ring buffer to images, in
+           capture order. If we know where the test started (or finished) and
+           won't be searching for a start (or end) signal, only frames within
+           a margin of that are kept. Returns the start and end frames
+           relative to the converted sequence.'''
+        frame_size = _get_raw_frame_size(self.mode)
+        num_captured = self.frame_counter.value + 1
+        first = max(0, num_captured - self.ring_buffer_frames)
+        last = num_captured - 1
+
+        if start_frame is not None and start_frame < first:
+            self.log("WARNING: Start frame %s no longer in ring buffer" %
+                     start_frame)
+            start_frame = None
+        if end_frame is not None and end_frame < first:
+            self.log("WARNING: End frame %s no longer in ring buffer" %
+                     end_frame)
+            end_frame = None
+        if start_frame is not None and not self.find_start_signal:
+            first = max(first, start_frame - RING_BUFFER_MARGIN_FRAMES)
+        if end_frame is not None and not self.find_end_signal:
+            last = min(last, end_frame + RING_BUFFER_MARGIN_FRAMES)
+
+        self.log("Converting frames %s-%s from ring buffer..." % (first,
+                                                                  last))
+        convert_proc = subprocess.Popen((
+            os.path.join(DECKLINK_DIR, 'decklink-convert.sh'), '-',
+            self.outputdir, self.mode), stdin=subprocess.PIPE,
+            close_fds=True)
+        with open(self.output_raw_file.name, 'rb') as f:
+            for framenum in range(first, last + 1):
+                f.seek((framenum % self.ring_buffer_frames) * frame_size)
+                convert_proc.stdin.write(f.read(frame_size))
+        convert_proc.stdin.close()
+        convert_proc.wait()
+
+        if start_frame is not None:
+            start_frame -= first
+        if end_frame is not None:
+            end_frame = min(end_frame, last) - first
+
+        return (start_frame, end_frame)
 
     def convert_capture(self, start_frame, end_frame, create_webm=True):
         self.log("Converting capture...")
         # wait for capture to finish if it has not already
         if self.capturing:
             self.log("Capture not finished... waiting")
-            while self.capturing:
-                time.sleep(0.5)
+            _wait_for_event(self.capture_finished)
 
         if self.capture_device == "decklink":
-            subprocess.Popen((
-                os.path.join(DECKLINK_DIR, 'decklink-convert.sh'),
-                self.output_raw_file.name, self.outputdir, self.mode),
-                close_fds=True).wait()
+            with timing_span(self.timings, 'decklinkconvert'):
+                if self.ring_buffer_frames:
+                    (start_frame, end_frame) = self._convert_ring_buffer(
+                        start_frame, end_frame)
+                else:
+                    subprocess.Popen((
+                        os.path.join(DECKLINK_DIR, 'decklink-convert.sh'),
+                        self.output_raw_file.name, self.outputdir, self.mode),
+                        close_fds=True).wait()
 
         self.log("Gathering capture dimensions and cropping to start/end of "
                  "capture...")
@@ -258,77 +458,83 @@ class CaptureController(object):
         # makes sense on the decklink cards, which have a clean HDMI signal.
         # input from things like the pointgrey cameras is too noisy...
         if self.capture_device == "decklink":
-            # start frame
-            if self.find_start_signal:
-                self.log("Searching for start of capture signal ...")
-                squares = []
-                for (i, imagefile) in enumerate(imagefiles):
-                    imgarray = numpy.array(Image.open(imagefile),
-                                           dtype=numpy.int16)
-                    squares.append(get_biggest_square((0, 255, 0), imgarray))
-                    if i > 1 and not squares[-1] and squares[-2]:
-                        if not start_frame:
-                            start_frame = i
-                        self.capture_area = squares[-2]
-                        self.log("Found start capture signal at frame %s. "
-                                 "Area: %s" % (i, self.capture_area))
-                        break
-
-            # end frame
-            if self.find_end_signal:
-                self.log("Searching for end of capture signal ...")
-                squares = []
-                for i in range(num_frames - 1, 0, -1):
-                    imgarray = numpy.array(Image.open(imagefiles[i]),
-                                           dtype=numpy.int16)
-                    squares.append(get_biggest_square((255, 0, 0), imgarray))
-
-                    if len(squares) > 1 and not squares[-1] and squares[-2]:
-                        if not end_frame:
-                            end_frame = (i - 1)
-                        if not self.capture_area:
+            with timing_span(self.timings, 'signalsearch'):
+                # start frame
+                if self.find_start_signal:
+                    self.log("Searching for start of capture signal ...")
+                    squares = []
+                    for (i, imagefile) in enumerate(imagefiles):
+                        imgarray = numpy.array(Image.open(imagefile),
+                                               dtype=numpy.int16)
+                        squares.append(get_biggest_square((0, 255, 0), imgarray))
+                        if i > 1 and not squares[-1] and squares[-2]:
+                            if start_frame is None:
+                                start_frame = i
                             self.capture_area = squares[-2]
-                        self.log("Found end capture signal at frame %s. Area: "
-                                 "%s" % (i - 1, self.capture_area))
-                        break
-
-        # If we don't have a start frame, set it to 1
-        if not start_frame:
+                            self.log("Found start capture signal at frame %s. "
+                                     "Area: %s" % (i, self.capture_area))
+                            break
+
+                # end frame
+                if self.find_end_signal:
+                    self.log("Searching for end of capture signal ...")
+                    squares = []
+                    for i in range(num_frames - 1, 0, -1):
+                        imgarray = numpy.array(Image.open(imagefiles[i]),
+                                               dtype=numpy.int16)
+                        squares.append(get_biggest_square((255, 0, 0), imgarray))
+
+                        if len(squares) > 1 and not squares[-1] and squares[-2]:
+                            if end_frame is None:
+                                end_frame = (i - 1)
+                            if not self.capture_area:
+                                self.capture_area = squares[-2]
+                            self.log("Found end capture signal at frame %s. Area: "
+                                     "%s" % (i - 1, self.capture_area))
+                            break
+
+        # If we don't have a start frame, set it to 1 (a start frame of 0
+        # is real: e.g. the first frame converted from the ring buffer)
+        if start_frame is None:
             start_frame = 1
         # Don't have an end frame? make it the entire length of the
         # capture
-        if not end_frame:
+        if end_frame is None:
             end_frame = num_frames
 
-        self.log("Rewriting images in %s..." % self.outputdir)
-        rewritten_imagedir = tempfile.mkdtemp(dir=self.custom_tempdir)
-
-        pool = multiprocessing.Pool()
-
-        # map the frame before the start frame to the zeroth frame (if
-        # possible). HACK: otherwise, create a copy of the start
-        # frame (this duplicates a frame).
-        remapped_frame = 0
-        if start_frame > 1:
-            remapped_frame = start_frame - 1
-        pool.apply_async(_rewrite_frame,
-                         [0, rewritten_imagedir, imagefiles[remapped_frame],
-                          self.capture_area, self.capture_device])
-
-        # last frame is the specified end frame or the first red frame if
-        # no last frame specified, or the very last frame in the
-        # sequence if there is no red frame and no specified last frame
-        last_frame = min(num_frames - 1, end_frame + 2)
-
-        # copy the remaining frames into numeric order starting from 1
-        for (i, j) in enumerate(range(start_frame, last_frame)):
-            pool.apply_async(_rewrite_frame, [(i + 1),
-                             rewritten_imagedir, imagefiles[j],
-                             self.capture_area, self.capture_device])
-
-        # wait for the rewriting of the images to complete
-        pool.close()
-        pool.join()
+        with timing_span(self.timings, 'framerewrite'):
+            self.log("Rewriting images in %s..." % self.outputdir)
+            rewritten_imagedir = tempfile.mkdtemp(dir=self.custom_tempdir)
+
+            # each worker holds a decoded frame, a cropped copy and an rgb
+            # copy of that
+            pool = multiprocessing.Pool(processes=get_num_workers(
+                frame_dimensions[0] * frame_dimensions[1] * 3 * 3))
+
+            # map the frame before the start frame to the zeroth frame (if
+            # possible). HACK: otherwise, create a copy of the start
+            # frame (this duplicates a frame).
+            remapped_frame = 0
+            if start_frame > 1:
+                remapped_frame = start_frame - 1
+            pool.apply_async(_rewrite_frame,
+                             [0, rewritten_imagedir, imagefiles[remapped_frame],
+                              self.capture_area, self.capture_device])
+
+            # last frame is the specified end frame or the first red frame if
+            # no last frame specified, or the very last frame in the
+            # sequence if there is no red frame and no specified last frame
+            last_frame = min(num_frames - 1, end_frame + 2)
+
+            # copy the remaining frames into numeric order starting from 1
+            for (i, j) in enumerate(range(start_frame, last_frame)):
+                pool.apply_async(_rewrite_frame, [(i + 1),
+                                 rewritten_imagedir, imagefiles[j],
+                                 self.capture_area, self.capture_device])
+
+            # wait for the rewriting of the images to complete
+            pool.close()
+            pool.join()
 
         capturefps = self.fps
         if not capturefps:
@@ -338,55 +544,57 @@ class CaptureController(object):
             generated_video_fps = MAX_VIDEO_FPS
 
         if create_webm:
-            self.log("Creating movie ...")
-
-            moviefile = tempfile.NamedTemporaryFile(dir=self.custom_tempdir,
-                                                    suffix=".webm")
-            # png2yuv is broken on Ubuntu 12.04 and earlier, so we can't use
-            # vpxenc there by default
-            if self.use_vpxenc:
-                with tempfile.NamedTemporaryFile(dir=self.custom_tempdir) as yuvfile:
-                    yuvconv = subprocess.Popen(('png2yuv', '-I',  'p', '-f',
-                                                str(capturefps), '-n',
-                                                str(last_frame-start_frame), '-j',
-                                                '%s/%%d.png' % rewritten_imagedir),
-                                               stdout=subprocess.PIPE)
-                    while yuvconv.poll() == None:
+            with timing_span(self.timings, 'encode'):
+                self.log("Creating movie ...")
+
+                moviefile = tempfile.NamedTemporaryFile(dir=self.custom_tempdir,
+                                                        suffix=".webm")
+                # png2yuv is broken on Ubuntu 12.04 and earlier, so we can't use
+                # vpxenc there by default
+                if self.use_vpxenc:
+                    with tempfile.NamedTemporaryFile(dir=self.custom_tempdir) as yuvfile:
+                        yuvconv = subprocess.Popen(('png2yuv', '-I',  'p', '-f',
+                                                    str(capturefps), '-n',
+                                                    str(last_frame-start_frame), '-j',
+                                                    '%s/%%d.png' % rewritten_imagedir),
+                                                   stdout=subprocess.PIPE)
+                        while yuvconv.poll() == None:
+                            yuvfile.write(yuvconv.stdout.read())
                         yuvfile.write(yuvconv.stdout.read())
-                    yuvfile.write(yuvconv.stdout.read())
-                    yuvfile.flush()
-
-                    subprocess.Popen(('vpxenc', '--good', '--cpu-used=0',
-                                      '--end-usage=vbr', '--passes=2',
-                                      '--threads=%s' % (multiprocessing.cpu_count() - 1),
-                                      '--target-bitrate=%s' % DEFAULT_WEBM_BIT_RATE,
-                                      '-o', moviefile.name, yuvfile.name)).wait()
-            else:
-                subprocess.Popen(('ffmpeg', '-y', '-r', str(generated_video_fps), '-i',
-                                  os.path.join(rewritten_imagedir, '%d.png'),
-                                  moviefile.name), close_fds=True).wait()
-
-
-        self.log("Writing final capture '%s'..." % self.output_filename)
-        zipfile = ZipFile(self.output_filename, 'a')
-
-        zipfile.writestr('metadata.json',
-                         json.dumps(dict({ 'captureDevice': self.capture_device,
-                                           'date': self.capture_time.isoformat(),
-                                           'frameDimensions': frame_dimensions,
-                                           'fps': capturefps,
-                                           'generatedVideoFPS': generated_video_fps,
-                                           'version': 1 },
-                                         **self.capture_metadata)))
-        if create_webm:
-            zipfile.writestr('movie.webm', moviefile.read())
-
-        for imagefilename in os.listdir(rewritten_imagedir):
-            zipfile.writestr("images/%s" % imagefilename,
-                             open(os.path.join(rewritten_imagedir,
-                                               imagefilename)).read())
-
-        zipfile.close()
+                        yuvfile.flush()
+
+                        subprocess.Popen(('vpxenc', '--good', '--cpu-used=0',
+                                          '--end-usage=vbr', '--passes=2',
+                                          '--threads=%s' % (multiprocessing.cpu_count() - 1),
+                                          '--target-bitrate=%s' % DEFAULT_WEBM_BIT_RATE,
+                                          '-o', moviefile.name, yuvfile.name)).wait()
+                else:
+                    subprocess.Popen(('ffmpeg', '-y', '-r', str(generated_video_fps), '-i',
+                                      os.path.join(rewritten_imagedir, '%d.png'),
+                                      moviefile.name), close_fds=True).wait()
+
+
+        with timing_span(self.timings, 'zipwrite'):
+            self.log("Writing final capture '%s'..." % self.output_filename)
+            zipfile = ZipFile(self.output_filename, 'a')
+
+            zipfile.writestr('metadata.json',
+                             json.dumps(dict({ 'captureDevice': self.capture_device,
+                                               'date': self.capture_time.isoformat(),
+                                               'frameDimensions': frame_dimensions,
+                                               'fps': capturefps,
+                                               'generatedVideoFPS': generated_video_fps,
+                                               'version': 1 },
+                                             **self.capture_metadata)))
+            if create_webm:
+                zipfile.writestr('movie.webm', moviefile.read())
+
+            for imagefilename in os.listdir(rewritten_imagedir):
+                zipfile.writestr("images/%s" % imagefilename,
+                                 open(os.path.join(rewritten_imagedir,
+                                                   imagefilename)).read())
+
+            zipfile.close()
 
         shutil.rmtree(self.outputdir)
         shutil.rmtree(rewritten_imagedir)
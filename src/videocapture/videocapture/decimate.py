@@ -0,0 +1,70 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Downsamples per-frame series (frame differences, entropies, ...) for
+# plotting: there's no point sending thousands of points to draw a graph a
+# few hundred pixels wide.
+
+import numpy
+
+DECIMATION_METHODS = ['minmax', 'lttb']
+
+
+def _get_bucket_edges(length, num_buckets):
+    return numpy.linspace(0, length, num_buckets + 1).astype(int)
+
+
+def _decimate_minmax(values, num_points):
+    # the smallest and largest value in each of num_points / 2 buckets, so
+    # that spikes are never lost
+    edges = _get_bucket_edges(len(values), max(1, num_points / 2))
+    indexes = []
+    for (start, end) in zip(edges[:-1], edges[1:]):
+        bucket = values[start:end]
+        (lowest, highest) = (start + bucket.argmin(), start + bucket.argmax())
+        indexes.extend(sorted(set([lowest, highest])))
+    return numpy.array(indexes)
+
+
+def _decimate_lttb(values, num_points):
+    # largest triangle three buckets: keeps the first and last points, and
+    # from each bucket in between, the point making the largest triangle
+    # with the point kept from the previous bucket and the average of the
+    # next one (see http://skemman.is/handle/1946/15343)
+    edges = _get_bucket_edges(len(values) - 2, num_points - 2) + 1
+    x = numpy.arange(len(values), dtype=float)
+    indexes = [0]
+    for i in range(num_points - 2):
+        (start, end) = (edges[i], edges[i + 1])
+        if i + 2 < len(edges):
+            (next_x, next_y) = (x[end:edges[i + 2]].mean(),
+                                values[end:edges[i + 2]].mean())
+        else:
+            (next_x, next_y) = (x[-1], values[-1])
+        (prev_x, prev_y) = (x[indexes[-1]], values[indexes[-1]])
+        areas = numpy.abs((prev_x - next_x) * (values[start:end] - prev_y) -
+                          (prev_x - x[start:end]) * (next_y - prev_y))
+        indexes.append(start + areas.argmax())
+    indexes.append(len(values) - 1)
+    return numpy.array(indexes)
+
+
+def decimate_series(series, num_points, start=0, end=None, method='minmax'):
+    '''Returns (at most about) num_points [index, value] pairs representing
+       series[start:end]'''
+    if method not in DECIMATION_METHODS:
+        raise ValueError("Unknown decimation method '%s'" % method)
+    if end is None or end > len(series):
+        end = len(series)
+    values = numpy.array(series[start:end], dtype=float)
+    num_points = max(3, num_points)
+
+    if len(values) <= num_points:
+        indexes = numpy.arange(len(values))
+    elif method == 'minmax':
+        indexes = _decimate_minmax(values, num_points)
+    else:
+        indexes = _decimate_lttb(values, num_points)
+
+    return map(lambda i: [start + int(i), float(values[i])], indexes)
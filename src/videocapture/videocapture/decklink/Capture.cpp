@@ -52,6 +52,7 @@ IDeckLinkDisplayModeIterator* displayModeIterator;
 static int g_videoModeIndex = -1;
 const char* g_videoOutputFile = NULL;
 static int g_maxFrames = -1;
+static int g_ringFrames = -1;
 static int g_debug = 0;
 static int g_printFrameNums = 0;
 
@@ -112,7 +113,9 @@ HRESULT DeckLinkCaptureDelegate::VideoInputFrameArrived(IDeckLinkVideoInputFrame
         }
         else
         {
-            if (g_printFrameNums)
+            // in ring buffer mode, we only print the frame number once the
+            // frame has been written out, so the reader knows it's complete
+            if (g_printFrameNums && g_ringFrames <= 0)
             {
                 printf("%lu\n", frameCount);
                 fflush(stdout);
@@ -128,9 +131,20 @@ HRESULT DeckLinkCaptureDelegate::VideoInputFrameArrived(IDeckLinkVideoInputFrame
 
             if (videoOutputFile != -1)
             {
+                long frameSize = videoFrame->GetRowBytes() *
+                    videoFrame->GetHeight();
                 videoFrame->GetBytes(&frameBytes);
-                write(videoOutputFile, frameBytes,
-                      videoFrame->GetRowBytes() * videoFrame->GetHeight());
+                if (g_ringFrames > 0)
+                    pwrite(videoOutputFile, frameBytes, frameSize,
+                           (off_t)(frameCount % g_ringFrames) * frameSize);
+                else
+                    write(videoOutputFile, frameBytes, frameSize);
+            }
+
+            if (g_printFrameNums && g_ringFrames > 0)
+            {
+                printf("%lu\n", frameCount);
+                fflush(stdout);
             }
 		
             frameCount++;
@@ -188,8 +202,12 @@ int usage(int status)
             "         1:  10 bit YUV (4:2:2)\n"
             "         2:  8 bit ARGB (4:4:4)\n"
             "         3:  10 bit RGB (4:4:4)\n"
+            "    -i <card index>      Index of the DeckLink card to capture from (default 0)\n"
             "    -f <filename>        Filename raw video will be written to\n"
             "    -n <frames>          Number of frames to capture (default is unlimited)\n"
+            "    -r <frames>          Write raw video into a ring buffer of this many\n"
+            "                         frames, overwriting the oldest ones (frame N is\n"
+            "                         stored at offset (N %% frames) * frame size)\n"
             "\n"
             "Capture video to a file. Raw video can be viewed with mplayer eg:\n"
             "\n"
@@ -210,6 +228,7 @@ int main(int argc, char *argv[])
     int	displayModeCount = 0;
     int	exitStatus = 1;
     int ch;
+    int cardIndex = 0;
     bool foundDisplayMode = false;
     HRESULT result;
 
@@ -222,12 +241,25 @@ int main(int argc, char *argv[])
         goto bail;
     }
 	
-    /* Connect to the first DeckLink instance */
-    result = deckLinkIterator->Next(&deckLink);
-    if (result != S_OK)
+    /* Connect to the requested DeckLink instance (the first by default).
+       We need to find the card before parsing the rest of the options,
+       since usage() lists its display modes */
+    for (int i = 1; i < argc - 1; i++)
     {
-        fprintf(stderr, "No DeckLink PCI cards found.\n");
-        goto bail;
+        if (strcmp(argv[i], "-i") == 0)
+            cardIndex = atoi(argv[i + 1]);
+    }
+    for (int i = 0; i <= cardIndex; i++)
+    {
+        if (deckLink != NULL)
+            deckLink->Release();
+        deckLink = NULL;
+        result = deckLinkIterator->Next(&deckLink);
+        if (result != S_OK)
+        {
+            fprintf(stderr, "DeckLink PCI card %d not found.\n", cardIndex);
+            goto bail;
+        }
     }
     
     if (deckLink->QueryInterface(IID_IDeckLinkInput, (void**)&deckLinkInput) != S_OK)
@@ -245,7 +277,7 @@ int main(int argc, char *argv[])
     }
 	
     // Parse command line options
-    while ((ch = getopt(argc, argv, "do?h3f:m:n:p:")) != -1) 
+    while ((ch = getopt(argc, argv, "do?h3f:i:m:n:p:r:")) != -1) 
     {
         switch (ch) 
         {
@@ -264,6 +296,12 @@ int main(int argc, char *argv[])
         case 'n':
             g_maxFrames = atoi(optarg);
             break;
+        case 'r':
+            g_ringFrames = atoi(optarg);
+            break;
+        case 'i':
+            // already handled above
+            break;
         case 'p':
             switch (atoi(optarg))
             {
@@ -1,5 +1,6 @@
 #!/bin/bash
 
+# INPUT_FILE may be '-' to read the raw video from stdin
 INPUT_FILE=$1
 OUTPUT_DIR=$2
 HDMI_MODE=$3
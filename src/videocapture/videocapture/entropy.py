@@ -1,20 +1,21 @@
-from itertools import repeat
 from scipy import ndimage
-import cPickle as pickle
+import framepool
 import math
-import multiprocessing
 import numpy
 
-DEFAULT_POOL_SIZE=8
-
-def _get_frame_entropy((i, capture, sobelized)):
-    frame = capture.get_frame(i, True).astype('float')
+def _get_frame_entropy(capture, i, sobelized):
+    # the histogram of the 8-bit frame is the same as that of a float copy
+    # of it, at an eighth of the size
+    frame = framepool.get_worker_frame(i, True, numpy.uint8)
     if sobelized:
         frame = ndimage.median_filter(frame, 3)
 
-        dx = ndimage.sobel(frame, 0)  # horizontal derivative
-        dy = ndimage.sobel(frame, 1)  # vertical derivative
-        frame = numpy.hypot(dx, dy)  # magnitude
+        # derivatives need a signed type; 32-bit floats are plenty
+        dx = framepool.get_worker_buffer('dx', frame.shape, numpy.float32)
+        dy = framepool.get_worker_buffer('dy', frame.shape, numpy.float32)
+        ndimage.sobel(frame, 0, output=dx)  # horizontal derivative
+        ndimage.sobel(frame, 1, output=dy)  # vertical derivative
+        frame = numpy.hypot(dx, dy, out=dx)  # magnitude
         frame *= 255.0 / numpy.max(frame)  # normalize (Q&D)
 
     histogram = numpy.histogram(frame, bins=256)[0]
@@ -24,11 +25,8 @@ def _get_frame_entropy((i, capture, sobelized)):
 
     return entropy
 
-def get_frame_entropies(capture, sobelized=False):
-    try:
-        cache = pickle.load(open(capture.cache_filename, 'r'))
-    except:
-        cache = {}
+def get_frame_entropies(capture, sobelized=False, progress=None):
+    cache = capture.get_cache()
 
     cachekey = 'frame_entropies'
     if sobelized:
@@ -37,14 +35,18 @@ def get_frame_entropies(capture, sobelized=False):
     if cache.get(cachekey):
         return cache[cachekey]
 
-    pool = multiprocessing.Pool(processes=DEFAULT_POOL_SIZE)
-    results = pool.map(_get_frame_entropy, zip(range(capture.num_frames+1),
-                                               repeat(capture),
-                                               repeat(sobelized)))
-    cache[cachekey] = results
-    pickle.dump(cache, open(capture.cache_filename, 'w'))
+    # a worker holds an 8-bit frame, and when sobelizing a filtered copy of
+    # it plus two 32-bit derivative buffers
+    frame_bytes = framepool.get_frame_bytes(capture)
+    if sobelized:
+        frame_bytes *= 10
+    results = framepool.map_frames(_get_frame_entropy, capture,
+                                   range(capture.num_frames+1),
+                                   frame_bytes * 2, sobelized,
+                                   progress=progress)
+    capture.update_cache({cachekey: results})
 
-    return cache[cachekey]
+    return results
 
 def get_overall_entropy(capture, sobelized=False):
     return sum(get_frame_entropies(capture, sobelized=sobelized))
@@ -0,0 +1,42 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from PIL import Image
+
+DEFAULT_FILMSTRIP_COLUMNS = 10
+
+
+def get_filmstrip_dimensions(capture, width):
+    '''Returns the size of a frame of the capture scaled to width pixels
+       wide'''
+    (capture_width, capture_height) = capture.dimensions
+    return (width, max(1, int(round(width * capture_height /
+                                    float(capture_width)))))
+
+
+def get_filmstrip_image(capture, framenums, width,
+                        columns=DEFAULT_FILMSTRIP_COLUMNS, pool=None):
+    '''Returns a single image of the given frames of a capture, each scaled
+       to width pixels wide, in rows of (at most) the given number of
+       columns. If given a (thread) pool, the frames are decoded and scaled
+       in parallel.'''
+    (width, height) = get_filmstrip_dimensions(capture, width)
+
+    def get_thumbnail(framenum):
+        im = capture.get_frame_image(framenum).convert('RGB')
+        return im.resize((width, height), Image.ANTIALIAS)
+
+    if pool:
+        thumbnails = pool.map(get_thumbnail, framenums)
+    else:
+        thumbnails = map(get_thumbnail, framenums)
+
+    columns = max(1, min(columns, len(thumbnails)))
+    rows = (len(thumbnails) + columns - 1) / columns
+    filmstrip = Image.new('RGB', (width * columns, height * rows))
+    for (i, thumbnail) in enumerate(thumbnails):
+        filmstrip.paste(thumbnail, ((i % columns) * width,
+                                    (i / columns) * height))
+
+    return filmstrip
@@ -2,11 +2,10 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from PIL import Image
-from itertools import repeat
-import cPickle as pickle
+from PIL import Image, ImageDraw
+from capture import CaptureException
+import framepool
 import math
-import multiprocessing
 import numpy
 
 # Note: we consider frame differences to be the number of pixels with an rgb
@@ -14,6 +13,8 @@ import numpy
 # this probably doesn't catch all cases, but works well in the common case
 # of eliminating frame differences due to "noise" in the capture
 PIXEL_DIFF_THRESHOLD = 5.0
+# number of frames each worker accumulates a motion heatmap over at a time
+MOTION_HEATMAP_CHUNK_SIZE = 50
 
 
 def get_framediff_imgarray(capture, framenum1, framenum2,
@@ -27,28 +28,15 @@ def get_framediff_imgarray(capture, framenum1, framenum2,
     else:
         ignored_areas = []
 
-    frame1 = capture.get_frame(framenum1, cropped)
-    frame2 = capture.get_frame(framenum2, cropped)
-    framediff = numpy.abs(frame1.astype('float') - frame2.astype('float'))
-    for (y, row) in enumerate(framediff):
-        for (x, px) in enumerate(row):
-            skip = False
-            for ignored_area in ignored_areas:
-                if y >= ignored_area[1] and y < ignored_area[3] and \
-                        x >= ignored_area[0] and x < ignored_area[2]:
-                    print ignored_area
-                    print "Skipped: %s %s" % (x, y)
-                    skip = True
-                    break
-
-            if not skip and (px[0] >= filter_threshold or
-                             px[1] >= filter_threshold or
-                             px[2] >= filter_threshold):
-                px[0] = 255.0
-                px[1] = 0.0
-                px[2] = 0.0
-            else:
-                px[0] = px[1] = px[2] = 0.0
+    frame1 = capture.get_frame(framenum1, cropped, type=numpy.int16)
+    frame2 = capture.get_frame(framenum2, cropped, type=numpy.int16)
+    framediff = numpy.abs(frame1 - frame2)
+    changed = (framediff >= filter_threshold).any(axis=2)
+    for ignored_area in ignored_areas:
+        changed[ignored_area[1]:ignored_area[3],
+                ignored_area[0]:ignored_area[2]] = False
+    framediff[:] = 0
+    framediff[changed, 0] = 255
 
     return framediff
 
@@ -59,26 +47,27 @@ def get_framediff_image(capture, framenum1, framenum2, cropped=False):
     return Image.fromarray(framediff.astype(numpy.uint8))
 
 
-def _get_framediff_sum((i, capture, ignored_areas, filter_threshold)):
-    frame1 = capture.get_frame(i-1, True).astype('float')
-    frame2 = capture.get_frame(i, True).astype('float')
+def _get_framediff_sum(capture, i, ignored_areas, filter_threshold):
+    # frames are 8-bit, so their difference fits in 16 bits; reuse the same
+    # buffer for every pair of frames this worker compares
+    frame1 = framepool.get_worker_frame(i-1, True, numpy.int16)
+    frame2 = framepool.get_worker_frame(i, True, numpy.int16)
 
-    framediff = abs(frame2 - frame1)
+    framediff = framepool.get_worker_buffer('framediff', frame1.shape,
+                                            numpy.int16)
+    numpy.subtract(frame2, frame1, out=framediff)
+    numpy.abs(framediff, out=framediff)
     for ignored_area in ignored_areas:
-        for x in range(ignored_area[0], ignored_area[2]):
-            for y in range(ignored_area[1], ignored_area[3]):
-                framediff[x][y] = 0.0
-    return len(framediff[framediff >= filter_threshold])
+        framediff[ignored_area[0]:ignored_area[2],
+                  ignored_area[1]:ignored_area[3]] = 0
+    return int(numpy.count_nonzero(framediff >= filter_threshold))
 
-def get_framediff_sums(capture, filter_low_differences=True):
+def get_framediff_sums(capture, filter_low_differences=True, progress=None):
     filter_threshold = 0
     if filter_low_differences:
         filter_threshold = PIXEL_DIFF_THRESHOLD
 
-    try:
-        cache = pickle.load(open(capture.cache_filename, 'r'))
-    except:
-        cache = {}
+    cache = capture.get_cache()
 
     if capture.metadata.get('ignoreAreas'):
         ignored_areas = capture.metadata['ignoreAreas']
@@ -89,17 +78,122 @@ def get_framediff_sums(capture, filter_low_differences=True):
         diffsums = cache['diffsums']
     except:
         # Frame differences
-        diffsums = None
-        pool = multiprocessing.Pool()
-        diffsums = [0] + pool.map(_get_framediff_sum,
-                                  zip(range(1, capture.num_frames + 1),
-                                      repeat(capture), repeat(ignored_areas),
-                                      repeat(filter_threshold)))
-        cache['diffsums'] = diffsums
-        pickle.dump(cache, open(capture.cache_filename, 'w'))
+        # each worker holds two frames (plus the one it's about to decode)
+        # and a difference buffer, all 16 bit
+        frame_bytes = framepool.get_frame_bytes(capture, dtype=numpy.int16)
+        diffsums = [0] + framepool.map_frames(_get_framediff_sum, capture,
+                                              range(1, capture.num_frames + 1),
+                                              frame_bytes * 4, ignored_areas,
+                                              filter_threshold,
+                                              progress=progress)
+        capture.update_cache({'diffsums': diffsums})
 
     return diffsums
 
+def _get_changed_blocks(changed, block_size):
+    # whether any pixel in each block_size x block_size block changed
+    if block_size == 1:
+        return changed
+    (height, width) = changed.shape
+    rows = (height + block_size - 1) / block_size
+    cols = (width + block_size - 1) / block_size
+    padded = framepool.get_worker_buffer('heatmap_blocks',
+                                         (rows * block_size,
+                                          cols * block_size), numpy.bool_)
+    padded[:] = False
+    padded[:height, :width] = changed
+    return padded.reshape(rows, block_size, cols,
+                          block_size).any(axis=3).any(axis=1)
+
+
+def _get_motion_counts(capture, chunk_start, end, block_size,
+                       filter_threshold):
+    # accumulates the changes between frames i-1 and i for a chunk of
+    # frames, so that workers only ever send back one array per chunk
+    counts = None
+    for i in range(chunk_start, min(chunk_start + MOTION_HEATMAP_CHUNK_SIZE,
+                                    end + 1)):
+        frame1 = framepool.get_worker_frame(i-1, True, numpy.int16)
+        frame2 = framepool.get_worker_frame(i, True, numpy.int16)
+        framediff = framepool.get_worker_buffer('framediff', frame1.shape,
+                                                numpy.int16)
+        numpy.subtract(frame2, frame1, out=framediff)
+        numpy.abs(framediff, out=framediff)
+        changed = _get_changed_blocks(framediff >= filter_threshold,
+                                      block_size)
+        if counts is None:
+            counts = numpy.zeros(changed.shape, dtype=numpy.uint32)
+        counts += changed
+    return counts
+
+
+def get_motion_heatmap_cache_key(start=1, end=None, block_size=1):
+    # only the default heatmap (of the whole capture, per pixel) is kept in
+    # the capture's cache: there could be any number of others, each the
+    # size of a frame
+    if (start, end, block_size) != (1, None, 1):
+        return None
+    return 'motion_heatmap'
+
+
+def get_motion_heatmap(capture, start=1, end=None, block_size=1,
+                       progress=None):
+    '''Returns an array with, for each block_size x block_size block of
+       pixels, the number of frames i (between start and end, inclusive,
+       by default the whole capture) where some pixel in the block changed
+       by at least PIXEL_DIFF_THRESHOLD from frame i-1. Ignored areas are
+       counted too, so this shows whether ignoring an area would help.'''
+    cache_key = get_motion_heatmap_cache_key(start, end, block_size)
+    if cache_key:
+        cache = capture.get_cache()
+        if cache_key in cache:
+            return cache[cache_key]
+
+    if end is None or end > capture.num_frames:
+        end = capture.num_frames
+    start = max(1, start)
+    # each worker holds two frames (plus the one it's about to decode), a
+    # difference buffer (all 16 bit) and its counts so far (32 bit)
+    frame_bytes = framepool.get_frame_bytes(capture, dtype=numpy.int16)
+    counts = None
+    for chunk_counts in framepool.map_frames(
+            _get_motion_counts, capture,
+            range(start, end + 1, MOTION_HEATMAP_CHUNK_SIZE), frame_bytes * 6,
+            end, block_size, PIXEL_DIFF_THRESHOLD, progress=progress):
+        if counts is None:
+            counts = chunk_counts
+        else:
+            counts += chunk_counts
+    if counts is None:
+        raise CaptureException("No frames between %s and %s" % (start, end))
+
+    if cache_key:
+        capture.update_cache({cache_key: counts})
+
+    return counts
+
+
+def get_motion_heatmap_image(capture, counts):
+    '''Returns an image of a motion heatmap (see get_motion_heatmap) the
+       size of the capture's frames, going from black (no changes) through
+       red and yellow to white (the most changes), with the capture's
+       ignored areas outlined in blue'''
+    level = counts.astype(numpy.float32) / max(1, counts.max())
+    rgb = numpy.empty(counts.shape + (3,), dtype=numpy.uint8)
+    for (channel, offset) in enumerate([0.0, 1.0, 2.0]):
+        rgb[:, :, channel] = numpy.clip(level * 3 - offset, 0, 1) * 255
+    im = Image.fromarray(rgb).resize(tuple(capture.dimensions),
+                                     Image.NEAREST)
+
+    draw = ImageDraw.Draw(im)
+    for ignored_area in capture.metadata.get('ignoreAreas') or []:
+        draw.rectangle([ignored_area[0], ignored_area[1],
+                        ignored_area[2] - 1, ignored_area[3] - 1],
+                       outline=(0, 0, 255))
+
+    return im
+
+
 def image_entropy(img):
     """calculate the entropy of an image"""
     # based on: http://brainacle.com/calculating-image-entropy-with-python-how-and-why.html
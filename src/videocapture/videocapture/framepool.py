@@ -0,0 +1,130 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Runs per-frame analysis over a pool of worker processes, sized so that
+# the whole thing stays within a memory budget (by default, half of the
+# machine's physical memory; override with VIDEOCAPTURE_MEMORY_BUDGET, in
+# megabytes, or set_memory_budget())
+
+import math
+import multiprocessing
+import numpy
+import os
+
+# rough cost of a worker process before it has done anything
+WORKER_OVERHEAD = 48 * 1024 * 1024
+# number of batches of frames to give each worker, so that they all finish
+# at about the same time
+BATCHES_PER_WORKER = 4
+
+_memory_budget = None
+
+
+def _get_physical_memory():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def get_memory_budget():
+    '''Returns the memory budget for analysis, in bytes'''
+    if _memory_budget:
+        return _memory_budget
+    if os.environ.get('VIDEOCAPTURE_MEMORY_BUDGET'):
+        return int(os.environ['VIDEOCAPTURE_MEMORY_BUDGET']) * 1024 * 1024
+    return _get_physical_memory() / 2
+
+
+def set_memory_budget(megabytes):
+    global _memory_budget
+    _memory_budget = int(megabytes * 1024 * 1024)
+
+
+def get_num_workers(bytes_per_worker, max_workers=None):
+    '''Returns how many workers which each use (up to) bytes_per_worker we
+       can run at once within the memory budget (always at least one)'''
+    num_workers = int(get_memory_budget() /
+                      (bytes_per_worker + WORKER_OVERHEAD))
+    return max(1, min(num_workers, max_workers or
+                      multiprocessing.cpu_count()))
+
+
+def get_frame_bytes(capture, channels=1, dtype=numpy.uint8):
+    '''Returns the size of one frame of a capture as an array'''
+    (width, height) = capture.dimensions
+    return width * height * channels * numpy.dtype(dtype).itemsize
+
+
+# state for the capture being analyzed by this worker
+_worker_capture = None
+_worker_frames = {}
+_worker_buffers = {}
+
+
+def _init_worker(capture_filename):
+    global _worker_capture
+    # imported here to avoid a circular import
+    from capture import Capture
+    _worker_capture = Capture(capture_filename)
+    _worker_frames.clear()
+    _worker_buffers.clear()
+
+
+def get_worker_frame(framenum, grayscale=False, dtype=numpy.uint8):
+    '''Gets a frame of the capture being analyzed by this worker. Since
+       workers are given consecutive frames, the most recently decoded
+       frames are kept around (e.g. when diffing frames N-1 and N, and then
+       N and N+1)'''
+    key = (framenum, grayscale, numpy.dtype(dtype))
+    if key not in _worker_frames:
+        for old_key in sorted(_worker_frames.keys())[:-1]:
+            del _worker_frames[old_key]
+        _worker_frames[key] = _worker_capture.get_frame(framenum, grayscale,
+                                                        type=dtype)
+    return _worker_frames[key]
+
+
+def get_worker_buffer(name, shape, dtype):
+    '''Gets a scratch array, reused between the frames analyzed by this
+       worker'''
+    buf = _worker_buffers.get(name)
+    if buf is None or buf.shape != shape or buf.dtype != numpy.dtype(dtype):
+        buf = _worker_buffers[name] = numpy.empty(shape, dtype=dtype)
+    return buf
+
+
+def _run_batch((func, framenums, args)):
+    return map(lambda framenum: func(_worker_capture, framenum, *args),
+               framenums)
+
+
+def map_frames(func, capture, framenums, bytes_per_worker, *args, **kwargs):
+    '''Returns [func(capture, framenum, *args) for framenum in framenums],
+       calculated in parallel by as many workers as fit in the memory
+       budget (func should use no more than bytes_per_worker). func must be
+       a module-level function, and gets the worker's own copy of the
+       capture. If a progress keyword argument is given, it is called with
+       the number of frames done so far and the total as batches finish.'''
+    progress = kwargs.get('progress')
+    framenums = list(framenums)
+    num_workers = get_num_workers(bytes_per_worker)
+    batch_size = int(math.ceil(len(framenums) /
+                               float(num_workers * BATCHES_PER_WORKER))) or 1
+    batches = [framenums[i:i + batch_size] for i in
+               range(0, len(framenums), batch_size)]
+
+    pool = multiprocessing.Pool(processes=num_workers,
+                                initializer=_init_worker,
+                                initargs=(capture.filename,))
+    results = []
+    try:
+        for batch_results in pool.imap(_run_batch,
+                                       map(lambda batch: (func, batch, args),
+                                           batches)):
+            results.extend(batch_results)
+            if progress:
+                progress(len(results), len(framenums))
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
@@ -0,0 +1,68 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import imp
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    '''Stands in for a package (in sys.modules), importing the submodule
+       each of its public names comes from the first time that name is
+       used. Useful when some submodules import expensive things (scipy,
+       marionette, ...) which most users of the package never need.
+
+       exports is a dict of submodule name -> list of names to export from
+       it.'''
+
+    def __init__(self, module, exports):
+        types.ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # keep the original module alive: python 2 clears the globals of
+        # modules when they are garbage collected
+        self._module = module
+        self._exports = {}
+        self._shadowed = set()
+        for (submodule, names) in exports.items():
+            for name in names:
+                self._exports[name] = submodule
+                if name == submodule:
+                    self._shadowed.add(name)
+        self.__all__ = sorted(self._exports.keys())
+
+    def _import(self, submodule):
+        return importlib.import_module('%s.%s' % (self.__name__, submodule))
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name in self._exports:
+            value = getattr(self._import(self._exports[name]), name)
+        else:
+            # a submodule which hasn't been imported yet (e.g.
+            # "package.submodule.something"). Only a missing submodule means
+            # there's no such attribute: an ImportError from importing one
+            # (e.g. a missing dependency) is passed on as is
+            try:
+                imp.find_module(name, self.__path__)
+            except ImportError:
+                raise AttributeError("'%s' module has no attribute '%s'" %
+                                     (self.__name__, name))
+            value = self._import(name)
+        self.__dict__[name] = value
+        return value
+
+    def __getattribute__(self, name):
+        value = types.ModuleType.__getattribute__(self, name)
+        # importing a submodule binds it in its package's namespace; if it
+        # exports something with the same name as itself (e.g.
+        # products.products), that's what the name should refer to
+        if isinstance(value, types.ModuleType) and name in \
+                types.ModuleType.__getattribute__(self, '_shadowed'):
+            value = getattr(value, name)
+            self.__dict__[name] = value
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys()) | set(self._exports.keys()))
@@ -30,6 +30,16 @@ class OptionParser(optparse.OptionParser):
                         default=None, dest="camera_settings_file",
                         help="Custom camera settings json to use with "
                         "pointgrey cameras")
+        self.add_option("--capture-card", action="store", type="int",
+                        dest="capture_card",
+                        default=os.environ.get('CAPTURE_CARD'),
+                        help="Index of decklink card to capture from, if "
+                        "there is more than one (default: first card)")
+        self.add_option("--ring-buffer-frames", action="store", type="int",
+                        dest="ring_buffer_frames", default=None,
+                        help="Capture into a ring buffer of this many frames "
+                        "instead of a fixed number of frames, keeping disk "
+                        "usage bounded for long tests (decklink only)")
 
         if self.capture_area_option:
             self.add_option("--capture-area", action="store",
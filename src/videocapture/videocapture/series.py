@@ -0,0 +1,36 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# A compact encoding for per-frame series (frame differences, entropies,
+# ...) in json: the values as a little-endian typed array, base64 encoded.
+# Javascript can decode this straight into a typed array (see decodeSeries
+# in the dashboard's common.js), which is much smaller and quicker to parse
+# than a json array of numbers.
+
+import array
+import base64
+import sys
+
+# series type -> array module typecode
+SERIES_TYPES = { 'uint32': 'I', 'float32': 'f' }
+
+
+def encode_series(values, type):
+    a = array.array(SERIES_TYPES[type], values)
+    assert a.itemsize == 4
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return { 'encoding': 'base64', 'type': type, 'length': len(a),
+             'data': base64.b64encode(a.tostring()) }
+
+
+def decode_series(series):
+    '''Returns a series as a list, whether or not it's been encoded'''
+    if isinstance(series, list):
+        return series
+    a = array.array(SERIES_TYPES[series['type']])
+    a.fromstring(base64.b64decode(series['data']))
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a.tolist()
@@ -0,0 +1,187 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Generates synthetic captures, for exercising (and benchmarking) the
+# conversion and analysis code without any capture hardware
+
+from PIL import Image
+import StringIO
+import datetime
+import json
+import numpy
+from zipfile import ZipFile
+
+from controller import supported_formats
+
+SEGMENT_TYPES = ['static', 'scroll', 'checkerboard']
+# a short page load, followed by some scrolling (part of it checkerboarded)
+DEFAULT_SEGMENTS = [('static', 30), ('scroll', 120), ('checkerboard', 60),
+                    ('static', 60)]
+DEFAULT_SCROLL_SPEED = 8  # pixels per frame
+DEFAULT_SIGNAL_FRAMES = 10
+
+START_SIGNAL_COLOR = (0, 255, 0)
+END_SIGNAL_COLOR = (255, 0, 0)
+CHECKERBOARD_COLOR = (255, 0, 255)
+TOOLBAR_COLOR = (200, 200, 200)
+
+
+def parse_segments(segments_str):
+    '''Parses a list of segments in the form "scroll:120,static:30"'''
+    if not segments_str.strip():
+        raise Exception("No segments given")
+    segments = []
+    for segment_str in segments_str.split(','):
+        (segment_type, num_frames) = segment_str.split(':')
+        if segment_type not in SEGMENT_TYPES:
+            raise Exception("Unknown segment type '%s'" % segment_type)
+        segments.append((segment_type, int(num_frames)))
+
+    return segments
+
+
+def _check_segments(segments):
+    if not sum(num_frames for (segment_type, num_frames) in segments):
+        raise Exception("Segments %s have no frames in them" % (segments,))
+
+
+def _get_page(width, length, seed):
+    # a white page with some lines of "text" on it
+    random = numpy.random.RandomState(seed)
+    page = numpy.empty((length, width, 3), dtype=numpy.uint8)
+    page[:] = 255
+    for y in range(8, length - 20, 24):
+        x = 16
+        while x < width - 16:
+            wordlen = random.randint(16, 96)
+            page[y:y + 12, x:min(x + wordlen, width - 16)] = \
+                random.randint(0, 96)
+            x += wordlen + 12
+
+    return page
+
+
+def get_synthetic_frames(dimensions, segments=DEFAULT_SEGMENTS,
+                         scroll_speed=DEFAULT_SCROLL_SPEED, signal_frames=0,
+                         toolbar_height=0, seed=0):
+    '''Generates the frames (as uint8 RGB arrays) of a synthetic capture
+       of the given dimensions, made up of a sequence of (type, num_frames)
+       segments:
+
+       * static: the page stays still
+       * scroll: the page scrolls down by scroll_speed pixels per frame
+       * checkerboard: as scroll, but with the bottom third of the page
+         checkerboarded
+
+       If signal_frames is non-zero, the content area is filled with the
+       green start signal for that many frames before the content, and the
+       red end signal for that many frames after it. If toolbar_height is
+       non-zero, a toolbar of that height is shown above the content area
+       (which is then cropped away when converting the capture).'''
+    (width, height) = dimensions
+    content_height = height - toolbar_height
+    scroll_length = sum(map(lambda (t, n): n * scroll_speed,
+                            filter(lambda (t, n): t != 'static', segments)))
+    page = _get_page(width, content_height + scroll_length, seed)
+
+    frame = numpy.empty((height, width, 3), dtype=numpy.uint8)
+    frame[:toolbar_height] = TOOLBAR_COLOR
+
+    for i in range(signal_frames):
+        frame[toolbar_height:] = START_SIGNAL_COLOR
+        yield frame
+
+    offset = 0
+    for (segment_type, num_frames) in segments:
+        for i in range(num_frames):
+            if segment_type != 'static':
+                offset += scroll_speed
+            frame[toolbar_height:] = page[offset:offset + content_height]
+            if segment_type == 'checkerboard':
+                frame[height - content_height / 3:] = CHECKERBOARD_COLOR
+            yield frame
+
+    for i in range(signal_frames):
+        frame[toolbar_height:] = END_SIGNAL_COLOR
+        yield frame
+
+
+def _get_png(frame):
+    buf = StringIO.StringIO()
+    Image.fromarray(frame).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def write_synthetic_capture(filename, dimensions=(1280, 720),
+                            segments=DEFAULT_SEGMENTS, fps=60,
+                            capture_device='decklink',
+                            scroll_speed=DEFAULT_SCROLL_SPEED, seed=0):
+    '''Writes a synthetic capture in the same format as a converted one
+       (minus the webm movie)'''
+    _check_segments(segments)
+    frames = get_synthetic_frames(dimensions, segments,
+                                  scroll_speed=scroll_speed, seed=seed)
+    zipfile = ZipFile(filename, 'w')
+    zipfile.writestr('metadata.json',
+                     json.dumps({ 'captureDevice': capture_device,
+                                  'date': datetime.datetime.now().isoformat(),
+                                  'frameDimensions': dimensions,
+                                  'fps': fps,
+                                  'generatedVideoFPS': fps,
+                                  'synthetic': True,
+                                  'version': 1 }))
+    # as with a real capture, frame 0 is the one before the start of the
+    # capture and there is an extra frame after the end of it
+    framenum = 0
+    for frame in frames:
+        png = _get_png(frame)
+        if framenum == 0:
+            zipfile.writestr('images/0.png', png)
+            framenum += 1
+        zipfile.writestr('images/%s.png' % framenum, png)
+        framenum += 1
+    zipfile.writestr('images/%s.png' % framenum, png)
+    zipfile.close()
+
+
+def _get_uyvy(frame):
+    # 8 bit YUV 4:2:2 (BT.601, as captured by the decklink cards): each pair
+    # of pixels is stored as U Y0 V Y1
+    rgb = frame.astype(numpy.float32)
+    (r, g, b) = (rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2])
+    y = 16 + 0.257 * r + 0.504 * g + 0.098 * b
+    u = 128 - 0.148 * r - 0.291 * g + 0.439 * b
+    v = 128 + 0.439 * r - 0.368 * g - 0.071 * b
+
+    uyvy = numpy.empty((frame.shape[0], frame.shape[1] * 2),
+                       dtype=numpy.float32)
+    uyvy[:, 0::4] = (u[:, 0::2] + u[:, 1::2]) / 2
+    uyvy[:, 1::4] = y[:, 0::2]
+    uyvy[:, 2::4] = (v[:, 0::2] + v[:, 1::2]) / 2
+    uyvy[:, 3::4] = y[:, 1::2]
+
+    return numpy.clip(numpy.round(uyvy), 0, 255).astype(numpy.uint8).tostring()
+
+
+def write_synthetic_raw_capture(filename, mode='720p',
+                                segments=DEFAULT_SEGMENTS,
+                                scroll_speed=DEFAULT_SCROLL_SPEED,
+                                signal_frames=DEFAULT_SIGNAL_FRAMES,
+                                toolbar_height=48, seed=0):
+    '''Writes a synthetic raw capture, as written by decklink-capture in the
+       given mode (to be converted with CaptureController.convert_capture).
+       Returns the number of frames written.'''
+    _check_segments(segments)
+    dimensions = supported_formats[mode]['dimensions']
+    num_frames = 0
+    with open(filename, 'wb') as f:
+        for frame in get_synthetic_frames(dimensions, segments,
+                                          scroll_speed=scroll_speed,
+                                          signal_frames=signal_frames,
+                                          toolbar_height=toolbar_height,
+                                          seed=seed):
+            f.write(_get_uyvy(frame))
+            num_frames += 1
+
+    return num_frames
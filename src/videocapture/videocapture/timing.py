@@ -0,0 +1,79 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import contextlib
+import threading
+import time
+
+
+class TimingLog(object):
+    '''Records how long each stage of something (e.g. a test run, from
+       preparing the device to publishing the results) took, as a list of
+       spans: dicts with a name, a start time (as returned by time.time())
+       and a duration in seconds. Spans may nest or overlap.'''
+
+    def __init__(self, spans=None):
+        # spans may be shared with (say) a metadata dict, in which case we
+        # add to it in place
+        if spans is None:
+            spans = []
+        self.spans = spans
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, duration):
+        with self._lock:
+            self.spans.append({ 'name': name, 'start': start,
+                                'duration': duration })
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.time() - start)
+
+    def get_durations(self):
+        '''Returns the total time spent in each stage'''
+        durations = {}
+        for span in self.spans:
+            durations[span['name']] = durations.get(span['name'], 0) + \
+                span['duration']
+        return durations
+
+
+@contextlib.contextmanager
+def timing_span(timings, name):
+    '''Like timings.span(name), but does nothing if timings is None'''
+    if timings is None:
+        yield
+    else:
+        with timings.span(name):
+            yield
+
+
+def get_timing_summary(span_lists):
+    '''Summarizes the spans recorded for a set of runs, returning a list of
+       (name, number of runs, mean, max) tuples in the order the stages
+       first occurred'''
+    names = []
+    durations = {}
+    for spans in span_lists:
+        for (name, duration) in TimingLog(spans).get_durations().items():
+            durations.setdefault(name, []).append(duration)
+        for span in sorted(spans, key=lambda s: s['start']):
+            if span['name'] not in names:
+                names.append(span['name'])
+
+    return map(lambda name: (name, len(durations[name]),
+                             sum(durations[name]) / len(durations[name]),
+                             max(durations[name])), names)
+
+
+def format_timing_summary(span_lists):
+    lines = [ "%-32s %5s %9s %9s" % ('stage', 'runs', 'mean (s)', 'max (s)') ]
+    for (name, num_runs, mean, maximum) in get_timing_summary(span_lists):
+        lines.append("%-32s %5s %9.2f %9.2f" % (name, num_runs, mean,
+                                                 maximum))
+    return "\n".join(lines)